@@ -0,0 +1,16 @@
+OUTPUT=$1
+SAMPLES=$2
+SCENE=${3:-hw3}
+SHARDS=${4:-4}
+
+# every array task renders one shard, the merge job runs once all succeeded
+JOB_ID=$(sbatch --parsable -p video --job-name=rt --array=0-$((SHARDS - 1)) \
+    --ntasks=1 --cpus-per-task=32 \
+    --wrap="python src/main.py --scene ${SCENE} --output ${OUTPUT} \
+        --samples ${SAMPLES} --num-shards ${SHARDS} \
+        --shard-index \${SLURM_ARRAY_TASK_ID}")
+
+sbatch -p video --job-name=rt-merge --dependency=afterok:${JOB_ID} \
+    --ntasks=1 --cpus-per-task=1 \
+    --wrap="python src/merge.py --output ${OUTPUT} \
+        ${OUTPUT}.shard-*-of-${SHARDS}.npz"
@@ -1,5 +1,6 @@
 OUTPUT=$1
 SAMPLES=$2
+SCENE=${3:-hw3}
 
 srun -p video --job-name=rt --ntasks=1 --cpus-per-task=32 --async \
-    python src/main.py --output ${OUTPUT} --samples ${SAMPLES}
+    python src/main.py --scene ${SCENE} --output ${OUTPUT} --samples ${SAMPLES}
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import os.path as osp
+
+import numpy as np
+
+from render import (INTEGRATORS, split_tiles, default_jobs, create_pool,
+                    render_pass)
+from scene import SCENES, ACCELERATORS, load_scene
+from image_io import to_display
+
+
+def cpu_time():
+    """CPU seconds used by this process and its reaped children."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (usage.ru_utime + usage.ru_stime + children.ru_utime +
+            children.ru_stime)
+
+
+def bench_scene(name, args, jobs_list, accel=None):
+    """Render one scene once per worker count and collect its timings."""
+    start = time.perf_counter()
+    scene = load_scene(name, args.width, accel=accel)
+    build_time = time.perf_counter() - start
+
+    render_scene = (scene.rows, scene.columns, scene.camera, scene.world,
+                    scene.lights)
+    tiles = split_tiles(scene.rows, scene.columns, args.tile_size)
+    primary_rays = scene.rows * scene.columns * args.samples
+
+    results = []
+    for n_jobs in jobs_list:
+        start_cpu = cpu_time()
+        start = time.perf_counter()
+        pool = create_pool(n_jobs, render_scene, args.scene_dist)
+        try:
+            radiance, counts, task_counts = render_pass(
+                pool, tiles, 0, args.samples, args.seed, scene.rows,
+                scene.columns, args.integrator)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        to_display(radiance / counts[..., None])
+        wall_time = time.perf_counter() - start
+        # camera and scattered rays; the light re-intersections of HitPDF
+        # are not counted here, --stats reports them as rays/light_pdf
+        total_rays = task_counts['rays', 'traced']
+
+        results.append({
+            'scene': name,
+            'accel': scene.accel,
+            'integrator': args.integrator,
+            'jobs': n_jobs,
+            'width': scene.rows,
+            'height': scene.columns,
+            'samples': args.samples,
+            'seed': args.seed,
+            'build_time': build_time,
+            'wall_time': wall_time,
+            'time_to_image': build_time + wall_time,
+            'cpu_time': cpu_time() - start_cpu,
+            'primary_rays': primary_rays,
+            'total_rays': total_rays,
+            'primary_rays_per_sec': primary_rays / wall_time,
+            'rays_per_sec': total_rays / wall_time,
+        })
+
+    # speedup over the smallest worker count, divided by the added workers
+    ref = min(results, key=lambda res: res['jobs'])
+    for res in results:
+        res['parallel_efficiency'] = (ref['wall_time'] * ref['jobs']) / (
+            res['wall_time'] * res['jobs'])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the results whose ray throughput fell below the baseline.
+
+    Returns:
+        list[str]: one message per regression
+    """
+    # reports without accelerator or integrator were rendered with the bvh
+    # and the path integrator
+    old = {(res['scene'], res.get('accel', 'bvh'),
+            res.get('integrator', 'path'), res['jobs']): res
+           for res in baseline['results']}
+    regressions = []
+    for res in results:
+        ref = old.get(
+            (res['scene'], res['accel'], res['integrator'], res['jobs']))
+        if ref is None:
+            continue
+        ratio = res['rays_per_sec'] / ref['rays_per_sec']
+        if ratio < 1. - tolerance:
+            regressions.append(
+                f'{res["scene"]} ({res["accel"]}) with {res["jobs"]} jobs: '
+                f'{res["rays_per_sec"]:.0f} rays/s is {1. - ratio:.1%} '
+                f'below the baseline {ref["rays_per_sec"]:.0f} rays/s')
+        if res['total_rays'] != ref['total_rays']:
+            print(f'Note: {res["scene"]} traced {res["total_rays"]} rays, '
+                  f'the baseline {ref["total_rays"]}, the image changed')
+    return regressions
+
+
+def parse_args():
+    """Parse args to get the scenes, worker counts and report files."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark the renderer on the registered scenes')
+    parser.add_argument('--scenes',
+                        type=str,
+                        nargs='+',
+                        choices=SCENES,
+                        default=list(SCENES),
+                        help='scenes to render (default: all)')
+    parser.add_argument('--jobs',
+                        type=int,
+                        nargs='+',
+                        default=None,
+                        help='worker counts (default: 1 and usable CPUs)')
+    parser.add_argument('--accel',
+                        type=str,
+                        nargs='+',
+                        choices=ACCELERATORS,
+                        default=None,
+                        help='accelerators to compare (default: the one of '
+                        'each scene)')
+    parser.add_argument('--integrator',
+                        type=str,
+                        choices=INTEGRATORS,
+                        default='path',
+                        help='integrator of the render passes')
+    parser.add_argument('--width',
+                        type=int,
+                        default=64,
+                        help='image width, the height keeps the scene aspect')
+    parser.add_argument('--samples',
+                        type=int,
+                        default=4,
+                        help='samples per pixel')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--tile-size',
+                        type=int,
+                        default=16,
+                        help='side length in pixels of a render task tile')
+    parser.add_argument('--scene-dist',
+                        type=str,
+                        choices=['fork', 'initializer'],
+                        default='fork',
+                        help='how the scene is shipped to the workers')
+    parser.add_argument('--output',
+                        type=str,
+                        default='output/benchmark.json',
+                        help='JSON report file')
+    parser.add_argument('--baseline',
+                        type=str,
+                        default=None,
+                        help='JSON report to compare the results against')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.1,
+                        help='relative slowdown flagged as regression')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    jobs_list = args.jobs or sorted({1, default_jobs()})
+
+    results = []
+    for name in args.scenes:
+        for accel in args.accel or [None]:
+            for res in bench_scene(name, args, jobs_list, accel):
+                print(f'{res["scene"]:>18} {res["accel"]:>4} '
+                      f'jobs {res["jobs"]:>3}: '
+                      f'wall {res["wall_time"]:8.3f}s, '
+                      f'{res["rays_per_sec"]:10.0f} rays/s, '
+                      f'{res["primary_rays_per_sec"]:10.0f} primary/s, '
+                      f'efficiency {res["parallel_efficiency"]:.2f}')
+                results.append(res)
+
+    report = {
+        'config': {
+            'width': args.width,
+            'samples': args.samples,
+            'seed': args.seed,
+            'tile_size': args.tile_size,
+            'jobs': jobs_list,
+            'accel': args.accel,
+            'integrator': args.integrator,
+            'cpus': os.cpu_count(),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results
+    }
+    if osp.dirname(args.output):
+        os.makedirs(osp.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report saved to {args.output}')
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for msg in regressions:
+            print(f'Regression: {msg}')
+        if regressions:
+            sys.exit(1)
+        print('No regression against the baseline')
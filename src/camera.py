@@ -1,8 +1,10 @@
 import math
-import random
 
+import numpy as np
+
+import rng
 from vec import Vec3, Point
-from ray import Ray
+from ray import Ray, RayBatch
 
 
 class Camera():
@@ -38,20 +40,54 @@ class Camera():
         self.v = Vec3.cross(self.w, self.u)
 
         self.origin = look_from
+        self.focus = focus
         self.bl_corner = self.origin - self.u * self.half_width - self.v * self.half_height - self.w * focus
         self.horizontal = 2 * self.u * self.half_width
         self.vertical = 2 * self.v * self.half_height
 
+    def set_aspect(self, aspect):
+        """Change the aspect ratio, keeping the vertical field of view."""
+        self.half_width = aspect * self.half_height
+        self.bl_corner = self.origin - self.u * self.half_width - self.v * self.half_height - self.w * self.focus
+        self.horizontal = 2 * self.u * self.half_width
+
     @classmethod
     def random_in_unit_disk(cls):
         while True:
-            p = 2 * Vec3(random.random(), random.random(), 0) - Vec3(1, 1, 0)
+            p = 2 * Vec3(rng.random(), rng.random(), 0) - Vec3(1, 1, 0)
             if Vec3.dot(p, p) < 1:
                 return p
 
     def get_ray(self, s, t):
         rd = self.lens_raidus * Camera.random_in_unit_disk()
-        offset = self.u * rd.x + self.v * rd.y
-        direction = self.bl_corner + s * self.horizontal + t * self.vertical - self.origin - offset
-        time = self.time0 + random.random() * (self.time1 - self.time0)
+        offset = (self.u * rd.x).madd(self.v, rd.y)
+        direction = self.bl_corner.add_scaled(self.horizontal, s).add_scaled(
+            self.vertical, t) - self.origin - offset
+        time = self.time0 + rng.random() * (self.time1 - self.time0)
         return Ray(Point(self.origin + offset), direction, time)
+
+    @classmethod
+    def random_in_unit_disk_batch(cls, streams, idx):
+        p = np.zeros((len(idx), 3))
+        pending = np.arange(len(idx))
+        # every ray draws until it lands in the disk
+        while len(pending):
+            x = 2 * streams.random(idx[pending]) - 1
+            y = 2 * streams.random(idx[pending]) - 1
+            p[pending, 0], p[pending, 1] = x, y
+            pending = pending[x * x + y * y >= 1]
+        return p
+
+    def get_ray_batch(self, s, t, streams, idx):
+        """Batch :meth:`get_ray` for the ``(n,)`` screen coordinates ``s, t``,
+        ray ``n`` draws from the stream ``idx[n]``."""
+        rd = self.lens_raidus * Camera.random_in_unit_disk_batch(streams, idx)
+        u, v = np.array(tuple(self.u)), np.array(tuple(self.v))
+        origin = np.array(tuple(self.origin))
+        offset = rd[:, :1] * u + rd[:, 1:2] * v
+        direction = (np.array(tuple(self.bl_corner)) +
+                     s[:, None] * np.array(tuple(self.horizontal)) +
+                     t[:, None] * np.array(tuple(self.vertical)) - origin -
+                     offset)
+        time = self.time0 + streams.random(idx) * (self.time1 - self.time0)
+        return RayBatch(origin + offset, direction, time)
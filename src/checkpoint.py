@@ -0,0 +1,38 @@
+import os
+import json
+
+import numpy as np
+
+
+def save_checkpoint(path, radiance, counts, meta):
+    """Save the accumulated radiance sum and per-pixel sample counts.
+
+    The file is written next to its destination first and then renamed over
+    it, so a job killed while saving still leaves the previous checkpoint.
+
+    Args:
+        path (str): checkpoint file, conventionally ending with ``.npz``
+        radiance (np.ndarray): ``(rows, columns, 3)`` float radiance sum
+        counts (np.ndarray): ``(rows, columns)`` number of samples per pixel
+        meta (dict): JSON serializable render settings and progress
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f,
+                 radiance=radiance,
+                 counts=counts,
+                 meta=np.array(json.dumps(meta, sort_keys=True)))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Load a checkpoint written by :func:`save_checkpoint`.
+
+    Returns:
+        tuple: ``(radiance, counts, meta)``
+    """
+    with np.load(path) as data:
+        radiance = data['radiance']
+        counts = data['counts']
+        meta = json.loads(str(data['meta']))
+    return radiance, counts, meta
@@ -0,0 +1,90 @@
+import zlib
+import struct
+
+import numpy as np
+
+FORMATS = ('ppm', 'png', 'pfm')
+
+
+def to_display(img, gamma=2.):
+    """Convert a linear float image to 8-bit display pixels.
+
+    Args:
+        img (np.ndarray): ``(rows, columns, 3)`` or ``(rows, columns)`` image
+            indexed as ``img[x][y]`` with ``y`` growing upwards
+        gamma (float): encoding gamma, the default 2 takes the square root
+
+    Returns:
+        np.ndarray: ``(columns, rows[, 3])`` uint8 pixels, top row first
+    """
+    img = np.clip(img, 0., None)
+    if gamma != 1.:
+        img = np.power(img, 1. / gamma)
+    pixels = np.clip(img * 255.99, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(pixels.swapaxes(0, 1)[::-1])
+
+
+def write_ppm(fname, pixels):
+    """Write uint8 pixels as binary P6 (RGB) or P5 (gray) netpbm."""
+    height, width = pixels.shape[:2]
+    magic = 'P6' if pixels.ndim == 3 else 'P5'
+    with open(fname, 'wb') as f:
+        f.write(f'{magic}\n{width} {height}\n255\n'.encode())
+        f.write(pixels.tobytes())
+
+
+def _png_chunk(tag, data):
+    chunk = tag + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack(
+        '>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+def write_png(fname, pixels):
+    """Write uint8 pixels as an 8-bit RGB or gray PNG."""
+    height, width = pixels.shape[:2]
+    color_type = 2 if pixels.ndim == 3 else 0
+    # every scanline starts with filter type 0 (None)
+    raw = np.zeros((height, pixels[0].size + 1), np.uint8)
+    raw[:, 1:] = pixels.reshape(height, -1)
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    with open(fname, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', header))
+        f.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def write_pfm(fname, img):
+    """Write a linear float image as little-endian PFM.
+
+    PFM stores scanlines bottom to top, which is the ``img[x][y]`` layout
+    transposed, so no flip is needed.
+    """
+    columns = img.shape[1]
+    rows = img.shape[0]
+    magic = 'PF' if img.ndim == 3 else 'Pf'
+    data = np.ascontiguousarray(img.swapaxes(0, 1), dtype='<f4')
+    with open(fname, 'wb') as f:
+        f.write(f'{magic}\n{rows} {columns}\n-1.0\n'.encode())
+        f.write(data.tobytes())
+
+
+def write_image(output_file, img, fmt='ppm', gamma=2.):
+    """Write a linear float image in one of :data:`FORMATS`.
+
+    Args:
+        output_file (str): file name without extension
+        img (np.ndarray): ``(rows, columns, 3)`` color or ``(rows, columns)``
+            gray image indexed as ``img[x][y]``
+        fmt (str): ``'ppm'`` (binary P6, P5 for gray), ``'png'`` or ``'pfm'``
+        gamma (float): display gamma for the 8-bit formats
+    """
+    if fmt == 'pfm':
+        write_pfm(output_file + '.pfm', img)
+    elif fmt == 'png':
+        write_png(output_file + '.png', to_display(img, gamma))
+    elif fmt == 'ppm':
+        ext = '.ppm' if img.ndim == 3 else '.pgm'
+        write_ppm(output_file + ext, to_display(img, gamma))
+    else:
+        raise ValueError(f'no {fmt} image format!')
@@ -1,104 +1,199 @@
 import time
+import json
 import argparse
-import itertools
-import random
 import os.path as osp
 import multiprocessing as mp
+from collections import Counter
 
 import numpy as np
-from pdf import HitPDF, MixPDF
 
-from vec import Color
-from ray import Ray
+from render import (INTEGRATORS, MAX_DEPTH, RR_DEPTH, split_tiles,
+                    default_jobs, create_pool, render_pass,
+                    render_tile_adaptive_task, merge_moments)
+from scene import SCENES, ACCELERATORS, load_scene
+from checkpoint import save_checkpoint, load_checkpoint
+from image_io import FORMATS, write_image
+from stats import summarize
 
 
-def write_ppm_file(output_file, img, rows, columns):
-    with open(output_file + '.ppm', 'w') as f:
-        title = f'P3\n{rows} {columns}\n255\n'
-        f.write(title)
-        for j in reversed(range(columns)):
-            for i in range(rows):
-                ir, ig, ib = img[j][i]
-                f.write(f'{ir} {ig} {ib}\n')
+def render_adaptive(pool, tiles, args, rows, columns):
+    """Spend ``samples * rows * columns`` paths where the image is noisy.
 
+    Every pixel first gets ``--adaptive-min-samples`` paths. Afterwards each
+    round gives ``--adaptive-batch`` more paths to the pixels whose relative
+    standard error of the luminance mean is still above
+    ``--adaptive-threshold``, noisiest first, until the budget is spent or
+    every pixel has converged.
 
-def cal_ray_color(r, world, lights, depth):
-    hit_rec = world.hit(r, 0.001, float('inf'))
-    if hit_rec is not None:
-        emitted = hit_rec.mat.emitted(r, hit_rec)
-        sct_rec = hit_rec.mat.scatter(r, hit_rec)
-
-        if sct_rec.atten is not None and depth < 50:
-            if sct_rec.is_specular:
-                return emitted + sct_rec.atten * cal_ray_color(
-                    sct_rec.sct_ray, world, lights, depth + 1)
-            else:
-                hit_pdfs = [HitPDF(light, hit_rec.p) for light in lights.objs]
-                pdf_list = hit_pdfs + [sct_rec.pdf]
-                mix_pdf = MixPDF(pdf_list)
-
-                sct_ray = Ray(hit_rec.p, mix_pdf.generate(), r.time)
-                sct_pdf = hit_rec.mat.scatter_pdf(r, hit_rec, sct_ray)
-                pdf_value = mix_pdf.value(sct_ray.direction)
-
-                return emitted + sct_rec.atten * sct_pdf * cal_ray_color(
-                    sct_ray, world, lights, depth + 1) / pdf_value
+    Returns:
+        tuple: the radiance sum, the per-pixel sample counts and the summed
+            counts of the tasks
+    """
+    radiance = np.zeros((rows, columns, 3), float)
+    count = np.zeros((rows, columns), np.int64)
+    mean = np.zeros((rows, columns), float)
+    m2 = np.zeros((rows, columns), float)
+    task_counts = Counter()
 
+    budget = args.samples * rows * columns
+    spp = np.full((rows, columns), min(args.adaptive_min_samples,
+                                       args.samples), np.int64)
+    while spp.any():
+        tasks = [((i0, i1, j0, j1), spp[i0:i1, j0:j1], count[i0:i1, j0:j1],
+                  args.seed, args.integrator, args.max_depth, args.rr_depth)
+                 for i0, i1, j0, j1 in tiles
+                 if spp[i0:i1, j0:j1].any()]
+        if pool is not None:
+            results = pool.starmap(render_tile_adaptive_task,
+                                   tasks,
+                                   chunksize=1)
         else:
-            return emitted
+            results = [render_tile_adaptive_task(*task) for task in tasks]
 
-    return Color(0)
+        for (i0, i1, j0, j1), block, _count, _mean, _m2, _counts in results:
+            task_counts += _counts
+            win = (slice(i0, i1), slice(j0, j1))
+            radiance[win] += block
+            count[win], mean[win], m2[win] = merge_moments(
+                count[win], mean[win], m2[win], _count, _mean, _m2)
 
+        remaining = budget - int(count.sum())
+        if remaining <= 0:
+            break
+        variance = m2 / np.maximum(count - 1, 1)
+        rel_err = np.sqrt(variance / np.maximum(count, 1)) / np.maximum(
+            mean, 1e-4)
+        noisy = rel_err > args.adaptive_threshold
+        if args.adaptive_max_samples > 0:
+            noisy &= count < args.adaptive_max_samples
+        noisy = np.flatnonzero(noisy)
+        if noisy.size == 0:
+            break
+        noisy = noisy[np.argsort(-rel_err.ravel()[noisy], kind='stable')]
+        batch = min(args.adaptive_batch, max(remaining // noisy.size, 1))
+        noisy = noisy[:remaining // batch]
+        spp = np.zeros((rows, columns), np.int64)
+        spp.ravel()[noisy] = batch
 
-def cal_ray_tracing(i, j, samples, rows, columns, camera, world, lights):
-    color = Color(0)
-    for _ in range(samples):
-        u = float(i + random.random()) / (rows - 1)
-        v = float(j + random.random()) / (columns - 1)
-        ray_r = camera.get_ray(u, v)
-        color += cal_ray_color(ray_r, world, lights, 0)
-    return (i, j, color)
+    return radiance, count, task_counts
 
 
 def ray_tracing(args):
     output_fname = args.output
     samples = args.samples
-    use_multiprocessing = True
 
-    import scene.hw3 as scene
+    scene = load_scene(args.scene, args.width, args.height, args.accel)
     rows = scene.rows
     columns = scene.columns
     camera = scene.camera
     lights = scene.lights
     world = scene.world
 
-    params = (samples, rows, columns, camera, world, lights)
+    render_scene = (rows, columns, camera, world, lights)
+    tiles = split_tiles(rows, columns, args.tile_size)
+
+    # shard k of n renders every n-th tile or the k-th slice of the samples
+    first_sample, last_sample = 0, samples
+    sharded = args.num_shards > 1
+    if sharded and args.shard_by == 'tiles':
+        tiles = tiles[args.shard_index::args.num_shards]
+    elif sharded:
+        first_sample = samples * args.shard_index // args.num_shards
+        last_sample = samples * (args.shard_index + 1) // args.num_shards
 
-    if use_multiprocessing:
-        n_jobs = 32
-        with mp.Pool(n_jobs) as p:
-            results = p.starmap(cal_ray_tracing, [(i, j) + params
-                                                  for i in range(rows)
-                                                  for j in range(columns)])
+    # progressive passes of pass_samples spp, all samples at once by default
+    pass_samples = args.pass_samples if args.pass_samples > 0 else samples
+    n_passes = (last_sample - first_sample + pass_samples - 1) // pass_samples
+    if args.adaptive:
+        n_passes = 0
+    meta = {
+        'scene': args.scene,
+        'rows': rows,
+        'columns': columns,
+        'samples': samples,
+        'pass_samples': pass_samples,
+        'seed': args.seed,
+        'max_depth': args.max_depth,
+        'rr_depth': args.rr_depth,
+        'num_shards': args.num_shards,
+        'shard_index': args.shard_index,
+        'shard_by': args.shard_by,
+        'passes_done': 0
+    }
+    if sharded:
+        # the checkpoint of a shard is also its final partial
+        default_ckpt = (f'{output_fname}.shard-{args.shard_index}'
+                        f'-of-{args.num_shards}.npz')
     else:
-        results = []
-        for i, j in itertools.product(range(rows), range(columns)):
-            results.append(cal_ray_tracing(i, j, *params))
+        default_ckpt = output_fname + '.ckpt.npz'
+    ckpt_file = args.checkpoint or default_ckpt
+
+    radiance = np.zeros((rows, columns, 3), float)
+    counts = np.zeros((rows, columns), np.int64)
+    if args.resume and osp.exists(ckpt_file):
+        radiance, counts, ckpt_meta = load_checkpoint(ckpt_file)
+        for key, val in meta.items():
+            # checkpoints of older versions miss the newer settings
+            if key != 'passes_done' and ckpt_meta.get(key) != val:
+                raise ValueError(f'checkpoint {ckpt_file} was rendered with '
+                                 f'{key}={ckpt_meta.get(key)}, but get {val}')
+        meta['passes_done'] = ckpt_meta['passes_done']
+        print(f'Resume from pass {meta["passes_done"]} / {n_passes}')
+
+    # the scene reaches every worker once, tasks only carry tiles and seeds
+    pool = create_pool(args.jobs, render_scene, args.scene_dist, args.stats)
+    task_counts = Counter()
+    try:
+        if args.adaptive:
+            radiance, counts, task_counts = render_adaptive(
+                pool, tiles, args, rows, columns)
+        for pass_idx in range(meta['passes_done'], n_passes):
+            pass_first = first_sample + pass_idx * pass_samples
+            spp = min(pass_samples, last_sample - pass_first)
+            pass_radiance, pass_counts, pass_task_counts = render_pass(
+                pool, tiles, pass_first, spp, args.seed, rows, columns,
+                args.integrator, args.max_depth, args.rr_depth)
+            radiance += pass_radiance
+            counts += pass_counts
+            task_counts += pass_task_counts
+            meta['passes_done'] = pass_idx + 1
+            if n_passes > 1:
+                save_checkpoint(ckpt_file, radiance, counts, meta)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if args.stats:
+        stats_file = output_fname + '.stats.json'
+        with open(stats_file, 'w') as f:
+            json.dump(summarize(task_counts), f, indent=2)
+        print(f'Render statistics saved to {stats_file}')
 
-    img = np.zeros((rows, columns, 3), float)
-    for i, j, color in results:
-        img[i][j] += color
-    img /= samples
-    img = (np.sqrt(img) * 255.99).astype(int)
+    if sharded:
+        save_checkpoint(ckpt_file, radiance, counts, meta)
+        print(f'Shard {args.shard_index} / {args.num_shards} saved to '
+              f'{ckpt_file}, combine the shards with src/merge.py')
+        return
 
-    img = img.transpose(1, 0, 2)
+    img = radiance / counts[..., None]
+    write_image(output_fname, img, args.format)
 
-    write_ppm_file(output_fname, img, rows, columns)
+    if args.adaptive:
+        spp_map = counts / max(int(counts.max()), 1)
+        write_image(output_fname + '_spp', spp_map, args.format, gamma=1.)
+        print(f'Samples per pixel: min {counts.min()}, '
+              f'mean {counts.mean():.2f}, max {counts.max()}')
 
 
 def parse_args():
-    """Parse args to get scene_file and output_file."""
+    """Parse args to get the scene, output file and render settings."""
     parser = argparse.ArgumentParser(description='Ray Tracing in Python')
+    parser.add_argument('--scene',
+                        type=str,
+                        choices=SCENES,
+                        default='hw3',
+                        help='scene module in src/scene')
     parser.add_argument('--output',
                         type=str,
                         default='output/output_3_ns_10',
@@ -107,7 +202,120 @@ def parse_args():
                         type=int,
                         default=1,
                         help='num of sample lights')
+    parser.add_argument('--width',
+                        type=int,
+                        default=None,
+                        help='override the image width of the scene')
+    parser.add_argument('--height',
+                        type=int,
+                        default=None,
+                        help='override the image height of the scene')
+    parser.add_argument('--accel',
+                        type=str,
+                        choices=ACCELERATORS,
+                        default=None,
+                        help='accelerator of the scene objects (default: '
+                        'the one of the scene, else bvh)')
+    parser.add_argument('--integrator',
+                        type=str,
+                        choices=INTEGRATORS,
+                        default='path',
+                        help='path tracing per sample, or wavefront '
+                        'tracing of all samples of a tile as ray packets')
+    parser.add_argument('--max-depth',
+                        type=int,
+                        default=MAX_DEPTH,
+                        help='deepest bounce a path scatters at')
+    parser.add_argument('--rr-depth',
+                        type=int,
+                        default=RR_DEPTH,
+                        help='bounces before Russian roulette may end a path')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=default_jobs(),
+                        help='worker processes (default: usable CPUs)')
+    parser.add_argument('--format',
+                        type=str,
+                        choices=FORMATS,
+                        default='ppm',
+                        help='image format, pfm keeps linear float radiance')
+    parser.add_argument('--tile-size',
+                        type=int,
+                        default=16,
+                        help='side length in pixels of a render task tile')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='base seed of the per-sample random streams')
+    parser.add_argument('--scene-dist',
+                        type=str,
+                        choices=['fork', 'initializer'],
+                        default='fork' if 'fork' in mp.get_all_start_methods()
+                        else 'initializer',
+                        help='ship the scene to workers by copy-on-write fork '
+                        'or once per worker through the pool initializer')
+    parser.add_argument('--stats',
+                        action='store_true',
+                        help='count rays, intersection tests and path depths '
+                        'and save them to <output>.stats.json')
+    parser.add_argument('--pass-samples',
+                        type=int,
+                        default=0,
+                        help='samples per progressive pass, a checkpoint is '
+                        'saved after each pass (0 renders a single pass)')
+    parser.add_argument('--checkpoint',
+                        type=str,
+                        default=None,
+                        help='checkpoint file (default: <output>.ckpt.npz)')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='continue from the checkpoint if it exists')
+    parser.add_argument('--adaptive',
+                        action='store_true',
+                        help='distribute samples * pixels paths by per-pixel '
+                        'noise and write a <output>_spp sample-count map')
+    parser.add_argument('--adaptive-min-samples',
+                        type=int,
+                        default=8,
+                        help='paths every pixel gets before adapting')
+    parser.add_argument('--adaptive-batch',
+                        type=int,
+                        default=8,
+                        help='paths added to a noisy pixel per round')
+    parser.add_argument('--adaptive-threshold',
+                        type=float,
+                        default=0.05,
+                        help='relative error below which a pixel converged')
+    parser.add_argument('--adaptive-max-samples',
+                        type=int,
+                        default=0,
+                        help='cap on the paths of a single pixel (0: no cap)')
+    parser.add_argument('--num-shards',
+                        type=int,
+                        default=1,
+                        help='split the render into independent shards whose '
+                        'partials are combined by src/merge.py')
+    parser.add_argument('--shard-index',
+                        type=int,
+                        default=0,
+                        help='shard rendered by this process, e.g. '
+                        '$SLURM_ARRAY_TASK_ID')
+    parser.add_argument('--shard-by',
+                        type=str,
+                        choices=['tiles', 'samples'],
+                        default='samples',
+                        help='give each shard a subset of the tiles or a '
+                        'slice of the samples of every pixel')
     args = parser.parse_args()
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error(f'--shard-index must be in [0, {args.num_shards})')
+    if args.adaptive and args.num_shards > 1:
+        parser.error('--adaptive can not be combined with --num-shards')
+    for name in ('width', 'height'):
+        if getattr(args, name) is not None and getattr(args, name) < 2:
+            parser.error(f'--{name} must be at least 2')
+    if args.adaptive and args.pass_samples > 0:
+        parser.error('--adaptive can not be combined with --pass-samples')
 
     return args
 
@@ -1,13 +1,23 @@
 import math
-import random
 from abc import ABC, abstractmethod
-from pdf import CosinePDF
 
+import numpy as np
+from pdf import CosinePDF, CosinePDFBatch
+
+import rng
 from vec import Vec3, Color
-from ray import Ray
+from ray import Ray, RayBatch
 from texture import ConstantTexture
 
 
+def _normalize(v):
+    return v / np.sqrt((v * v).sum(axis=1))[:, None]
+
+
+def _dot(a, b):
+    return (a * b).sum(axis=1)
+
+
 class ScatterRecord():
 
     def __init__(self, atten=None, sct_ray=None, pdf=None, is_specular=False):
@@ -17,6 +27,34 @@ class ScatterRecord():
         self.is_specular = is_specular
 
 
+class ScatterBatch():
+    """Batch counterpart of :class:`ScatterRecord` for the rays hitting one
+    material.
+
+    Args:
+        atten (np.ndarray): ``(n, 3)`` attenuations
+        scattered (np.ndarray, optional): ``(n,)`` mask of the rays that
+            scatter, the others are absorbed, all by default
+        sct_ray (RayBatch, optional): scattered rays of specular materials
+        pdf (PDF, optional): batch pdf of the scattered directions
+        is_specular (bool): whether the material scatters specularly
+    """
+
+    def __init__(self,
+                 atten,
+                 scattered=None,
+                 sct_ray=None,
+                 pdf=None,
+                 is_specular=False):
+        self.atten = atten
+        if scattered is None:
+            scattered = np.ones(len(atten), dtype=bool)
+        self.scattered = scattered
+        self.sct_ray = sct_ray
+        self.pdf = pdf
+        self.is_specular = is_specular
+
+
 class Material(ABC):
 
     @abstractmethod
@@ -29,23 +67,49 @@ class Material(ABC):
     def scatter_pdf(self, r_in, rec, scattered):
         raise NotImplementedError
 
+    # batch counterparts, ``r_in`` is a :class:`RayBatch` of the rays
+    # hitting the material and ``rec`` their :class:`HitBatch`; random
+    # numbers of ray ``n`` come from the stream ``idx[n]``
+
+    def scatter_batch(self, r_in, rec, streams, idx):
+        """:class:`ScatterBatch` of the rays."""
+        raise NotImplementedError
+
+    def emitted_batch(self, r_in, rec):
+        """``(n, 3)`` emitted radiance."""
+        raise NotImplementedError
+
+    def scatter_pdf_batch(self, r_in, rec, scattered):
+        """``(n,)`` scattering pdfs of the :class:`RayBatch` ``scattered``."""
+        raise NotImplementedError
+
     @classmethod
     def random_in_unit_sphere(cls):
-        r = random.random()
-        phi = math.pi * random.random()
-        theta = 2 * math.pi * random.random()
+        r = rng.random()
+        phi = math.pi * rng.random()
+        theta = 2 * math.pi * rng.random()
 
         p = Vec3(r * math.cos(theta) * math.sin(phi),
                  r * math.sin(theta) * math.sin(phi), r * math.cos(phi))
         return p
 
+    @classmethod
+    def random_in_unit_sphere_batch(cls, streams, idx):
+        r = streams.random(idx)
+        phi = math.pi * streams.random(idx)
+        theta = 2 * math.pi * streams.random(idx)
+        return np.stack([
+            r * np.cos(theta) * np.sin(phi), r * np.sin(theta) * np.sin(phi),
+            r * np.cos(phi)
+        ], axis=1)
+
 
 class Lambertian(Material):
 
     def __init__(self, albedo=None):
         if albedo is None:
             albedo = ConstantTexture(
-                Color(random.random(), random.random(), random.random()))
+                Color(rng.random(), rng.random(), rng.random()))
         self.albedo = albedo
 
     def scatter(self, r_in, rec):
@@ -62,6 +126,17 @@ class Lambertian(Material):
     def emitted(self, r_in, rec):
         return Vec3(0)
 
+    def scatter_batch(self, r_in, rec, streams, idx):
+        atten = self.albedo.value_batch(rec.u, rec.v, rec.p)
+        return ScatterBatch(atten, pdf=CosinePDFBatch(rec.normal))
+
+    def scatter_pdf_batch(self, r_in, rec, scattered):
+        cos = _dot(rec.normal, _normalize(scattered.direction))
+        return np.maximum(cos, 0.) / math.pi
+
+    def emitted_batch(self, r_in, rec):
+        return np.zeros((len(rec), 3))
+
 
 class Metal(Material):
 
@@ -75,7 +150,8 @@ class Metal(Material):
 
     def scatter(self, r_in, rec):
         _ref_dir = Metal.reflect(r_in.direction.normalize(), rec.normal)
-        ref_dir = _ref_dir + self.fuzz * Material.random_in_unit_sphere()
+        ref_dir = _ref_dir.add_scaled(Material.random_in_unit_sphere(),
+                                      self.fuzz)
         sct_ray = Ray(rec.p, ref_dir)
         atten = self.albedo.value(rec.u, rec.v, rec.p)
 
@@ -90,7 +166,24 @@ class Metal(Material):
 
     @classmethod
     def reflect(cls, r_in, normal):
-        return r_in - 2 * Vec3.dot(r_in, normal) * normal
+        return r_in.add_scaled(normal, -2 * Vec3.dot(r_in, normal))
+
+    @classmethod
+    def reflect_batch(cls, r_in, normal):
+        return r_in - 2 * _dot(r_in, normal)[:, None] * normal
+
+    def scatter_batch(self, r_in, rec, streams, idx):
+        _ref_dir = Metal.reflect_batch(_normalize(r_in.direction), rec.normal)
+        ref_dir = _ref_dir + self.fuzz * Material.random_in_unit_sphere_batch(
+            streams, idx)
+        atten = self.albedo.value_batch(rec.u, rec.v, rec.p)
+        return ScatterBatch(atten,
+                            scattered=_dot(ref_dir, rec.normal) > 0,
+                            sct_ray=RayBatch(rec.p, ref_dir),
+                            is_specular=True)
+
+    def emitted_batch(self, r_in, rec):
+        return np.zeros((len(rec), 3))
 
 
 class DiffuseLight(Material):
@@ -106,6 +199,15 @@ class DiffuseLight(Material):
             return self.emit.value(rec.u, rec.v, rec.p)
         return Vec3(0)
 
+    def scatter_batch(self, r_in, rec, streams, idx):
+        return ScatterBatch(np.zeros((len(rec), 3)),
+                            scattered=np.zeros(len(rec), dtype=bool))
+
+    def emitted_batch(self, r_in, rec):
+        front = _dot(rec.normal, r_in.direction) < 0.
+        return np.where(front[:, None],
+                        self.emit.value_batch(rec.u, rec.v, rec.p), 0.)
+
 
 class Microfacet(Material):
 
@@ -116,7 +218,7 @@ class Microfacet(Material):
             f'ior must be in (0, 1), but get {index_of_reflect}')
         if albedo is None:
             albedo = ConstantTexture(
-                Color(random.random(), random.random(), random.random()))
+                Color(rng.random(), rng.random(), rng.random()))
 
         self.rough = roughness
         self.albedo = albedo
@@ -173,6 +275,64 @@ class Microfacet(Material):
         # f(l, v) * cosine = F * G * D * ldotn / (4 * vdotn * ldotn)
         return F * G * D / (4 * vdotn)
 
+    def emitted_batch(self, r_in, rec):
+        return np.zeros((len(rec), 3))
+
+    def scatter_batch(self, r_in, rec, streams, idx):
+        atten = self.albedo.value_batch(rec.u, rec.v, rec.p)
+        if not math.isclose(self.rough, 0.):
+            return ScatterBatch(atten, pdf=CosinePDFBatch(rec.normal))
+
+        ref_dir = Metal.reflect_batch(_normalize(r_in.direction), rec.normal)
+        cosine = _dot(ref_dir, rec.normal)
+        scattered = cosine > 0
+        fresnel = self.fresnel_schlick_batch(cosine[scattered])
+        atten[scattered] *= fresnel[:, None]
+        return ScatterBatch(atten,
+                            scattered=scattered,
+                            sct_ray=RayBatch(rec.p, ref_dir),
+                            is_specular=True)
+
+    def scatter_pdf_batch(self, r_in, rec, scattered):
+        wv = -_normalize(r_in.direction)
+        wl = _normalize(scattered.direction)
+        n = _normalize(rec.normal)
+        m = _normalize(wv + wl)
+
+        ldotn = _dot(wl, n)
+        ldotm = _dot(wl, m)
+        vdotn = _dot(wv, n)
+        vdotm = _dot(wv, m)
+        mdotn = _dot(m, n)
+
+        F = self.fresnel_schlick_batch(vdotm)
+        G = self.geom_GGX_batch(ldotn, ldotm, vdotn, vdotm)
+        D = self.norm_dist_GGX_batch(mdotn)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pdf = F * G * D / (4 * vdotn)
+        return np.where(ldotn <= 0, 0., pdf)
+
+    def fresnel_schlick_batch(self, cosine):
+        return self.f0 + (1 - self.f0) * (1 - cosine)**5
+
+    def geom_GGX_batch(self, ldotn, ldotm, vdotn, vdotm):
+
+        def partial_geom_GGX(wdotm, wdotn):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                wdotm2 = wdotm * wdotm
+                tan2 = (1 - wdotm2) / wdotm2
+                geom = 2. / (1 + np.sqrt(1 + self.alpha2 * tan2))
+                return np.where(wdotm / wdotn <= 0, 0., geom)
+
+        return partial_geom_GGX(ldotn, ldotm) * partial_geom_GGX(vdotn, vdotm)
+
+    def norm_dist_GGX_batch(self, mdotn):
+        mdotn2 = mdotn * mdotn
+        den = mdotn2 * self.alpha2 + (1 - mdotn2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = self.alpha2 / (math.pi * den * den)
+        return np.where(mdotn <= 0, 0., dist)
+
     def fresnel_schlick(self, cosine):
         return self.f0 + (1 - self.f0) * math.pow(1 - cosine, 5)
 
@@ -0,0 +1,70 @@
+import argparse
+
+import numpy as np
+
+from checkpoint import load_checkpoint
+from image_io import FORMATS, write_image
+
+# settings every partial of one image must agree on
+SHARED_KEYS = ('scene', 'rows', 'columns', 'samples', 'seed', 'max_depth',
+               'rr_depth', 'num_shards', 'shard_by')
+
+
+def merge_partials(partial_files):
+    """Sum the radiance and sample counts of shard partials.
+
+    Returns:
+        tuple: the radiance sum, the per-pixel sample counts and the meta of
+            the first partial
+    """
+    radiance, counts, meta = load_checkpoint(partial_files[0])
+    shards = {meta['shard_index']}
+    for fname in partial_files[1:]:
+        _radiance, _counts, _meta = load_checkpoint(fname)
+        for key in SHARED_KEYS:
+            if _meta.get(key) != meta.get(key):
+                raise ValueError(f'{fname} was rendered with {key}='
+                                 f'{_meta.get(key)}, but get {meta.get(key)}')
+        if _meta['shard_index'] in shards:
+            raise ValueError(f'shard {_meta["shard_index"]} is given twice')
+        shards.add(_meta['shard_index'])
+        radiance += _radiance
+        counts += _counts
+
+    missing = sorted(set(range(meta['num_shards'])) - shards)
+    if missing:
+        print(f'Warning: shards {missing} of {meta["num_shards"]} are missing')
+    return radiance, counts, meta
+
+
+def parse_args():
+    """Parse args to get the partials and output file."""
+    parser = argparse.ArgumentParser(
+        description='Merge shard partials rendered by main.py')
+    parser.add_argument('partials',
+                        type=str,
+                        nargs='+',
+                        help='partial .npz files written by the shards')
+    parser.add_argument('--output',
+                        type=str,
+                        required=True,
+                        help='output file')
+    parser.add_argument('--format',
+                        type=str,
+                        choices=FORMATS,
+                        default='ppm',
+                        help='image format, pfm keeps linear float radiance')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    radiance, counts, meta = merge_partials(args.partials)
+    if not counts.all():
+        print(f'Warning: {np.count_nonzero(counts == 0)} pixels have no '
+              'samples and are left black')
+    img = radiance / np.maximum(counts, 1)[..., None]
+    write_image(args.output, img, args.format)
+    print(f'Merged {len(args.partials)} partials of {meta["scene"]} into '
+          f'{args.output}')
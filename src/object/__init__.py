@@ -1,10 +1,23 @@
-from .hittable import HittableList
-from .transform import RotateX, RotateY, RotateZ, Translate, FlipNormals
+from .hittable import HittableList, BvhNode
+from .bvh import FlatBvh
+from .grid import UniformGrid
+from .transform import (RotateX, RotateY, RotateZ, Translate, FlipNormals,
+                        Transform, Instance, fuse_transforms, translation,
+                        rotation, scaling)
 from .element import XyRect, XzRect, YzRect, Triangle, XzDisk, XzPolygon
-from .geometry import Sphere, MovingSphere, Pyramid, Cylinder, Box
+from .mesh import TriangleMesh, load_obj, load_ply, load_mesh
+from .geometry import (Sphere, MovingSphere, ConvexPolyhedron, Pyramid,
+                       Cylinder, Box)
+from .group import (PrimitiveGroup, SphereGroup, RectGroup, TriangleGroup,
+                    group_primitives)
 
 __all__ = [
-    'HittableList', 'RotateX', 'RotateY', 'RotateZ', 'Translate',
-    'FlipNormals', 'XyRect', 'XzRect', 'YzRect', 'Triangle', 'XzDisk',
-    'Sphere', 'MovingSphere', 'Pyramid', 'Cylinder', 'Box', 'XzPolygon'
+    'HittableList', 'BvhNode', 'FlatBvh', 'UniformGrid', 'RotateX',
+    'RotateY', 'RotateZ', 'Translate', 'FlipNormals', 'Transform',
+    'Instance', 'fuse_transforms', 'translation', 'rotation', 'scaling',
+    'XyRect', 'XzRect', 'YzRect', 'Triangle', 'XzDisk', 'Sphere',
+    'MovingSphere', 'ConvexPolyhedron', 'Pyramid', 'Cylinder', 'Box',
+    'XzPolygon', 'TriangleMesh', 'load_obj', 'load_ply', 'load_mesh',
+    'PrimitiveGroup', 'SphereGroup', 'RectGroup', 'TriangleGroup',
+    'group_primitives'
 ]
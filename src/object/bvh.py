@@ -0,0 +1,353 @@
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+from .hittable import (Hittable, Aabb, BvhNode, slab_entry, lerp_bounds,
+                       batch_slab_entries)
+
+# fewest rays a node is tested with as a packet, fewer rays walk the subtree
+# one by one, which is cheaper than the NumPy calls per node
+PACKET_MIN = 16
+
+
+class FlatBvh(Hittable):
+    """Bounding volume hierarchy stored in flat buffers.
+
+    The nodes of a :class:`BvhNode` tree are laid out depth first, so the
+    left child of an inner node directly follows it and only the right child
+    needs an offset. Per node ``bounds`` holds ``min_x, min_y, min_z, max_x,
+    max_y, max_z``, ``offsets`` the index of the right child, or of the first
+    object of a leaf in ``objs``, and ``counts`` the number of objects of a
+    leaf, which is zero for inner nodes.
+
+    ``hit`` walks the nodes with an explicit stack, visits the nearer child
+    first and drops every node entered beyond the closest hit found so far.
+    ``occluded`` walks them in any order and stops at the first leaf with a
+    hit. Subclasses storing other primitives than hittable objects override
+    :meth:`_hit_leaf`, :meth:`_hit_record` and :meth:`_occluded_leaf`.
+
+    If objects move during the shutter interval, ``bounds`` holds the boxes
+    at ``time0`` and ``deltas`` their change until ``time1``, and nodes are
+    tested with the boxes interpolated at the ray time, see
+    :class:`BvhNode`. ``deltas`` is ``None`` for a still hierarchy.
+
+    Args:
+        world (list|HittableList|BvhNode): bounded hittable objects, or a
+            tree that is flattened as it is
+        time0 (float, optional): shutter open time
+        time1 (float, optional): shutter close time
+        **kwargs: build options of :class:`BvhNode`
+    """
+
+    def __init__(self, world, time0=None, time1=None, **kwargs):
+        if not isinstance(world, BvhNode):
+            world = BvhNode(world, time0, time1, **kwargs)
+
+        self.time0 = world.time0
+        self.time1 = world.time1
+        self.bounds = array('d')
+        self.offsets = array('l')
+        self.counts = array('l')
+        self.objs = []
+        bounds1 = array('d')
+        self._flatten(world, bounds1)
+
+        self.deltas = None
+        if bounds1 != self.bounds:
+            self.deltas = array(
+                'd', [b - a for a, b in zip(self.bounds, bounds1)])
+
+    def _flatten(self, node, bounds1):
+        idx = len(self.counts)
+        if node.box0 is None:
+            self.bounds.extend(node.box.bounds)
+            bounds1.extend(node.box.bounds)
+        else:
+            self.bounds.extend(node.box0.bounds)
+            bounds1.extend(node.box1.bounds)
+        self.offsets.append(0)
+        self.counts.append(0)
+        if node.objs is not None:
+            self.offsets[idx] = len(self.objs)
+            self.counts[idx] = len(node.objs)
+            self.objs.extend(node.objs)
+        else:
+            self._flatten(node.left, bounds1)
+            self.offsets[idx] = self._flatten(node.right, bounds1)
+        return idx
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _bounds_at(self, b, time):
+        bounds = self.bounds[b:b + 6]
+        return lerp_bounds(
+            bounds, [a + d for a, d in zip(bounds, self.deltas[b:b + 6])],
+            (time - self.time0) / (self.time1 - self.time0))
+
+    def _moving_slab_entry(self, bounds, b, r, t_min, t_max):
+        # slab_entry on the node box at the ray time
+        f = (r.time - self.time0) / (self.time1 - self.time0)
+        f = 0. if f < 0. else 1. if f > 1. else f
+        d = self.deltas
+        return slab_entry(
+            (bounds[b] + f * d[b], bounds[b + 1] + f * d[b + 1],
+             bounds[b + 2] + f * d[b + 2], bounds[b + 3] + f * d[b + 3],
+             bounds[b + 4] + f * d[b + 4], bounds[b + 5] + f * d[b + 5]), 0,
+            r, t_min, t_max)
+
+    def bounding_box(self, t0=None, t1=None):
+        if self.deltas is None:
+            return Aabb.from_bounds(self.bounds)
+        if t0 is None or t1 is None:
+            t0, t1 = self.time0, self.time1
+        return Aabb.surrounding_box(Aabb.from_bounds(self._bounds_at(0, t0)),
+                                    Aabb.from_bounds(self._bounds_at(0, t1)))
+
+    def hit(self, r, t_min, t_max):
+        entry = slab_entry if self.deltas is None else self._moving_slab_entry
+        if entry(self.bounds, 0, r, t_min, t_max) is None:
+            return None
+        return self._hit_subtree(0, r, t_min, t_max)
+
+    def _hit_subtree(self, node, r, t_min, t_max):
+        """``hit`` of the objects below ``node``, whose box the ray enters."""
+        bounds, offsets, counts = self.bounds, self.offsets, self.counts
+        entry = slab_entry if self.deltas is None else self._moving_slab_entry
+        closest = None
+        stack = []
+        while True:
+            count = counts[node]
+            if count:
+                leaf_hit = self._hit_leaf(offsets[node], count, r, t_min,
+                                          t_max)
+                if leaf_hit is not None:
+                    closest, t_max = leaf_hit
+            else:
+                near, far = node + 1, offsets[node]
+                t_near = entry(bounds, 6 * near, r, t_min, t_max)
+                t_far = entry(bounds, 6 * far, r, t_min, t_max)
+                if t_near is not None and t_far is not None:
+                    if t_far < t_near:
+                        near, far, t_far = far, near, t_near
+                    stack.append((far, t_far))
+                    node = near
+                    continue
+                if t_near is not None:
+                    node = near
+                    continue
+                if t_far is not None:
+                    node = far
+                    continue
+
+            # nodes entered behind the closest hit cannot hold a closer one
+            while stack:
+                node, t_enter = stack.pop()
+                if t_enter <= t_max:
+                    break
+            else:
+                if closest is None:
+                    return None
+                return self._hit_record(closest, r)
+
+    def occluded(self, r, t_min, t_max):
+        bounds, offsets, counts = self.bounds, self.offsets, self.counts
+        entry = slab_entry if self.deltas is None else self._moving_slab_entry
+        if entry(bounds, 0, r, t_min, t_max) is None:
+            return False
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            count = counts[node]
+            if count:
+                if self._occluded_leaf(offsets[node], count, r, t_min,
+                                       t_max):
+                    return True
+                continue
+            far = offsets[node]
+            if entry(bounds, 6 * far, r, t_min, t_max) is not None:
+                stack.append(far)
+            if entry(bounds, 6 * node + 6, r, t_min, t_max) is not None:
+                stack.append(node + 1)
+        return False
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        boxes = np.frombuffer(self.bounds).reshape(-1, 6)
+        if self.deltas is not None:
+            deltas = np.frombuffer(self.deltas).reshape(-1, 6)
+            f = np.clip((rays.time - self.time0) / (self.time1 - self.time0),
+                        0., 1.)
+        offsets, counts = self.offsets, self.counts
+
+        # every node is visited once with the rays that enter it
+        hits = []
+        stack = [(0, idx)]
+        while stack:
+            node, lanes = stack.pop()
+            box = boxes[node]
+            if self.deltas is not None:
+                box = box + f[lanes, None] * deltas[node]
+            entries = batch_slab_entries(box, rays, lanes, t_min,
+                                         rec.t[lanes])
+            lanes = lanes[entries < np.inf]
+            if len(lanes) == 0:
+                continue
+            if len(lanes) < PACKET_MIN:
+                hits.append(self._hit_subtree_rays(node, rays, lanes, t_min,
+                                                   rec))
+                continue
+            count = counts[node]
+            if count:
+                hits.append(
+                    self._hit_leaf_batch(offsets[node], count, rays, lanes,
+                                         t_min, rec))
+                continue
+            # visit first the child most rays reach first
+            near, far = node + 1, offsets[node]
+            step = boxes[far] - boxes[near]
+            if np.dot(step[:3] + step[3:],
+                      rays.direction[lanes].sum(axis=0)) < 0.:
+                near, far = far, near
+            stack.append((far, lanes))
+            stack.append((near, lanes))
+        if not hits:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(hits))
+
+    def _hit_subtree_rays(self, node, rays, idx, t_min, rec):
+        """Trace the rays ``idx`` one by one through the subtree of ``node``.
+
+        Returns:
+            np.ndarray: indices of the rays whose hit was replaced
+        """
+        hits = []
+        for k in idx.tolist():
+            hit_rec = self._hit_subtree(node, rays.ray(k), t_min,
+                                        float(rec.t[k]))
+            if hit_rec is not None:
+                rec.set_record(k, hit_rec)
+                hits.append(k)
+        return np.array(hits, dtype=np.int64)
+
+    def _hit_leaf_batch(self, start, count, rays, idx, t_min, rec):
+        """Batch counterpart of :meth:`_hit_leaf`, updates ``rec`` and
+        returns the indices of the rays whose hit was replaced."""
+        hits = [
+            obj.hit_batch(rays, idx, t_min, rec)
+            for obj in self.objs[start:start + count]
+        ]
+        return np.unique(np.concatenate(hits))
+
+    def _hit_leaf(self, start, count, r, t_min, t_max):
+        """Find the closest hit among the primitives of a leaf.
+
+        Returns:
+            tuple|None: ``(closest, t)``, where ``closest`` is passed to
+            :meth:`_hit_record` if it stays the closest one
+        """
+        hit_rec = None
+        for obj in self.objs[start:start + count]:
+            temp_hit_rec = obj.hit(r, t_min, t_max)
+            if temp_hit_rec is not None:
+                hit_rec = temp_hit_rec
+                t_max = temp_hit_rec.t
+        return None if hit_rec is None else (hit_rec, t_max)
+
+    def _hit_record(self, closest, r):
+        """Build the hit record of the closest hit of :meth:`_hit_leaf`."""
+        return closest
+
+    def _occluded_leaf(self, start, count, r, t_min, t_max):
+        """Whether any primitive of a leaf blocks the ray segment."""
+        for obj in self.objs[start:start + count]:
+            if obj.occluded(r, t_min, t_max):
+                return True
+        return False
+
+
+def _expand_bits(x):
+    # spread the low 10 bits of x to every third bit
+    x = (x | (x << 16)) & 0x030000FF
+    x = (x | (x << 8)) & 0x0300F00F
+    x = (x | (x << 4)) & 0x030C30C3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def build_morton(lo, hi, max_leaf=4):
+    """Build flat BVH buffers over many boxes in Morton order.
+
+    The boxes are sorted along a Morton curve of their centers, and every
+    node splits its range where the highest differing Morton bit changes.
+    This is a linear BVH, it is not as tight as the SAH tree of
+    :class:`BvhNode` but builds in seconds for millions of primitives.
+
+    Args:
+        lo (np.ndarray): ``(n, 3)`` minimum corners
+        hi (np.ndarray): ``(n, 3)`` maximum corners
+        max_leaf (int): largest number of primitives of a leaf
+
+    Returns:
+        tuple: ``(bounds, offsets, counts, order)`` laid out like the
+        buffers of :class:`FlatBvh`, leaf ranges index ``order``, which
+        sorts the primitives
+    """
+    centers = (lo + hi) / 2
+    c_min = centers.min(axis=0)
+    extent = centers.max(axis=0) - c_min
+    extent[extent <= 0.] = 1.
+    cells = np.clip((centers - c_min) / extent * 1024, 0, 1023)
+    cells = cells.astype(np.int64)
+    codes = (_expand_bits(cells[:, 0]) << 2 | _expand_bits(cells[:, 1]) << 1
+             | _expand_bits(cells[:, 2]))
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order].tolist()
+
+    offsets = array('l')
+    counts = array('l')
+    # ranges of the nodes still to emit, with the node to link as parent
+    stack = [(0, len(codes), -1)]
+    while stack:
+        start, end, parent = stack.pop()
+        node = len(counts)
+        if parent >= 0:
+            offsets[parent] = node
+        if end - start <= max_leaf:
+            offsets.append(start)
+            counts.append(end - start)
+            continue
+        offsets.append(0)
+        counts.append(0)
+
+        first, last = codes[start], codes[end - 1]
+        if first == last:
+            split = (start + end) // 2
+        else:
+            bit = (first ^ last).bit_length() - 1
+            prefix = (last >> bit) << bit
+            split = bisect_left(codes, prefix, start, end)
+        # the left child is emitted next, the right one links to this node
+        stack.append((split, end, node))
+        stack.append((start, split, -1))
+
+    # leaf boxes in one pass, inner boxes from their children bottom up
+    lo, hi = lo[order], hi[order]
+    counts_np = np.frombuffer(counts, dtype=np.int_)
+    leaves = np.flatnonzero(counts_np)
+    starts = np.frombuffer(offsets, dtype=np.int_)[leaves]
+    boxes = np.zeros((len(counts), 6))
+    boxes[leaves, :3] = np.minimum.reduceat(lo, starts)
+    boxes[leaves, 3:] = np.maximum.reduceat(hi, starts)
+    boxes = boxes.tolist()
+    for node in range(len(counts) - 1, -1, -1):
+        if counts[node]:
+            continue
+        left, right = boxes[node + 1], boxes[offsets[node]]
+        boxes[node] = [min(a, b) for a, b in zip(left[:3], right[:3])] + \
+            [max(a, b) for a, b in zip(left[3:], right[3:])]
+
+    bounds = array('d')
+    for box in boxes:
+        bounds.extend(box)
+    return bounds, offsets, counts, order
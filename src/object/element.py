@@ -1,11 +1,46 @@
-import random
 import math
 from functools import reduce
 
+import numpy as np
+
+import rng
 from vec import Vec3
-from ray import Ray
+from ray import Ray, RayBatch
 from sampler import get_sampler
-from .hittable import Hittable, HitRecord, Aabb, HittableList
+from .hittable import Hittable, HitRecord, HitBatch, Aabb, HittableList
+from .bvh import FlatBvh
+
+
+def _rect_hit_batch(rays, idx, t_min, rec, k, axis, u_range, v_range, normal,
+                    mat):
+    """Batch hit of an axis aligned rect in the plane ``p[axis] = k``, ``u``
+    and ``v`` run along the ``(axis, min, max)`` ranges."""
+    origin, direction = rays.origin[idx], rays.direction[idx]
+    (u_axis, u0, u1), (v_axis, v0, v1) = u_range, v_range
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (k - origin[:, axis]) / direction[:, axis]
+        p = origin + t[:, None] * direction
+        pu, pv = p[:, u_axis], p[:, v_axis]
+        hit = ((t >= t_min) & (t <= rec.t[idx]) & (pu >= u0) & (pu <= u1) &
+               (pv >= v0) & (pv <= v1))
+    lanes = idx[hit]
+    rec.update(lanes, t[hit], p[hit], normal, (pu[hit] - u0) / (u1 - u0),
+               (pv[hit] - v0) / (v1 - v0), mat)
+    return lanes
+
+
+def _area_pdf_batch(obj, origin, direction, area):
+    """Batch ``pdf_value`` of uniformly sampled points on a planar light."""
+    n = len(origin)
+    rec = HitBatch(n)
+    lanes = obj.hit_batch(RayBatch(origin, direction), np.arange(n), 1e-3,
+                          rec)
+    pdf = np.zeros(n)
+    d = direction[lanes]
+    square = (d * d).sum(axis=1)
+    cosine = np.abs((d * rec.normal[lanes]).sum(axis=1) / np.sqrt(square))
+    pdf[lanes] = rec.t[lanes] * rec.t[lanes] * square / (cosine * area)
+    return pdf
 
 
 class XyRect(Hittable):
@@ -38,7 +73,21 @@ class XyRect(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
+    def occluded(self, r, t_min, t_max):
+        t = (self.k - r.origin.z) / r.direction.z
+        if t < t_min or t > t_max:
+            return False
+        x = r.origin.x + t * r.direction.x
+        y = r.origin.y + t * r.direction.y
+        return not (x < self.x0 or x > self.x1 or y < self.y0 or
+                    y > self.y1)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        return _rect_hit_batch(rays, idx, t_min, rec, self.k, 2,
+                               (0, self.x0, self.x1), (1, self.y0, self.y1),
+                               (0., 0., 1.), self.mat)
+
+    def bounding_box(self, t0=None, t1=None):
         return Aabb(Vec3(self.x0, self.y0, self.k - 0.0001),
                     Vec3(self.x1, self.y1, self.k + 0.0001))
 
@@ -73,6 +122,20 @@ class XzRect(Hittable):
 
         return hit_rec
 
+    def occluded(self, r, t_min, t_max):
+        t = (self.k - r.origin.y) / r.direction.y
+        if t < t_min or t > t_max:
+            return False
+        x = r.origin.x + t * r.direction.x
+        z = r.origin.z + t * r.direction.z
+        return not (x < self.x0 or x > self.x1 or z < self.z0 or
+                    z > self.z1)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        return _rect_hit_batch(rays, idx, t_min, rec, self.k, 1,
+                               (0, self.x0, self.x1), (2, self.z0, self.z1),
+                               (0., 1., 0.), self.mat)
+
     def pdf_value(self, origin, direction):
         hit_rec = self.hit(Ray(origin, direction), 1e-3, float('inf'))
         if hit_rec is not None:
@@ -84,12 +147,22 @@ class XzRect(Hittable):
         return 0.
 
     def random(self, origin):
-        _x = self.x0 + random.random() * (self.x1 - self.x0)
-        _z = self.z0 + random.random() * (self.z1 - self.z0)
+        _x = self.x0 + rng.random() * (self.x1 - self.x0)
+        _z = self.z0 + rng.random() * (self.z1 - self.z0)
         _y = self.k
         return Vec3(_x, _y, _z) - origin
 
-    def bounding_box(self):
+    def pdf_value_batch(self, origin, direction):
+        return _area_pdf_batch(self, origin, direction,
+                               (self.x1 - self.x0) * (self.z1 - self.z0))
+
+    def random_batch(self, origin, streams, idx):
+        x = self.x0 + streams.random(idx) * (self.x1 - self.x0)
+        z = self.z0 + streams.random(idx) * (self.z1 - self.z0)
+        return np.stack([x, np.full(len(idx), float(self.k)), z],
+                        axis=1) - origin
+
+    def bounding_box(self, t0=None, t1=None):
         return Aabb(Vec3(self.x0, self.k - 0.0001, self.z0),
                     Vec3(self.x1, self.k + 0.0001, self.z1))
 
@@ -124,7 +197,21 @@ class YzRect(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
+    def occluded(self, r, t_min, t_max):
+        t = (self.k - r.origin.x) / r.direction.x
+        if t < t_min or t > t_max:
+            return False
+        y = r.origin.y + t * r.direction.y
+        z = r.origin.z + t * r.direction.z
+        return not (y < self.y0 or y > self.y1 or z < self.z0 or
+                    z > self.z1)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        return _rect_hit_batch(rays, idx, t_min, rec, self.k, 0,
+                               (2, self.z0, self.z1), (1, self.y0, self.y1),
+                               (1., 0., 0.), self.mat)
+
+    def bounding_box(self, t0=None, t1=None):
         return Aabb(Vec3(self.k - 0.0001, self.y0, self.z0),
                     Vec3(self.k + 0.0001, self.y1, self.z1))
 
@@ -153,6 +240,34 @@ class XzDisk(Hittable):
                     hit_rec.mat = self.mat
         return hit_rec
 
+    def occluded(self, r, t_min, t_max):
+        if math.isclose(r.direction.y, 0):
+            return False
+        o, d, c = r.origin, r.direction, self.center
+        t = (c.y - o.y) / d.y
+        if not t_min <= t <= t_max:
+            return False
+        dx = o.x + t * d.x - c.x
+        dy = o.y + t * d.y - c.y
+        dz = o.z + t * d.z - c.z
+        return math.sqrt(dx * dx + dy * dy + dz * dz) < self.radius
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        origin, direction = rays.origin[idx], rays.direction[idx]
+        center = np.array(tuple(self.center))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (center[1] - origin[:, 1]) / direction[:, 1]
+            p = origin + t[:, None] * direction
+            dist = np.sqrt(((p - center)**2).sum(axis=1))
+            hit = ((direction[:, 1] != 0.) & (t >= t_min) &
+                   (t <= rec.t[idx]) & (dist < self.radius))
+        lanes, p = idx[hit], p[hit]
+        diam = 2 * self.radius
+        rec.update(lanes, t[hit], p, (0., 1., 0.),
+                   (p[:, 0] - (center[0] - self.radius)) / diam,
+                   (p[:, 2] - (center[2] - self.radius)) / diam, self.mat)
+        return lanes
+
     def get_disk_uv(self, p):
         x_min = self.center.x - self.radius
         z_min = self.center.z - self.radius
@@ -160,7 +275,7 @@ class XzDisk(Hittable):
         u, v = (p.x - x_min) / diam, (p.z - z_min) / diam
         return u, v
 
-    def bounding_box(self):
+    def bounding_box(self, t0=None, t1=None):
         _x, _y, _z = self.center
         _r = self.radius
         return Aabb(Vec3(_x - _r, _y - 0.0001, _z - _r),
@@ -176,6 +291,10 @@ class XzDisk(Hittable):
             return dist_sqrd / (cosine * area)
         return 0.
 
+    def pdf_value_batch(self, origin, direction):
+        return _area_pdf_batch(self, origin, direction,
+                               math.pi * self.radius * self.radius / 4)
+
     def random(self, origin):
         if not hasattr(self, 'sampler'):
             width = height = self.radius * 2
@@ -244,14 +363,76 @@ class Triangle(Hittable):
             return hit_rec
         return None
 
+    def occluded(self, r, t_min, t_max):
+        # the test of ``hit`` on plain floats
+        p1, p2, p3 = self.p1, self.p2, self.p3
+        e1x, e1y, e1z = p2.x - p1.x, p2.y - p1.y, p2.z - p1.z
+        e2x, e2y, e2z = p3.x - p1.x, p3.y - p1.y, p3.z - p1.z
+        dx, dy, dz = r.direction.x, r.direction.y, r.direction.z
+        px = dy * e2z - dz * e2y
+        py = dz * e2x - dx * e2z
+        pz = dx * e2y - dy * e2x
+        det = e1x * px + e1y * py + e1z * pz
+        if det == 0.:
+            return False
+        inv_det = 1.0 / det
+        tx = r.origin.x - p1.x
+        ty = r.origin.y - p1.y
+        tz = r.origin.z - p1.z
+        u = (tx * px + ty * py + tz * pz) * inv_det
+        if u < 0 or u > 1:
+            return False
+        qx = ty * e1z - tz * e1y
+        qy = tz * e1x - tx * e1z
+        qz = tx * e1y - ty * e1x
+        v = (dx * qx + dy * qy + dz * qz) * inv_det
+        if v < 0 or u + v > 1:
+            return False
+        t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+        return t > 0.00001 and t > t_min and t < t_max
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        p1 = np.array(tuple(self.p1))
+        e1 = np.array(tuple(self.p2)) - p1
+        e2 = np.array(tuple(self.p3)) - p1
+        direction = rays.direction[idx]
+        pvec = np.cross(direction, e2)
+        det = pvec @ e1
+        tvec = rays.origin[idx] - p1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1.0 / det
+            u = (tvec * pvec).sum(axis=1) * inv_det
+            qvec = np.cross(tvec, e1)
+            v = (direction * qvec).sum(axis=1) * inv_det
+            t = (qvec @ e2) * inv_det
+            hit = ((det != 0.) & (u >= 0) & (u <= 1) & (v >= 0) &
+                   (u + v <= 1) & (t > 0.00001) & (t > t_min) &
+                   (t < rec.t[idx]))
+        lanes = idx[hit]
+        rec.update(lanes, t[hit], rays.at(t[hit], lanes), tuple(self.normal),
+                   u[hit], v[hit], self.mat)
+        return lanes
+
     def random(self, origin):
-        u = random.random()
-        v = random.random()
-        p = math.sqrt(v) * (1 - u) * self.p1 + u * math.sqrt(v) * self.p2 + (
-            1 - math.sqrt(v)) * self.p3
+        u = rng.random()
+        v = rng.random()
+        sqrt_v = math.sqrt(v)
+        p = (sqrt_v * (1 - u) * self.p1).madd(self.p2, u * sqrt_v).madd(
+            self.p3, 1 - sqrt_v)
 
         return p - origin
 
+    def random_batch(self, origin, streams, idx):
+        u = streams.random(idx)[:, None]
+        sqrt_v = np.sqrt(streams.random(idx))[:, None]
+        p = (sqrt_v * (1 - u) * np.array(tuple(self.p1)) +
+             u * sqrt_v * np.array(tuple(self.p2)) +
+             (1 - sqrt_v) * np.array(tuple(self.p3)))
+        return p - origin
+
+    def pdf_value_batch(self, origin, direction):
+        return _area_pdf_batch(self, origin, direction, self.area)
+
     def pdf_value(self, origin, direction):
         hit_rec = self.hit(Ray(origin, direction), 1e-3, float('inf'))
         if hit_rec is not None:
@@ -261,7 +442,7 @@ class Triangle(Hittable):
             return dist_sqrd / (cosine * self.area)
         return 0.
 
-    def bounding_box(self):
+    def bounding_box(self, t0=None, t1=None):
         p_list = [self.p1, self.p2, self.p3]
         min_x, max_x = min([p[0] for p in p_list]), max([p[0] for p in p_list])
         min_y, max_y = min([p[1] for p in p_list]), max([p[1] for p in p_list])
@@ -288,14 +469,22 @@ class XzPolygon(Hittable):
             obj.normal = self.normal
             obj_list.append(obj)
 
+        # the list keeps the area order for sampling, the bvh is for hits
         self.hit_obj_list = HittableList(obj_list)
+        self.bvh = FlatBvh(obj_list)
         self.area = reduce(lambda a, b: a + b, [obj.area for obj in obj_list])
 
     def hit(self, r, t_min, t_max):
-        return self.hit_obj_list.hit(r, t_min, t_max)
+        return self.bvh.hit(r, t_min, t_max)
+
+    def occluded(self, r, t_min, t_max):
+        return self.bvh.occluded(r, t_min, t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        return self.bvh.hit_batch(rays, idx, t_min, rec)
 
     def random(self, origin):
-        u = random.random() * self.area
+        u = rng.random() * self.area
 
         cnt = 0
         for obj in self.hit_obj_list:
@@ -305,6 +494,22 @@ class XzPolygon(Hittable):
 
         return self.hit_obj_list[-1].random(origin)
 
+    def random_batch(self, origin, streams, idx):
+        # pick triangles by area, then a point of each
+        areas = np.cumsum([obj.area for obj in self.hit_obj_list])
+        picks = np.minimum(
+            np.searchsorted(areas, streams.random(idx) * self.area),
+            len(areas) - 1)
+        directions = np.empty_like(origin)
+        for tri in np.unique(picks).tolist():
+            sel = picks == tri
+            directions[sel] = self.hit_obj_list[tri].random_batch(
+                origin[sel], streams, idx[sel])
+        return directions
+
+    def pdf_value_batch(self, origin, direction):
+        return _area_pdf_batch(self, origin, direction, self.area)
+
     def pdf_value(self, origin, direction):
         hit_rec = self.hit(Ray(origin, direction), 1e-3, float('inf'))
         if hit_rec is not None:
@@ -314,8 +519,8 @@ class XzPolygon(Hittable):
             return dist_sqrd / (cosine * self.area)
         return 0.
 
-    def bounding_box(self):
-        return self.obj_list.bounding_box()
+    def bounding_box(self, t0=None, t1=None):
+        return self.bvh.bounding_box(t0, t1)
 
     @classmethod
     def generate_random_convex_polygon(cls, n_vertexs=4, tx=554, ty=554):
@@ -324,14 +529,14 @@ class XzPolygon(Hittable):
             b = list()
             c = list()
             for i in range(len(a)):
-                if random.randrange(2):
+                if rng.randrange(2):
                     b.append(a[i])
                 else:
                     c.append(a[i])
             return b, c
 
         def get_deltas(n):
-            de = [random.random() for _ in range(n)]
+            de = [rng.random() for _ in range(n)]
             de.sort()
             dep, dem = random_partition(de[1:-1])
             dem.reverse()
@@ -341,7 +546,7 @@ class XzPolygon(Hittable):
 
         x, (a1, _) = get_deltas(n_vertexs)
         y, (b1, _) = get_deltas(n_vertexs)
-        random.shuffle(y)
+        rng.shuffle(y)
         vectors = [(x[i], y[i]) for i in range(n_vertexs)]
         vectors.sort(key=lambda v: math.atan2(v[1], v[0]))
         points = [(0, 0)]
@@ -1,11 +1,63 @@
 import itertools
 import math
 
+import numpy as np
+
 from vec import Point, Vec3
 from ray import Ray
-from .hittable import Hittable, HitRecord, HittableList, Aabb
-from .transform import FlipNormals
-from .element import XyRect, XzRect, YzRect, Triangle
+from .hittable import Hittable, HitRecord, Aabb
+
+
+def _sphere_uv_batch(normal):
+    """Array version of :meth:`Sphere.get_sphere_uv`."""
+    phi = np.arctan2(normal[:, 2], normal[:, 0])
+    theta = np.arcsin(np.clip(normal[:, 1], -1., 1.))
+    return 1 - (phi + math.pi) / (2 * math.pi), (theta + math.pi / 2) / math.pi
+
+
+def _sphere_hit_batch(rays, idx, t_min, rec, center, radius, mat):
+    """Batch hit of spheres with the ``(3,)`` or per ray ``(n, 3)``
+    ``center``."""
+    direction = rays.direction[idx]
+    oc = rays.origin[idx] - center
+    a = (direction * direction).sum(axis=1)
+    half_b = (oc * direction).sum(axis=1)
+    c = (oc * oc).sum(axis=1) - radius * radius
+    discriminant = half_b * half_b - a * c
+    t_max = rec.t[idx]
+    with np.errstate(invalid='ignore'):
+        sqrtd = np.sqrt(discriminant)
+        # the near root, else the far one
+        root = (-half_b - sqrtd) / a
+        outside = (root <= t_min) | (root >= t_max)
+        root = np.where(outside, (-half_b + sqrtd) / a, root)
+        hit = (discriminant >= 0) & (root > t_min) & (root < t_max)
+    lanes, root = idx[hit], root[hit]
+    p = rays.at(root, lanes)
+    if np.ndim(center) == 2:
+        center = center[hit]
+    normal = (p - center) / radius
+    u, v = _sphere_uv_batch(normal)
+    rec.update(lanes, root, p, normal, u, v, mat)
+    return lanes
+
+
+def _sphere_occluded(r, cx, cy, cz, radius, t_min, t_max):
+    """``occluded`` of a sphere, the root test of its ``hit`` on floats."""
+    ox, oy, oz = r.origin.x - cx, r.origin.y - cy, r.origin.z - cz
+    dx, dy, dz = r.direction.x, r.direction.y, r.direction.z
+    a = dx * dx + dy * dy + dz * dz
+    half_b = ox * dx + oy * dy + oz * dz
+    c = ox * ox + oy * oy + oz * oz - radius * radius
+    discriminant = half_b * half_b - a * c
+    if discriminant < 0:
+        return False
+    sqrtd = math.sqrt(discriminant)
+    root = (-half_b - sqrtd) / a
+    if t_min < root < t_max:
+        return True
+    root = (-half_b + sqrtd) / a
+    return t_min < root < t_max
 
 
 class Sphere(Hittable):
@@ -54,10 +106,19 @@ class Sphere(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
+    def occluded(self, r, t_min, t_max):
+        c = self.center
+        return _sphere_occluded(r, c.x, c.y, c.z, self.radius, t_min, t_max)
+
+    def bounding_box(self, t0=None, t1=None):
         return Aabb(self.center - Vec3(self.radius),
                     self.center + Vec3(self.radius))
 
+    def hit_batch(self, rays, idx, t_min, rec):
+        return _sphere_hit_batch(rays, idx, t_min, rec,
+                                 np.array(tuple(self.center)), self.radius,
+                                 self.mat)
+
 
 class MovingSphere(Hittable):
 
@@ -106,40 +167,194 @@ class MovingSphere(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
+    def occluded(self, r, t_min, t_max):
+        # the center at the ray time, see :meth:`center`
+        f = (r.time - self.time0) / (self.time1 - self.time0)
+        c0, c1 = self.center0, self.center1
+        return _sphere_occluded(r, c0.x + f * (c1.x - c0.x),
+                                c0.y + f * (c1.y - c0.y),
+                                c0.z + f * (c1.z - c0.z), self.radius, t_min,
+                                t_max)
+
+    def bounding_box(self, t0=None, t1=None):
+        # the center moves on a line, so the boxes at both ends enclose it
+        if t0 is None or t1 is None:
+            center0, center1 = self.center0, self.center1
+        else:
+            center0, center1 = self.center(t0), self.center(t1)
         _radius = Vec3(self.radius)
-        box0 = Aabb(self.center0 - _radius, self.center0 + _radius)
-        box1 = Aabb(self.center1 - _radius, self.center1 + _radius)
+        box0 = Aabb(center0 - _radius, center0 + _radius)
+        box1 = Aabb(center1 - _radius, center1 + _radius)
         return Aabb.surrounding_box(box0, box1)
 
+    def hit_batch(self, rays, idx, t_min, rec):
+        center0 = np.array(tuple(self.center0))
+        f = (rays.time[idx] - self.time0) / (self.time1 - self.time0)
+        center = center0 + f[:, None] * (np.array(tuple(self.center1)) -
+                                         center0)
+        return _sphere_hit_batch(rays, idx, t_min, rec, center, self.radius,
+                                 self.mat)
 
-class Pyramid(Hittable):
 
-    def __init__(self, p1, p2, p3, p4, mat):
-        pyramid_center = (p1 + p2 + p3 + p4) / 4
-        obj_list = []
-        for p_list in itertools.combinations([p1, p2, p3, p4], 3):
-            surf = Triangle(*p_list, mat)
-            surf_center = sum(p_list) / 3
-            if Vec3.dot(surf.normal, pyramid_center - surf_center) > 0.:
-                obj_list.append(surf)
-            else:
-                obj_list.append(FlipNormals(surf))
+class ConvexPolyhedron(Hittable):
+    """Convex polyhedron intersected by clipping the ray with its faces.
+
+    Every face bounds the half-space ``dot(n, p) <= d`` with the outward
+    normal ``n``. The ray enters at the farthest entering plane and leaves
+    at the nearest leaving plane, so a single pass over the faces finds the
+    hit. Rays starting inside hit the leaving face. The normal is the
+    outward face normal and ``u, v`` are the coordinates of the point along
+    the first two edges of the face.
+
+    Args:
+        faces (list[list[Vec3]]): vertices of every face, in any winding
+        mat (Material): material
+    """
+
+    def __init__(self, faces, mat):
+        vertices = [p for face in faces for p in face]
+        center = sum(vertices, Vec3()) / len(vertices)
 
         self.mat = mat
-        self.hit_obj_list = HittableList(obj_list)
-        self.p1, self.p2, self.p3, self.p4 = p1, p2, p3, p4
+        self.normals = []
+        self.planes = []
+        self.uv_frames = []
+        for face in faces:
+            p0 = face[0]
+            e1 = face[1] - p0
+            e2 = face[2] - p0
+            normal = Vec3.cross(e1, e2).normalize()
+            if Vec3.dot(normal, p0 - center) < 0.:
+                normal = -normal
+            self.normals.append(normal)
+            self.planes.append(
+                (normal.x, normal.y, normal.z, Vec3.dot(normal, p0)))
+
+            # dual vectors of the edges, u = dot(du, p - p0)
+            g11, g12, g22 = (Vec3.dot(e1, e1), Vec3.dot(e1, e2),
+                             Vec3.dot(e2, e2))
+            det = g11 * g22 - g12 * g12
+            du = (g22 * e1 - g12 * e2) / det
+            dv = (g11 * e2 - g12 * e1) / det
+            self.uv_frames.append((p0, du, dv))
+
+        self.bbox = Aabb(
+            Vec3(*[min(p[axis] for p in vertices) for axis in range(3)]),
+            Vec3(*[max(p[axis] for p in vertices) for axis in range(3)]))
 
     def hit(self, r, t_min, t_max):
-        return self.hit_obj_list.hit(r, t_min, t_max)
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        dx, dy, dz = r.direction.x, r.direction.y, r.direction.z
+        t0, t1 = -float('inf'), float('inf')
+        face0 = face1 = None
+        for face, (nx, ny, nz, d) in enumerate(self.planes):
+            denom = nx * dx + ny * dy + nz * dz
+            dist = d - (nx * ox + ny * oy + nz * oz)
+            if denom < 0.:
+                t = dist / denom
+                if t > t0:
+                    t0, face0 = t, face
+            elif denom > 0.:
+                t = dist / denom
+                if t < t1:
+                    t1, face1 = t, face
+            elif dist < 0.:
+                # parallel to the face and outside of it
+                return None
+            if t0 > t1:
+                return None
 
-    def bounding_box(self):
-        p_list = [self.p1, self.p2, self.p3, self.p4]
-        min_x, max_x = min([p[0] for p in p_list]), max([p[0] for p in p_list])
-        min_y, max_y = min([p[1] for p in p_list]), max([p[1] for p in p_list])
-        min_z, max_z = min([p[2] for p in p_list]), max([p[2] for p in p_list])
+        if face0 is not None and t_min <= t0 <= t_max:
+            t, face = t0, face0
+        elif face1 is not None and t_min <= t1 <= t_max:
+            t, face = t1, face1
+        else:
+            return None
 
-        return Aabb(Vec3(min_x, min_y, min_z), Vec3(max_x, max_y, max_z))
+        hit_rec = HitRecord()
+        hit_rec.p = r.at(t)
+        hit_rec.t = t
+        hit_rec.normal = self.normals[face]
+        hit_rec.mat = self.mat
+        p0, du, dv = self.uv_frames[face]
+        rel = hit_rec.p - p0
+        hit_rec.u = Vec3.dot(du, rel)
+        hit_rec.v = Vec3.dot(dv, rel)
+        return hit_rec
+
+    def occluded(self, r, t_min, t_max):
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        dx, dy, dz = r.direction.x, r.direction.y, r.direction.z
+        # without an entering or leaving face t0 or t1 stays infinite
+        t0, t1 = -float('inf'), float('inf')
+        for nx, ny, nz, d in self.planes:
+            denom = nx * dx + ny * dy + nz * dz
+            dist = d - (nx * ox + ny * oy + nz * oz)
+            if denom < 0.:
+                t = dist / denom
+                if t > t0:
+                    t0 = t
+            elif denom > 0.:
+                t = dist / denom
+                if t < t1:
+                    t1 = t
+            elif dist < 0.:
+                return False
+            if t0 > t1:
+                return False
+        return (t0 > -float('inf') and t_min <= t0 <= t_max) or (
+            t1 < float('inf') and t_min <= t1 <= t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        origin, direction = rays.origin[idx], rays.direction[idx]
+        n = len(idx)
+        t0, t1 = np.full(n, -np.inf), np.full(n, np.inf)
+        face0, face1 = np.full(n, -1), np.full(n, -1)
+        inside = np.ones(n, dtype=bool)
+        planes = np.array(self.planes)
+        denoms = direction @ planes[:, :3].T
+        dists = planes[:, 3] - origin @ planes[:, :3].T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for face in range(len(planes)):
+                denom, dist = denoms[:, face], dists[:, face]
+                t = dist / denom
+                enter = (denom < 0.) & (t > t0)
+                t0[enter], face0[enter] = t[enter], face
+                leave = (denom > 0.) & (t < t1)
+                t1[leave], face1[leave] = t[leave], face
+                # parallel to the face and outside of it
+                inside &= (denom != 0.) | (dist >= 0.)
+        t_max = rec.t[idx]
+        inside &= t0 <= t1
+        front = inside & (face0 >= 0) & (t_min <= t0) & (t0 <= t_max)
+        back = (inside & ~front & (face1 >= 0) & (t_min <= t1) &
+                (t1 <= t_max))
+        hit = front | back
+        lanes = idx[hit]
+        t = np.where(front, t0, t1)[hit]
+        face = np.where(front, face0, face1)[hit]
+        p = rays.at(t, lanes)
+        p0, du, dv = (np.array([[tuple(vec) for vec in frame]
+                                for frame in self.uv_frames])[:, k]
+                      for k in range(3))
+        rel = p - p0[face]
+        rec.update(lanes, t, p,
+                   np.array([tuple(normal) for normal in self.normals])[face],
+                   (du[face] * rel).sum(axis=1), (dv[face] * rel).sum(axis=1),
+                   self.mat)
+        return lanes
+
+    def bounding_box(self, t0=None, t1=None):
+        return self.bbox
+
+
+class Pyramid(ConvexPolyhedron):
+    """Tetrahedron with the corners ``p1`` to ``p4``."""
+
+    def __init__(self, p1, p2, p3, p4, mat):
+        super().__init__(list(itertools.combinations([p1, p2, p3, p4], 3)),
+                         mat)
+        self.p1, self.p2, self.p3, self.p4 = p1, p2, p3, p4
 
 
 class Cylinder(Hittable):
@@ -222,7 +437,56 @@ class Cylinder(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
+    def hit_batch(self, rays, idx, t_min, rec):
+        origin, direction = rays.origin[idx], rays.direction[idx]
+        center = np.array(tuple(self.center))
+        y1 = center[1] + self.height / 2
+        y2 = center[1] - self.height / 2
+        temp_t = rec.t[idx].copy()
+        hit_t = np.full(len(idx), np.nan)
+        normal = np.zeros((len(idx), 3))
+
+        def accept(t, ok, n):
+            hit_t[ok], temp_t[ok], normal[ok] = t[ok], t[ok], n[ok]
+
+        # the two bottom surfaces
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for y, ny in ((y1, 1.), (y2, -1.)):
+                surf_center = np.array((center[0], y, center[2]))
+                t = (y - origin[:, 1]) / direction[:, 1]
+                p = origin + t[:, None] * direction
+                dist = np.sqrt(((p - surf_center)**2).sum(axis=1))
+                ok = ((direction[:, 1] != 0.) & (dist < self.radius) &
+                      (t_min < t) & (t < temp_t))
+                accept(t, ok, np.broadcast_to((0., ny, 0.), p.shape))
+
+            # the side, the far root is tested with the near one like in
+            # the scalar hit
+            oc = origin[:, (0, 2)] - center[[0, 2]]
+            d = direction[:, (0, 2)]
+            a = (d * d).sum(axis=1)
+            half_b = (oc * d).sum(axis=1)
+            c = (oc * oc).sum(axis=1) - self.radius * self.radius
+            discriminant = half_b * half_b - a * c
+            side = (a != 0.) & (discriminant >= 0.)
+            sqrtd = np.sqrt(discriminant)
+            t1 = (-half_b - sqrtd) / a
+            for t in (t1, (-half_b + sqrtd) / a):
+                p = origin + t[:, None] * direction
+                radial = p - center
+                radial[:, 1] = 0.
+                radial /= np.sqrt((radial * radial).sum(axis=1))[:, None]
+                ok = (side & (y2 < p[:, 1]) & (p[:, 1] < y1) & (t_min < t1) &
+                      (t1 < temp_t))
+                accept(t, ok, radial)
+
+        hit = ~np.isnan(hit_t)
+        lanes = idx[hit]
+        rec.update(lanes, hit_t[hit], rays.at(hit_t[hit], lanes), normal[hit],
+                   0., 0., self.mat)
+        return lanes
+
+    def bounding_box(self, t0=None, t1=None):
         _min = Vec3(self.center.x - self.radius,
                     self.center.y - self.height / 2,
                     self.center.z - self.radius)
@@ -232,27 +496,132 @@ class Cylinder(Hittable):
         return Aabb(_min, _max)
 
 
+# outward normals of the min and max face of every axis
+_BOX_NORMALS = (
+    (Vec3(-1, 0, 0), Vec3(1, 0, 0)),
+    (Vec3(0, -1, 0), Vec3(0, 1, 0)),
+    (Vec3(0, 0, -1), Vec3(0, 0, 1)),
+)
+
+
 class Box(Hittable):
+    """Axis aligned box intersected with a single slab test.
 
-    def __init__(self, p_min, p_max, mat):
-        obj_list = [
-            XyRect(p_min.x, p_max.x, p_min.y, p_max.y, p_max.z, mat),
-            FlipNormals(
-                XyRect(p_min.x, p_max.x, p_min.y, p_max.y, p_min.z, mat)),
-            XzRect(p_min.x, p_max.x, p_min.z, p_max.z, p_max.y, mat),
-            FlipNormals(
-                XzRect(p_min.x, p_max.x, p_min.z, p_max.z, p_min.y, mat)),
-            YzRect(p_min.y, p_max.y, p_min.z, p_max.z, p_max.x, mat),
-            FlipNormals(
-                YzRect(p_min.y, p_max.y, p_min.z, p_max.z, p_min.x, mat))
-        ]
+    Normals point outward and ``u, v`` follow the rect of the same face,
+    ``(z, y)`` on the x faces, ``(x, z)`` on the y faces and ``(x, y)`` on
+    the z faces.
+    """
 
+    def __init__(self, p_min, p_max, mat):
         self.p_min = p_min
         self.p_max = p_max
-        self.hit_obj_list = HittableList(obj_list)
+        self.mat = mat
+        self.bounds = (p_min.x, p_min.y, p_min.z, p_max.x, p_max.y, p_max.z)
 
     def hit(self, r, t_min, t_max):
-        return self.hit_obj_list.hit(r, t_min, t_max)
+        b = self.bounds
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        ix, iy, iz = r.inv_direction
+        sx, sy, sz = r.sign
+        # entering and leaving distance and the axis of their face
+        t0 = (b[3 * sx] - ox) * ix
+        t1 = (b[3 - 3 * sx] - ox) * ix
+        axis0 = axis1 = 0
+        t = (b[1 + 3 * sy] - oy) * iy
+        if t > t0:
+            t0, axis0 = t, 1
+        t = (b[4 - 3 * sy] - oy) * iy
+        if t < t1:
+            t1, axis1 = t, 1
+        t = (b[2 + 3 * sz] - oz) * iz
+        if t > t0:
+            t0, axis0 = t, 2
+        t = (b[5 - 3 * sz] - oz) * iz
+        if t < t1:
+            t1, axis1 = t, 2
+        if t0 > t1:
+            return None
+
+        # rays enter through the min face of the axes they go up along and
+        # leave through the max face, rays starting inside hit the latter
+        if t_min <= t0 <= t_max:
+            t, axis, side = t0, axis0, r.sign[axis0]
+        elif t_min <= t1 <= t_max:
+            t, axis, side = t1, axis1, 1 - r.sign[axis1]
+        else:
+            return None
+
+        hit_rec = HitRecord()
+        p = r.at(t)
+        hit_rec.p = p
+        hit_rec.t = t
+        hit_rec.normal = _BOX_NORMALS[axis][side]
+        hit_rec.mat = self.mat
+        if axis == 0:
+            hit_rec.u = (p.z - b[2]) / (b[5] - b[2])
+            hit_rec.v = (p.y - b[1]) / (b[4] - b[1])
+        elif axis == 1:
+            hit_rec.u = (p.x - b[0]) / (b[3] - b[0])
+            hit_rec.v = (p.z - b[2]) / (b[5] - b[2])
+        else:
+            hit_rec.u = (p.x - b[0]) / (b[3] - b[0])
+            hit_rec.v = (p.y - b[1]) / (b[4] - b[1])
+        return hit_rec
 
-    def bounding_box(self):
+    def occluded(self, r, t_min, t_max):
+        # the slab test of ``hit`` without the face axes
+        b = self.bounds
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        ix, iy, iz = r.inv_direction
+        sx, sy, sz = r.sign
+        t0 = (b[3 * sx] - ox) * ix
+        t1 = (b[3 - 3 * sx] - ox) * ix
+        t = (b[1 + 3 * sy] - oy) * iy
+        if t > t0:
+            t0 = t
+        t = (b[4 - 3 * sy] - oy) * iy
+        if t < t1:
+            t1 = t
+        t = (b[2 + 3 * sz] - oz) * iz
+        if t > t0:
+            t0 = t
+        t = (b[5 - 3 * sz] - oz) * iz
+        if t < t1:
+            t1 = t
+        if t0 > t1:
+            return False
+        return t_min <= t0 <= t_max or t_min <= t1 <= t_max
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        b = np.array(self.bounds)
+        origin, inv_direction = rays.origin[idx], rays.inv_direction[idx]
+        sign = rays.sign[idx]
+        axes = np.arange(3)
+        near = (b[axes + 3 * sign] - origin) * inv_direction
+        far = (b[axes + 3 - 3 * sign] - origin) * inv_direction
+        # the first axis wins ties like in the scalar hit
+        axis0, axis1 = near.argmax(axis=1), far.argmin(axis=1)
+        lane = np.arange(len(idx))
+        t0, t1 = near[lane, axis0], far[lane, axis1]
+        t_max = rec.t[idx]
+        front = (t0 <= t1) & (t_min <= t0) & (t0 <= t_max)
+        back = (t0 <= t1) & ~front & (t_min <= t1) & (t1 <= t_max)
+        hit = front | back
+        lanes = idx[hit]
+        t = np.where(front, t0, t1)[hit]
+        axis = np.where(front, axis0, axis1)[hit]
+        side = np.where(front, sign[lane, axis0], ~sign[lane, axis1])[hit]
+        p = rays.at(t, lanes)
+        normal = np.zeros((len(t), 3))
+        normal[np.arange(len(t)), axis] = np.where(side, 1., -1.)
+        # u, v follow the rect of the face
+        u_axis = np.array((2, 0, 0))[axis]
+        v_axis = np.array((1, 2, 1))[axis]
+        rows = np.arange(len(t))
+        u = (p[rows, u_axis] - b[u_axis]) / (b[u_axis + 3] - b[u_axis])
+        v = (p[rows, v_axis] - b[v_axis]) / (b[v_axis + 3] - b[v_axis])
+        rec.update(lanes, t, p, normal, u, v, self.mat)
+        return lanes
+
+    def bounding_box(self, t0=None, t1=None):
         return Aabb(self.p_min, self.p_max)
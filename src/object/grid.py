@@ -0,0 +1,186 @@
+from array import array
+
+import numpy as np
+
+from .hittable import Hittable, Aabb, slab_entry
+
+
+class UniformGrid(Hittable):
+    """Uniform grid of cells listing the objects overlapping them.
+
+    The grid covers the box of all objects with about ``density`` cells per
+    object, cells are close to cubes and at most ``max_resolution`` cells
+    span an axis. Cell ``(x, y, z)`` lists the objects whose box overlaps
+    it in ``cell_objs[cell_starts[c]:cell_starts[c + 1]]`` with
+    ``c = (x * ny + y) * nz + z``.
+
+    ``hit`` walks the cells pierced by the ray front to back with 3D-DDA
+    and stops in the first cell the closest hit so far lies in, ``occluded``
+    stops at the first hit. An object spanning several cells is tested only
+    once per ray. Grids build quickly
+    and suit many objects of similar size spread evenly over the scene, a
+    :class:`FlatBvh` adapts better to uneven scenes. Ray packets walk the
+    grid one ray at a time.
+
+    Args:
+        world (list|HittableList): bounded hittable objects
+        time0 (float, optional): shutter open time
+        time1 (float, optional): shutter close time, the cells hold the
+            objects over the whole interval
+        density (float): cells per object
+        max_resolution (int): largest number of cells along an axis
+    """
+
+    def __init__(self,
+                 world,
+                 time0=None,
+                 time1=None,
+                 density=4.,
+                 max_resolution=64):
+        self.objs = list(world)
+        assert len(self.objs) > 0, "UniformGrid needs at least one object"
+        boxes = [obj.bounding_box(time0, time1) for obj in self.objs]
+        assert all(box is not None for box in boxes), \
+            "UniformGrid objects must be bounded"
+        lo = np.array([box.bounds[:3] for box in boxes])
+        hi = np.array([box.bounds[3:] for box in boxes])
+
+        grid_lo = lo.min(axis=0)
+        grid_hi = hi.max(axis=0)
+        extent = grid_hi - grid_lo
+        # flat scenes get a thin slab of cells instead of empty volume
+        extent = np.maximum(extent, 1e-3 * extent.max())
+        if extent.max() <= 0.:
+            extent[:] = 1.
+        grid_hi = grid_lo + extent
+        self.bounds = tuple(grid_lo.tolist() + grid_hi.tolist())
+
+        cell_size = (np.prod(extent) / (density * len(self.objs)))**(1. / 3.)
+        resolution = np.clip(np.round(extent / cell_size), 1, max_resolution)
+        self.resolution = tuple(int(res) for res in resolution)
+        self.cell_size = tuple((extent / resolution).tolist())
+
+        # the range of cells overlapped by every box, borders are shared
+        res = np.array(self.resolution)
+        first = np.clip(((lo - grid_lo) / extent * res).astype(np.int64), 0,
+                        res - 1)
+        last = np.clip(((hi - grid_lo) / extent * res).astype(np.int64), 0,
+                       res - 1)
+        nx, ny, nz = self.resolution
+        cell_ids = []
+        for (x0, y0, z0), (x1, y1, z1) in zip(first.tolist(), last.tolist()):
+            ids = ((np.arange(x0, x1 + 1)[:, None, None] * ny +
+                    np.arange(y0, y1 + 1)[None, :, None]) * nz +
+                   np.arange(z0, z1 + 1)[None, None, :])
+            cell_ids.append(ids.ravel())
+        obj_ids = np.repeat(np.arange(len(self.objs)),
+                            [len(ids) for ids in cell_ids])
+        cell_ids = np.concatenate(cell_ids)
+        order = np.argsort(cell_ids, kind='stable')
+        starts = np.zeros(nx * ny * nz + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_ids, minlength=nx * ny * nz),
+                  out=starts[1:])
+        self.cell_starts = array('l', starts.tolist())
+        self.cell_objs = array('l', obj_ids[order].tolist())
+
+    def __len__(self):
+        return len(self.cell_starts) - 1
+
+    def bounding_box(self, t0=None, t1=None):
+        return Aabb.from_bounds(self.bounds)
+
+    def hit(self, r, t_min, t_max):
+        return self._traverse(r, t_min, t_max, False)
+
+    def occluded(self, r, t_min, t_max):
+        return self._traverse(r, t_min, t_max, True)
+
+    def _traverse(self, r, t_min, t_max, any_hit):
+        """Walk the cells of the ray.
+
+        Returns:
+            HitRecord|None|bool: the closest hit, or with ``any_hit``
+            whether there is a hit
+        """
+        t = slab_entry(self.bounds, 0, r, t_min, t_max)
+        if t is None:
+            return False if any_hit else None
+
+        nx, ny, nz = self.resolution
+        sx, sy, sz = self.cell_size
+        bounds = self.bounds
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        ix, iy, iz = r.inv_direction
+        # cell of the point the ray enters the grid at
+        gx = min(max(int((ox + t * r.direction.x - bounds[0]) / sx), 0),
+                 nx - 1)
+        gy = min(max(int((oy + t * r.direction.y - bounds[1]) / sy), 0),
+                 ny - 1)
+        gz = min(max(int((oz + t * r.direction.z - bounds[2]) / sz), 0),
+                 nz - 1)
+
+        # per axis the step, the distance to the next cell border and the
+        # distance between borders
+        if r.sign[0]:
+            step_x, end_x = -1, -1
+            next_x = (bounds[0] + gx * sx - ox) * ix
+        else:
+            step_x, end_x = 1, nx
+            next_x = (bounds[0] + (gx + 1) * sx - ox) * ix
+        if r.sign[1]:
+            step_y, end_y = -1, -1
+            next_y = (bounds[1] + gy * sy - oy) * iy
+        else:
+            step_y, end_y = 1, ny
+            next_y = (bounds[1] + (gy + 1) * sy - oy) * iy
+        if r.sign[2]:
+            step_z, end_z = -1, -1
+            next_z = (bounds[2] + gz * sz - oz) * iz
+        else:
+            step_z, end_z = 1, nz
+            next_z = (bounds[2] + (gz + 1) * sz - oz) * iz
+        delta_x, delta_y, delta_z = abs(sx * ix), abs(sy * iy), abs(sz * iz)
+
+        objs, starts, cell_objs = self.objs, self.cell_starts, self.cell_objs
+        tested = set()
+        hit_rec = None
+        while True:
+            cell = (gx * ny + gy) * nz + gz
+            for k in range(starts[cell], starts[cell + 1]):
+                idx = cell_objs[k]
+                if idx in tested:
+                    continue
+                tested.add(idx)
+                if any_hit:
+                    if objs[idx].occluded(r, t_min, t_max):
+                        return True
+                    continue
+                temp_hit_rec = objs[idx].hit(r, t_min, t_max)
+                if temp_hit_rec is not None:
+                    hit_rec = temp_hit_rec
+                    t_max = temp_hit_rec.t
+
+            # leave the cell through its nearest border, unless the closest
+            # hit or the end of the ray lies before it
+            if next_x < next_y and next_x < next_z:
+                if t_max <= next_x:
+                    break
+                gx += step_x
+                if gx == end_x:
+                    break
+                next_x += delta_x
+            elif next_y < next_z:
+                if t_max <= next_y:
+                    break
+                gy += step_y
+                if gy == end_y:
+                    break
+                next_y += delta_y
+            else:
+                if t_max <= next_z:
+                    break
+                gz += step_z
+                if gz == end_z:
+                    break
+                next_z += delta_z
+        return False if any_hit else hit_rec
@@ -0,0 +1,206 @@
+import numpy as np
+
+from .hittable import Hittable, Aabb
+from .element import XyRect, XzRect, YzRect, Triangle
+from .geometry import Sphere
+from .transform import FlipNormals
+
+# smallest number of primitives worth a group, below it the NumPy call
+# overhead exceeds a python loop over their ``hit``
+GROUP_MIN = 16
+
+
+class PrimitiveGroup(Hittable):
+    """Primitives of one type intersected with a single NumPy computation.
+
+    The parameters of the primitives are kept as structure of arrays, one
+    array per parameter. :meth:`nearest` intersects a ray with all of them
+    at once and only returns the index and distance of the closest hit, the
+    hit record is built afterwards by the ``hit`` of that primitive alone.
+    The arrays repeat the float operations of the scalar ``hit``, so both
+    find the same hits.
+
+    Args:
+        objs (list): primitives of the type of the group, each one may be
+            wrapped in a :class:`FlipNormals`
+    """
+
+    def __init__(self, objs):
+        self.objs = list(objs)
+        self.bbox = None
+        for obj in self.objs:
+            self.bbox = Aabb.surrounding_box(self.bbox, obj.bounding_box())
+        self.prims = [_unflipped(obj) for obj in self.objs]
+
+    def __len__(self):
+        return len(self.objs)
+
+    def bounding_box(self, t0=None, t1=None):
+        return self.bbox
+
+    def nearest(self, r, t_min, t_max):
+        """Closest hit of the group.
+
+        Returns:
+            tuple|None: ``(index, t)`` of the closest hit primitive
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = self._distances(r, t_min, t_max)
+        idx = int(np.argmin(t))
+        if t[idx] == np.inf:
+            return None
+        return idx, float(t[idx])
+
+    def _distances(self, r, t_min, t_max):
+        """``(n,)`` hit distances of every primitive, ``inf`` for misses."""
+        raise NotImplementedError
+
+    def hit(self, r, t_min, t_max):
+        closest = self.nearest(r, t_min, t_max)
+        if closest is None:
+            return None
+        return self.objs[closest[0]].hit(r, t_min, t_max)
+
+    def occluded(self, r, t_min, t_max):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return bool((self._distances(r, t_min, t_max) < np.inf).any())
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        # packets are wide already, the members trace them one by one
+        hits = [obj.hit_batch(rays, idx, t_min, rec) for obj in self.objs]
+        return np.unique(np.concatenate(hits))
+
+
+def _unflipped(obj):
+    return obj.obj if type(obj) is FlipNormals else obj
+
+
+class SphereGroup(PrimitiveGroup):
+
+    def __init__(self, objs):
+        super().__init__(objs)
+        self.centers = np.array([(s.center.x, s.center.y, s.center.z)
+                                 for s in self.prims]).T
+        self.radii2 = np.array([s.radius * s.radius for s in self.prims])
+
+    def _distances(self, r, t_min, t_max):
+        d = r.direction
+        ocx = r.origin.x - self.centers[0]
+        ocy = r.origin.y - self.centers[1]
+        ocz = r.origin.z - self.centers[2]
+        a = d.x * d.x + d.y * d.y + d.z * d.z
+        half_b = ocx * d.x + ocy * d.y + ocz * d.z
+        c = ocx * ocx + ocy * ocy + ocz * ocz - self.radii2
+        discriminant = half_b * half_b - a * c
+        sqrtd = np.sqrt(discriminant)
+
+        # the near root, else the far one
+        root = (-half_b - sqrtd) / a
+        outside = (root <= t_min) | (root >= t_max)
+        root = np.where(outside, (-half_b + sqrtd) / a, root)
+        valid = (discriminant >= 0) & (root > t_min) & (root < t_max)
+        return np.where(valid, root, np.inf)
+
+
+class RectGroup(PrimitiveGroup):
+    """Axis aligned rectangles of one of the rectangle classes."""
+
+    # plane axis and the two in-plane axes with their bound attributes
+    AXES = {
+        XyRect: (2, (0, 'x0', 'x1'), (1, 'y0', 'y1')),
+        XzRect: (1, (0, 'x0', 'x1'), (2, 'z0', 'z1')),
+        YzRect: (0, (1, 'y0', 'y1'), (2, 'z0', 'z1')),
+    }
+
+    def __init__(self, objs):
+        super().__init__(objs)
+        self.axis, (self.axis_a, a0, a1), (self.axis_b, b0, b1) = \
+            self.AXES[type(self.prims[0])]
+        self.k = np.array([rect.k for rect in self.prims], dtype=float)
+        self.bounds = np.array(
+            [[getattr(rect, name) for rect in self.prims]
+             for name in (a0, a1, b0, b1)],
+            dtype=float)
+
+    def _distances(self, r, t_min, t_max):
+        origin = (r.origin.x, r.origin.y, r.origin.z)
+        direction = (r.direction.x, r.direction.y, r.direction.z)
+        t = (self.k - origin[self.axis]) / direction[self.axis]
+        p_a = origin[self.axis_a] + t * direction[self.axis_a]
+        p_b = origin[self.axis_b] + t * direction[self.axis_b]
+        a0, a1, b0, b1 = self.bounds
+        valid = ((t >= t_min) & (t <= t_max) & (p_a >= a0) & (p_a <= a1) &
+                 (p_b >= b0) & (p_b <= b1))
+        return np.where(valid, t, np.inf)
+
+
+class TriangleGroup(PrimitiveGroup):
+
+    def __init__(self, objs):
+        super().__init__(objs)
+        p1 = np.array([tuple(tri.p1) for tri in self.prims])
+        self.p1 = p1.T
+        self.e1 = (np.array([tuple(tri.p2) for tri in self.prims]) - p1).T
+        self.e2 = (np.array([tuple(tri.p3) for tri in self.prims]) - p1).T
+
+    def _distances(self, r, t_min, t_max):
+        d = r.direction
+        e1x, e1y, e1z = self.e1
+        e2x, e2y, e2z = self.e2
+        px = d.y * e2z - d.z * e2y
+        py = d.z * e2x - d.x * e2z
+        pz = d.x * e2y - d.y * e2x
+        det = e1x * px + e1y * py + e1z * pz
+        inv_det = 1.0 / det
+        tx = r.origin.x - self.p1[0]
+        ty = r.origin.y - self.p1[1]
+        tz = r.origin.z - self.p1[2]
+        u = (tx * px + ty * py + tz * pz) * inv_det
+        qx = ty * e1z - tz * e1y
+        qy = tz * e1x - tx * e1z
+        qz = tx * e1y - ty * e1x
+        v = (d.x * qx + d.y * qy + d.z * qz) * inv_det
+        t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+        valid = ((det != 0.) & (u >= 0) & (u <= 1) & (v >= 0) &
+                 (u + v <= 1) & (t > 0.00001) & (t > t_min) & (t < t_max))
+        return np.where(valid, t, np.inf)
+
+
+# group class of every groupable primitive type
+GROUPS = {
+    Sphere: SphereGroup,
+    XyRect: RectGroup,
+    XzRect: RectGroup,
+    YzRect: RectGroup,
+    Triangle: TriangleGroup,
+}
+
+
+def group_primitives(objs, min_size=GROUP_MIN):
+    """Compile primitives of the same type into :class:`PrimitiveGroup` s.
+
+    Spheres, triangles and rectangles of each orientation, also when wrapped
+    in a :class:`FlipNormals`, are collected per type. Types with at least
+    ``min_size`` primitives become one group, the other objects are kept as
+    they are.
+
+    Args:
+        objs (list|HittableList): objects
+        min_size (int): smallest number of primitives of a group
+
+    Returns:
+        list: the ungrouped objects in their order followed by the groups
+    """
+    by_type = {}
+    for obj in objs:
+        cls = type(_unflipped(obj))
+        if cls in GROUPS:
+            by_type.setdefault(cls, []).append(obj)
+    grouped = {
+        cls: prims
+        for cls, prims in by_type.items() if len(prims) >= min_size
+    }
+    members = {id(obj) for prims in grouped.values() for obj in prims}
+    return [obj for obj in objs if id(obj) not in members] + [
+        GROUPS[cls](prims) for cls, prims in grouped.items()
+    ]
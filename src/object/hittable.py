@@ -1,6 +1,8 @@
-import random
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+import rng
 from vec import Vec3, Point
 from material import Material
 from ray import Ray
@@ -13,15 +15,150 @@ class Hittable(ABC):
         pass
 
     @abstractmethod
-    def bounding_box(self):
+    def bounding_box(self, t0=None, t1=None):
+        """Box enclosing the object at every time from ``t0`` to ``t1``.
+
+        Args:
+            t0 (float, optional): start time
+            t1 (float, optional): end time, without both times the box
+                encloses the whole motion of the object
+
+        Returns:
+            Aabb|None: the box, ``None`` if the object is unbounded
+        """
         pass
 
+    def occluded(self, r, t_min, t_max):
+        """Whether the object blocks the ray between ``t_min`` and ``t_max``.
+
+        Shadow and visibility rays only need this answer, not the closest
+        hit, so objects override it to stop at the first intersection
+        without building a :class:`HitRecord`. This default tests
+        :meth:`hit`.
+
+        Args:
+            r (Ray): ray
+            t_min (float): start of the ray segment
+            t_max (float): end of the ray segment
+
+        Returns:
+            bool: ``True`` if the segment intersects the object
+        """
+        return self.hit(r, t_min, t_max) is not None
+
     def pdf_value(self, origin, direction):
         raise NotImplementedError
 
     def random(self, origin):
         raise NotImplementedError
 
+    def hit_batch(self, rays, idx, t_min, rec):
+        """Intersect the rays ``idx`` of a batch and keep the closer hits.
+
+        Hits closer than ``rec.t`` are written to ``rec``, so the closest
+        hit so far bounds the search like ``t_max`` of :meth:`hit`. This
+        default traces the rays one by one with :meth:`hit`, vectorized
+        objects override it.
+
+        Args:
+            rays (RayBatch): rays
+            idx (np.ndarray): indices of the rays to trace
+            t_min (float): start of the ray segments
+            rec (HitBatch): closest hits of all rays of the batch
+
+        Returns:
+            np.ndarray: indices of the rays whose hit was replaced
+        """
+        hits = []
+        for k in idx.tolist():
+            hit_rec = self.hit(rays.ray(k), t_min, float(rec.t[k]))
+            if hit_rec is not None:
+                rec.set_record(k, hit_rec)
+                hits.append(k)
+        return np.array(hits, dtype=np.int64)
+
+    def pdf_value_batch(self, origin, direction):
+        """``(n,)`` array of :meth:`pdf_value` for ``(n, 3)`` arrays."""
+        return np.array([
+            self.pdf_value(Point(*o), Vec3(*d))
+            for o, d in zip(origin.tolist(), direction.tolist())
+        ])
+
+    def random_batch(self, origin, streams, idx):
+        """``(n, 3)`` array of :meth:`random` for the ``(n, 3)`` origins,
+        drawing from the streams ``idx``."""
+        directions = np.empty_like(origin)
+        state = rng.get_state()
+        for k, (o, path) in enumerate(zip(origin.tolist(), idx.tolist())):
+            # the scalar sampler draws from the stream of the path
+            rng.set_state(int(streams.keys[path]),
+                          int(streams.counters[path]))
+            directions[k] = tuple(self.random(Point(*o)))
+            streams.counters[path] = rng.get_state()[1]
+        rng.set_state(*state)
+        return directions
+
+
+class HitBatch():
+    """Closest hits of a batch of rays as structure of arrays.
+
+    The packet counterpart of :class:`HitRecord`. Rays without a hit keep
+    ``t`` at its initial value and ``mat`` at ``None``.
+
+    Args:
+        n (int): number of rays
+        t_max (float|np.ndarray): end of the ray segments
+    """
+
+    def __init__(self, n, t_max=float('inf')):
+        self.t = np.empty(n)
+        self.t[:] = t_max
+        self.p = np.zeros((n, 3))
+        self.normal = np.zeros((n, 3))
+        self.u = np.zeros(n)
+        self.v = np.zeros(n)
+        self.mat = np.full(n, None, dtype=object)
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def hit(self):
+        """Boolean mask of the rays that hit something."""
+        return self.mat != None  # noqa: E711
+
+    def update(self, lanes, t, p, normal, u, v, mat):
+        """Replace the hits of the rays ``lanes``, arrays broadcast."""
+        self.t[lanes] = t
+        self.p[lanes] = p
+        self.normal[lanes] = normal
+        self.u[lanes] = u
+        self.v[lanes] = v
+        self.mat[lanes] = mat
+
+    def set_record(self, k, hit_rec):
+        """Replace the hit of ray ``k`` by a :class:`HitRecord`."""
+        self.t[k] = hit_rec.t
+        self.p[k] = tuple(hit_rec.p)
+        self.normal[k] = tuple(hit_rec.normal)
+        self.u[k] = hit_rec.u
+        self.v[k] = hit_rec.v
+        self.mat[k] = hit_rec.mat
+
+    def take(self, idx):
+        """Hits of the rays ``idx``."""
+        rec = HitBatch(0)
+        rec.t, rec.p, rec.normal = self.t[idx], self.p[idx], self.normal[idx]
+        rec.u, rec.v, rec.mat = self.u[idx], self.v[idx], self.mat[idx]
+        return rec
+
+    def put(self, idx, rec, lanes):
+        """Copy the hits ``lanes`` of ``rec`` back to the rays
+        ``idx[lanes]``."""
+        self.update(idx[lanes], rec.t[lanes], rec.p[lanes],
+                    rec.normal[lanes], rec.u[lanes], rec.v[lanes],
+                    rec.mat[lanes])
+
 
 class HitRecord():
 
@@ -52,6 +189,10 @@ class HitRecord():
 
 class HittableList(Hittable):
 
+    # lists with at least this many bounded objects cull them with one batch
+    # slab test of their boxes instead of calling every ``hit``
+    BATCH_MIN = 16
+
     def __init__(self, *args):
         if len(args) == 0:
             self.objs = list()
@@ -61,6 +202,7 @@ class HittableList(Hittable):
             self.objs = list(hittable_objs)
         else:
             raise TypeError("HittableList accepts at most 1 params!")
+        self._boxes = None
 
     def append(self, to_append):
         assert isinstance(to_append, Hittable), "hittable_obj must be Hittable"
@@ -68,6 +210,7 @@ class HittableList(Hittable):
             self.objs += to_append.objs
         else:
             self.objs.append(to_append)
+        self._boxes = None
         return self
 
     def __getitem__(self, key):
@@ -75,14 +218,15 @@ class HittableList(Hittable):
 
     def __setitem__(self, key, val):
         self.objs[key] = val
+        self._boxes = None
 
     def __len__(self):
         return len(self.objs)
 
-    def bounding_box(self):
+    def bounding_box(self, t0=None, t1=None):
         box = None
         for obj in self.objs:
-            box = Aabb.surrounding_box(box, obj.bounding_box())
+            box = Aabb.surrounding_box(box, obj.bounding_box(t0, t1))
         return box
 
     def hit(self, r, t_min, t_max):
@@ -90,6 +234,9 @@ class HittableList(Hittable):
         assert isinstance(t_min, (float, int)), "t_min must be scalar"
         assert isinstance(t_max, (float, int)), "t_max must be scalar"
 
+        if len(self.objs) >= self.BATCH_MIN and self._batch_boxes():
+            return self._batch_hit(r, t_min, t_max)
+
         hit_rec = None
         temp_t = t_max
 
@@ -101,6 +248,61 @@ class HittableList(Hittable):
 
         return hit_rec
 
+    def occluded(self, r, t_min, t_max):
+        assert isinstance(r, Ray), "r must be Ray"
+        assert isinstance(t_min, (float, int)), "t_min must be scalar"
+        assert isinstance(t_max, (float, int)), "t_max must be scalar"
+
+        objs = self.objs
+        if len(objs) >= self.BATCH_MIN and self._batch_boxes():
+            # any hit will do, so the entered boxes are tested in list order
+            _, lo, hi = self._boxes
+            entered = slab_entries(lo, hi, r, t_min, t_max) < np.inf
+            objs = [objs[idx] for idx in np.flatnonzero(entered).tolist()]
+        for hittable_obj in objs:
+            if hittable_obj.occluded(r, t_min, t_max):
+                return True
+        return False
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        hits = [obj.hit_batch(rays, idx, t_min, rec) for obj in self.objs]
+        if not hits:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(hits))
+
+    def _batch_boxes(self):
+        """Cache ``(n_objs, lo, hi)`` box corner arrays of the objects.
+
+        Returns:
+            bool: ``False`` if an object is unbounded and cannot be culled
+        """
+        n = len(self.objs)
+        if self._boxes is None or self._boxes[0] != n:
+            boxes = [obj.bounding_box() for obj in self.objs]
+            if any(box is None for box in boxes):
+                self._boxes = (n, None, None)
+            else:
+                self._boxes = (n, np.array([box.bounds[:3] for box in boxes]),
+                               np.array([box.bounds[3:] for box in boxes]))
+        return self._boxes[1] is not None
+
+    def _batch_hit(self, r, t_min, t_max):
+        _, lo, hi = self._boxes
+        entries = slab_entries(lo, hi, r, t_min, t_max)
+        order = np.argsort(entries).tolist()
+        entries = entries.tolist()
+        hit_rec = None
+        # nearest boxes first, stop at the first one behind the closest hit,
+        # missed boxes are entered at inf
+        for idx in order:
+            if entries[idx] >= t_max:
+                break
+            temp_hit_rec = self.objs[idx].hit(r, t_min, t_max)
+            if temp_hit_rec is not None:
+                hit_rec = temp_hit_rec
+                t_max = temp_hit_rec.t
+        return hit_rec
+
 
 def fmin(a, b):
     return a if a < b else b
@@ -110,25 +312,127 @@ def fmax(a, b):
     return a if a > b else b
 
 
+def slab_entry(bounds, b, r, t_min, t_max):
+    """Distance at which a ray enters a box, ``None`` if it misses the box.
+
+    The near and far plane of every axis are picked by the precomputed
+    ``r.sign`` and distances use ``r.inv_direction``, so no division and no
+    branch on the direction is needed.
+
+    Args:
+        bounds (Sequence[float]): flat ``min_x, min_y, min_z, max_x, max_y,
+            max_z`` bounds of one or more boxes
+        b (int): offset of the box in ``bounds``
+        r (Ray): ray
+        t_min (float): start of the ray segment
+        t_max (float): end of the ray segment
+
+    Returns:
+        float|None: entry distance clamped to ``t_min``
+    """
+    ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+    ix, iy, iz = r.inv_direction
+    sx, sy, sz = r.sign
+    t0 = (bounds[b + 3 * sx] - ox) * ix
+    t1 = (bounds[b + 3 - 3 * sx] - ox) * ix
+    t = (bounds[b + 1 + 3 * sy] - oy) * iy
+    if t > t0:
+        t0 = t
+    t = (bounds[b + 4 - 3 * sy] - oy) * iy
+    if t < t1:
+        t1 = t
+    t = (bounds[b + 2 + 3 * sz] - oz) * iz
+    if t > t0:
+        t0 = t
+    t = (bounds[b + 5 - 3 * sz] - oz) * iz
+    if t < t1:
+        t1 = t
+    if t0 < t_min:
+        t0 = t_min
+    if t1 > t_max:
+        t1 = t_max
+    return t0 if t0 <= t1 else None
+
+
+def lerp_bounds(bounds0, bounds1, f):
+    """Interpolate flat box bounds, ``f`` is clamped to ``[0, 1]``."""
+    if f <= 0.:
+        return bounds0
+    if f >= 1.:
+        return bounds1
+    return [a + f * (b - a) for a, b in zip(bounds0, bounds1)]
+
+
+def slab_entries(lo, hi, r, t_min, t_max):
+    """Batch :func:`slab_entry` of one ray against many boxes.
+
+    Args:
+        lo (np.ndarray): ``(n, 3)`` minimum corners
+        hi (np.ndarray): ``(n, 3)`` maximum corners
+        r (Ray): ray
+        t_min (float): start of the ray segment
+        t_max (float): end of the ray segment
+
+    Returns:
+        np.ndarray: ``(n,)`` entry distances, ``inf`` for missed boxes
+    """
+    origin = np.array((r.origin.x, r.origin.y, r.origin.z))
+    inv_dir = np.array(r.inv_direction)
+    sign = np.array(r.sign, dtype=bool)
+    t_near = (np.where(sign, hi, lo) - origin) * inv_dir
+    t_far = (np.where(sign, lo, hi) - origin) * inv_dir
+    t0 = np.maximum(t_near.max(axis=1), t_min)
+    t1 = np.minimum(t_far.min(axis=1), t_max)
+    return np.where(t0 <= t1, t0, np.inf)
+
+
+def batch_slab_entries(bounds, rays, idx, t_min, t_max):
+    """Batch :func:`slab_entry` of many rays against one box.
+
+    Args:
+        bounds (Sequence[float]|np.ndarray): flat bounds of the box, or
+            ``(n, 6)`` bounds of a box per ray
+        rays (RayBatch): rays
+        idx (np.ndarray): ``(n,)`` indices of the tested rays
+        t_min (float): start of the ray segments
+        t_max (np.ndarray): ``(n,)`` ends of the ray segments
+
+    Returns:
+        np.ndarray: ``(n,)`` entry distances, ``inf`` for missed boxes
+    """
+    bounds = np.asarray(bounds)
+    lo, hi = bounds[..., :3], bounds[..., 3:]
+    origin = rays.origin[idx]
+    inv_dir = rays.inv_direction[idx]
+    sign = rays.sign[idx]
+    t_near = (np.where(sign, hi, lo) - origin) * inv_dir
+    t_far = (np.where(sign, lo, hi) - origin) * inv_dir
+    t0 = np.maximum(t_near.max(axis=1), t_min)
+    t1 = np.minimum(t_far.min(axis=1), t_max)
+    return np.where(t0 <= t1, t0, np.inf)
+
+
 class Aabb():
 
     def __init__(self, a, b):
         self._min = a
         self._max = b
+        self.bounds = (a.x, a.y, a.z, b.x, b.y, b.z)
+
+    @classmethod
+    def from_bounds(cls, bounds):
+        return cls(Vec3(bounds[0], bounds[1], bounds[2]),
+                   Vec3(bounds[3], bounds[4], bounds[5]))
 
     def hit(self, r, t_min, t_max):
-        for i in range(3):
-            div = 1.0 / r.direction[i]
-            t1 = (self._min[i] - r.origin[i]) * div
-            t2 = (self._max[i] - r.origin[i]) * div
-            if div < 0.:
-                t1, t2 = t2, t1
-            t_min = t1 if t1 > t_min else t_min
-            t_max = t2 if t2 < t_max else t_max
-            if t_max <= t_min:
-                return False
+        return slab_entry(self.bounds, 0, r, t_min, t_max) is not None
+
+    def area(self):
+        dx, dy, dz = self._max - self._min
+        return 2. * (dx * dy + dy * dz + dz * dx)
 
-        return True
+    def centroid(self):
+        return (self._min + self._max) / 2
 
     def surrounding_box(box0, box1):
         if box0 is None:
@@ -140,64 +444,191 @@ class Aabb():
         return Aabb(small, big)
 
 
-def compareX(obj):
-    box = obj.bounding_box()
-    assert box is not None
-    return box._min[0]
-
-
-def compareY(obj):
-    box = obj.bounding_box()
-    assert box is not None
-    return box._min[1]
-
-
-def compareZ(obj):
-    box = obj.bounding_box()
-    assert box is not None
-    return box._min[2]
-
-
 class BvhNode(Hittable):
-
-    def __init__(self, world, time0, time1):
-        axis = random.randint(0, 2)
-        if axis == 0:
-            world = sorted(world, key=compareX)
-        elif axis == 1:
-            world = sorted(world, key=compareY)
-        else:
-            world = sorted(world, key=compareZ)
-        n = len(world)
-        if n == 1:
-            self.left = world
-            self.right = world
-        elif n == 2:
-            self.left = world[0]
-            self.right = world[1]
+    """Bounding volume hierarchy built with the binned surface area heuristic.
+
+    Objects are binned by the centroid of their bounding box along the axis
+    with the largest centroid extent. A child is entered with probability
+    ``area(child) / area(node)`` and then costs one box test plus a test per
+    object, so the bin boundary minimizing
+    ``area(left) * (c + n_left) + area(right) * (c + n_right)`` is taken if
+    that is cheaper than testing the ``n`` objects of a leaf.
+
+    With a shutter interval every node whose objects move also keeps its
+    boxes at ``time0`` and ``time1``. A ray is tested against these boxes
+    interpolated at ``r.time``, which encloses objects moving linearly, such
+    as :class:`MovingSphere`, and is tighter than the box over the whole
+    interval. Rays outside the interval use the box of the nearer end.
+
+    Args:
+        world (list|HittableList): bounded hittable objects
+        time0 (float, optional): shutter open time
+        time1 (float, optional): shutter close time, without both times the
+            boxes enclose the whole motion of the objects
+        max_leaf (int): nodes with more objects are always split if possible
+        n_bins (int): number of SAH bins
+    """
+
+    # cost ``c`` of a box test relative to an object test, both are a few
+    # float operations and about as slow in python
+    TRAVERSAL_COST = 1.
+
+    def __init__(self, world, time0=None, time1=None, max_leaf=8, n_bins=12):
+        objs = list(world)
+        assert len(objs) > 0, "BvhNode needs at least one object"
+        boxes = [obj.bounding_box(time0, time1) for obj in objs]
+        assert all(box is not None for box in boxes), \
+            "BvhNode objects must be bounded"
+
+        self.box = None
+        for box in boxes:
+            self.box = Aabb.surrounding_box(self.box, box)
+        self.time0 = time0
+        self.time1 = time1
+        # boxes at the shutter open and close time, None for a still node
+        self.box0 = None
+        self.box1 = None
+        if time0 is not None and time1 is not None and time1 > time0:
+            box0 = box1 = None
+            for obj in objs:
+                box = obj.bounding_box(time0, time0)
+                box0 = Aabb.surrounding_box(box0, box)
+                box = obj.bounding_box(time1, time1)
+                box1 = Aabb.surrounding_box(box1, box)
+            if box0.bounds != box1.bounds:
+                self.box0, self.box1 = box0, box1
+        self.objs = None
+        self.left = None
+        self.right = None
+
+        split = None
+        if len(objs) > 1:
+            split = self._find_split(boxes, max_leaf, n_bins)
+        if split is None:
+            self.objs = objs
         else:
-            self.left = BvhNode(world[:n // 2 + 1], time0, time1)
-            self.right = BvhNode(world[n // 2:], time0, time1)
-
-        box_left = self.left.bounding_box()
-        box_right = self.right.bounding_box()
-        self.box = Aabb.surrounding_box(box_left, box_right)
-
-    def bounding_box(self):
-        return self.box
+            left = [obj for obj, side in zip(objs, split) if not side]
+            right = [obj for obj, side in zip(objs, split) if side]
+            self.left = BvhNode(left, time0, time1, max_leaf, n_bins)
+            self.right = BvhNode(right, time0, time1, max_leaf, n_bins)
+
+    def _find_split(self, boxes, max_leaf, n_bins):
+        """Return which objects go right, or ``None`` to make a leaf."""
+        n = len(boxes)
+        centroids = [box.centroid() for box in boxes]
+        extents = [
+            max(c[axis] for c in centroids) - min(c[axis] for c in centroids)
+            for axis in range(3)
+        ]
+        axis = max(range(3), key=lambda i: extents[i])
+        if extents[axis] <= 0.:
+            # every centroid coincides, only an arbitrary split is possible
+            if n <= max_leaf:
+                return None
+            return [idx >= n // 2 for idx in range(n)]
+
+        c_min = min(c[axis] for c in centroids)
+        scale = n_bins / extents[axis]
+        bin_ids = [
+            min(int((c[axis] - c_min) * scale), n_bins - 1) for c in centroids
+        ]
+        bin_boxes = [None] * n_bins
+        bin_counts = [0] * n_bins
+        for bin_id, box in zip(bin_ids, boxes):
+            bin_boxes[bin_id] = Aabb.surrounding_box(bin_boxes[bin_id], box)
+            bin_counts[bin_id] += 1
+
+        # sweep from the right to get the cost of every right partition
+        right_costs = [0.] * n_bins
+        box, count = None, 0
+        for idx in range(n_bins - 1, 0, -1):
+            box = Aabb.surrounding_box(box, bin_boxes[idx])
+            count += bin_counts[idx]
+            if box is not None:
+                right_costs[idx] = box.area() * (self.TRAVERSAL_COST + count)
+
+        best_cost, best_bin = float('inf'), None
+        box, count = None, 0
+        for idx in range(n_bins - 1):
+            box = Aabb.surrounding_box(box, bin_boxes[idx])
+            count += bin_counts[idx]
+            if count == 0 or count == n:
+                continue
+            cost = box.area() * (self.TRAVERSAL_COST + count) + \
+                right_costs[idx + 1]
+            if cost < best_cost:
+                best_cost, best_bin = cost, idx
+
+        area = self.box.area()
+        if n <= max_leaf and (area <= 0. or n <= best_cost / area):
+            return None
+        return [bin_id > best_bin for bin_id in bin_ids]
+
+    def bounds_at(self, time):
+        """Flat bounds of the node box at ``time``."""
+        if self.box0 is None:
+            return self.box.bounds
+        return lerp_bounds(self.box0.bounds, self.box1.bounds,
+                           (time - self.time0) / (self.time1 - self.time0))
+
+    def bounding_box(self, t0=None, t1=None):
+        if self.box0 is None or t0 is None or t1 is None:
+            return self.box
+        return Aabb.surrounding_box(Aabb.from_bounds(self.bounds_at(t0)),
+                                    Aabb.from_bounds(self.bounds_at(t1)))
 
     def hit(self, r, t_min, t_max):
-        if self.box.hit(r, t_min, t_max):
-            left_rec = self.left.hit(r, t_min, t_max)
-            right_rec = self.right.hit(r, t_min, t_max)
-            if (left_rec is not None) and (right_rec is not None):
-                if left_rec.t < right_rec.t:
-                    return left_rec
-                else:
-                    return right_rec
-            elif left_rec is not None:
-                return left_rec
-            elif right_rec is not None:
-                return right_rec
-
-        return None
+        if self.box0 is None:
+            if not self.box.hit(r, t_min, t_max):
+                return None
+        elif slab_entry(self.bounds_at(r.time), 0, r, t_min, t_max) is None:
+            return None
+
+        if self.objs is not None:
+            hit_rec = None
+            for obj in self.objs:
+                temp_hit_rec = obj.hit(r, t_min, t_max)
+                if temp_hit_rec is not None:
+                    hit_rec = temp_hit_rec
+                    t_max = temp_hit_rec.t
+            return hit_rec
+
+        left_rec = self.left.hit(r, t_min, t_max)
+        if left_rec is not None:
+            t_max = left_rec.t
+        right_rec = self.right.hit(r, t_min, t_max)
+        return right_rec if right_rec is not None else left_rec
+
+    def occluded(self, r, t_min, t_max):
+        if self.box0 is None:
+            if not self.box.hit(r, t_min, t_max):
+                return False
+        elif slab_entry(self.bounds_at(r.time), 0, r, t_min, t_max) is None:
+            return False
+
+        if self.objs is not None:
+            for obj in self.objs:
+                if obj.occluded(r, t_min, t_max):
+                    return True
+            return False
+        return (self.left.occluded(r, t_min, t_max)
+                or self.right.occluded(r, t_min, t_max))
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        if self.box0 is None:
+            bounds = self.box.bounds
+        else:
+            f = np.clip((rays.time[idx] - self.time0) /
+                        (self.time1 - self.time0), 0., 1.)
+            bounds0 = np.array(self.box0.bounds)
+            bounds = bounds0 + f[:, None] * (np.array(self.box1.bounds) -
+                                             bounds0)
+        entries = batch_slab_entries(bounds, rays, idx, t_min, rec.t[idx])
+        idx = idx[entries < np.inf]
+        if len(idx) == 0:
+            return idx
+
+        children = self.objs if self.objs is not None else (self.left,
+                                                             self.right)
+        hits = [obj.hit_batch(rays, idx, t_min, rec) for obj in children]
+        return np.unique(np.concatenate(hits))
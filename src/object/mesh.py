@@ -0,0 +1,430 @@
+import os.path as osp
+from array import array
+
+import numpy as np
+
+from vec import Vec3
+from .hittable import HitRecord
+from .bvh import FlatBvh, build_morton
+
+
+def _to_array(values, typecode):
+    buf = array(typecode)
+    buf.frombytes(np.ascontiguousarray(values, dtype=buf.typecode).tobytes())
+    return buf
+
+
+class TriangleMesh(FlatBvh):
+    """Indexed triangle mesh.
+
+    Corners, normals and uvs are shared per vertex in NumPy arrays. The
+    first corner and the two edges of every triangle are computed once and
+    kept in a flat float buffer in BVH order, 9 floats per triangle, so a
+    mesh costs a fixed number of bytes per triangle and vertex and no Python
+    object per triangle. The BVH over the triangles is built in Morton order
+    by :func:`build_morton`.
+
+    Triangles are intersected with the Moller-Trumbore test and only the
+    closest hit gets a record. Its normal is the interpolated vertex normal
+    if ``normals`` are given, otherwise the face normal
+    ``cross(p2 - p1, p3 - p1)``, which points to the side the corners are
+    seen counterclockwise from, as in OBJ and PLY files.
+
+    Args:
+        vertices (np.ndarray): ``(n_vertices, 3)`` corner positions
+        indices (np.ndarray): ``(n_triangles, 3)`` corner indices
+        mat (Material): material
+        normals (np.ndarray, optional): ``(n_vertices, 3)`` vertex normals
+        texcoords (np.ndarray, optional): ``(n_vertices, 2)`` vertex uvs,
+            the barycentric coordinates are used without them
+        bvh (bool): build a BVH, otherwise every ray tests all triangles
+        max_leaf (int): largest number of triangles of a BVH leaf
+    """
+
+    def __init__(self,
+                 vertices,
+                 indices,
+                 mat,
+                 normals=None,
+                 texcoords=None,
+                 bvh=True,
+                 max_leaf=4):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.normals = None if normals is None else np.asarray(
+            normals, dtype=np.float64)
+        self.texcoords = None if texcoords is None else np.asarray(
+            texcoords, dtype=np.float64)
+        self.mat = mat
+        if self.indices.ndim != 2 or self.indices.shape[1] != 3:
+            raise ValueError(
+                f'indices must be (n, 3), but get {self.indices.shape}')
+        if len(self.indices) == 0:
+            raise ValueError('TriangleMesh needs at least one triangle')
+        if self.indices.min() < 0 or self.indices.max() >= len(
+                self.vertices):
+            raise ValueError('indices out of the vertex range')
+
+        corners = self.vertices[self.indices]
+        lo = corners.min(axis=1)
+        hi = corners.max(axis=1)
+        if bvh:
+            self.bounds, self.offsets, self.counts, order = build_morton(
+                lo, hi, max_leaf)
+        else:
+            order = np.arange(len(self.indices))
+            self.bounds = _to_array(
+                np.concatenate([lo.min(axis=0), hi.max(axis=0)]), 'd')
+            self.offsets = array('l', [0])
+            self.counts = array('l', [len(order)])
+        # meshes do not move
+        self.time0 = self.time1 = self.deltas = None
+        self.order = _to_array(order, 'l')
+
+        corners = corners[order]
+        p1 = corners[:, 0]
+        self._tris = _to_array(
+            np.concatenate([p1, corners[:, 1] - p1, corners[:, 2] - p1],
+                           axis=1), 'd')
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _hit_leaf(self, start, count, r, t_min, t_max):
+        tris = self._tris
+        ox, oy, oz = r.origin.x, r.origin.y, r.origin.z
+        dx, dy, dz = r.direction.x, r.direction.y, r.direction.z
+        closest = None
+        for k in range(start, start + count):
+            b = 9 * k
+            e1x, e1y, e1z = tris[b + 3], tris[b + 4], tris[b + 5]
+            e2x, e2y, e2z = tris[b + 6], tris[b + 7], tris[b + 8]
+            # pvec = d x e2
+            px = dy * e2z - dz * e2y
+            py = dz * e2x - dx * e2z
+            pz = dx * e2y - dy * e2x
+            det = e1x * px + e1y * py + e1z * pz
+            if det == 0.:
+                continue
+            inv_det = 1. / det
+            tx, ty, tz = ox - tris[b], oy - tris[b + 1], oz - tris[b + 2]
+            u = (tx * px + ty * py + tz * pz) * inv_det
+            if u < 0. or u > 1.:
+                continue
+            # qvec = tvec x e1
+            qx = ty * e1z - tz * e1y
+            qy = tz * e1x - tx * e1z
+            qz = tx * e1y - ty * e1x
+            v = (dx * qx + dy * qy + dz * qz) * inv_det
+            if v < 0. or u + v > 1.:
+                continue
+            t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+            if t_min < t < t_max:
+                closest = (k, u, v)
+                t_max = t
+        return None if closest is None else (closest + (t_max, ), t_max)
+
+    def _occluded_leaf(self, start, count, r, t_min, t_max):
+        # leaves hold a few triangles, the closest one costs no record
+        return self._hit_leaf(start, count, r, t_min, t_max) is not None
+
+    def _hit_leaf_batch(self, start, count, rays, idx, t_min, rec):
+        # the Moller-Trumbore test of every ray with every leaf triangle
+        tris = np.frombuffer(self._tris).reshape(-1, 9)[start:start + count]
+        p1, e1, e2 = tris[:, :3], tris[:, 3:6], tris[:, 6:]
+        e1x, e1y, e1z = e1.T
+        e2x, e2y, e2z = e2.T
+        dx, dy, dz = rays.direction[idx].T[:, :, None]
+        ox, oy, oz = rays.origin[idx].T[:, :, None]
+        # pvec = d x e2
+        px = dy * e2z - dz * e2y
+        py = dz * e2x - dx * e2z
+        pz = dx * e2y - dy * e2x
+        det = e1x * px + e1y * py + e1z * pz
+        tx, ty, tz = ox - p1[:, 0], oy - p1[:, 1], oz - p1[:, 2]
+        # qvec = tvec x e1
+        qx = ty * e1z - tz * e1y
+        qy = tz * e1x - tx * e1z
+        qz = tx * e1y - ty * e1x
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_det = 1. / det
+            u = (tx * px + ty * py + tz * pz) * inv_det
+            v = (dx * qx + dy * qy + dz * qz) * inv_det
+            t = (e2x * qx + e2y * qy + e2z * qz) * inv_det
+            valid = ((det != 0.) & (u >= 0.) & (u <= 1.) & (v >= 0.) &
+                     (u + v <= 1.) & (t > t_min) & (t < rec.t[idx, None]))
+        t = np.where(valid, t, np.inf)
+        closest = t.argmin(axis=1)
+        lane = np.arange(len(idx))
+        hit = t[lane, closest] < np.inf
+        closest, lane = closest[hit], lane[hit]
+        t, u, v = t[lane, closest], u[lane, closest], v[lane, closest]
+        lanes = idx[hit]
+        k = start + closest
+        w = 1. - u - v
+        corners = self.indices[np.asarray(self.order)[k]]
+        if self.normals is not None:
+            normal = (w[:, None] * self.normals[corners[:, 0]] +
+                      u[:, None] * self.normals[corners[:, 1]] +
+                      v[:, None] * self.normals[corners[:, 2]])
+        else:
+            normal = np.cross(e1[closest], e2[closest])
+        normal /= np.sqrt((normal * normal).sum(axis=1))[:, None]
+        if self.texcoords is not None:
+            u, v = (w[:, None] * self.texcoords[corners[:, 0]] +
+                    u[:, None] * self.texcoords[corners[:, 1]] +
+                    v[:, None] * self.texcoords[corners[:, 2]]).T
+        rec.update(lanes, t, rays.at(t, lanes), normal, u, v, self.mat)
+        return lanes
+
+    def _hit_record(self, closest, r):
+        k, u, v, t = closest
+        tri = self.order[k]
+        hit_rec = HitRecord()
+        hit_rec.t = t
+        hit_rec.p = r.at(t)
+        hit_rec.mat = self.mat
+
+        w = 1. - u - v
+        i1, i2, i3 = self.indices[tri].tolist()
+        if self.normals is not None:
+            n = (w * self.normals[i1] + u * self.normals[i2] +
+                 v * self.normals[i3])
+            hit_rec.normal = Vec3(*n.tolist()).normalize()
+        else:
+            b = 9 * k
+            e1 = Vec3(*self._tris[b + 3:b + 6])
+            e2 = Vec3(*self._tris[b + 6:b + 9])
+            hit_rec.normal = Vec3.cross(e1, e2).normalize()
+        if self.texcoords is not None:
+            hit_rec.u, hit_rec.v = (w * self.texcoords[i1] +
+                                    u * self.texcoords[i2] +
+                                    v * self.texcoords[i3]).tolist()
+        else:
+            hit_rec.u, hit_rec.v = u, v
+        return hit_rec
+
+
+def _obj_index(idx, n):
+    # OBJ indices start at 1, negative ones count from the end
+    idx = int(idx)
+    return idx - 1 if idx > 0 else n + idx
+
+
+def load_obj(fname, mat, **kwargs):
+    """Load the faces of a Wavefront OBJ file as one :class:`TriangleMesh`.
+
+    ``v``, ``vt``, ``vn`` and ``f`` lines are read, polygons are split into
+    triangle fans and everything else, like groups and materials, is
+    ignored. Corners with different normals or uvs become separate vertices.
+
+    Args:
+        fname (str): OBJ file
+        mat (Material): material of the mesh
+        **kwargs: options of :class:`TriangleMesh`
+
+    Returns:
+        TriangleMesh: the mesh
+    """
+    positions, uvs, normals = [], [], []
+    vertex_ids = {}
+    vertices = []
+    triangles = []
+    with open(fname) as f:
+        for line_no, line in enumerate(f, 1):
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            tag = fields[0]
+            if tag == 'v':
+                positions.append([float(x) for x in fields[1:4]])
+            elif tag == 'vt':
+                uvs.append([float(x) for x in fields[1:3]])
+            elif tag == 'vn':
+                normals.append([float(x) for x in fields[1:4]])
+            elif tag == 'f':
+                if len(fields) < 4:
+                    raise ValueError(
+                        f'{fname}:{line_no}: face with less than 3 corners')
+                face = []
+                for corner in fields[1:]:
+                    refs = (corner.split('/') + ['', ''])[:3]
+                    key = (_obj_index(refs[0], len(positions)),
+                           _obj_index(refs[1], len(uvs)) if refs[1] else -1,
+                           _obj_index(refs[2], len(normals))
+                           if refs[2] else -1)
+                    if key not in vertex_ids:
+                        vertex_ids[key] = len(vertices)
+                        vertices.append(key)
+                    face.append(vertex_ids[key])
+                for idx in range(1, len(face) - 1):
+                    triangles.append((face[0], face[idx], face[idx + 1]))
+
+    if not triangles:
+        raise ValueError(f'{fname} has no faces')
+    keys = np.array(vertices, dtype=np.int64)
+    points = np.array(positions, dtype=np.float64)[keys[:, 0]]
+    # per vertex normals and uvs only if every corner has them
+    vertex_uvs = None
+    if uvs and (keys[:, 1] >= 0).all():
+        vertex_uvs = np.array(uvs, dtype=np.float64)[keys[:, 1]]
+    vertex_normals = None
+    if normals and (keys[:, 2] >= 0).all():
+        vertex_normals = np.array(normals, dtype=np.float64)[keys[:, 2]]
+    return TriangleMesh(points,
+                        triangles,
+                        mat,
+                        normals=vertex_normals,
+                        texcoords=vertex_uvs,
+                        **kwargs)
+
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'
+}
+
+
+def _read_ply_header(f, fname):
+    if f.readline().strip() != b'ply':
+        raise ValueError(f'{fname} is not a PLY file')
+    endian = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError(f'{fname}: PLY header has no end_header')
+        fields = line.decode('ascii').split()
+        if not fields or fields[0] in ('comment', 'obj_info'):
+            continue
+        if fields[0] == 'end_header':
+            break
+        if fields[0] == 'format':
+            if fields[1] == 'binary_little_endian':
+                endian = '<'
+            elif fields[1] == 'binary_big_endian':
+                endian = '>'
+            else:
+                raise ValueError(
+                    f'{fname}: only binary PLY files are supported, '
+                    f'but get {fields[1]}')
+        elif fields[0] == 'element':
+            elements.append((fields[1], int(fields[2]), []))
+        elif fields[0] == 'property':
+            if fields[1] == 'list':
+                prop = (fields[4], _PLY_TYPES[fields[2]],
+                        _PLY_TYPES[fields[3]])
+            else:
+                prop = (fields[2], _PLY_TYPES[fields[1]], None)
+            elements[-1][2].append(prop)
+    if endian is None:
+        raise ValueError(f'{fname}: PLY header has no format')
+    return endian, elements
+
+
+def _read_ply_faces(data, offset, count, props, endian, fname):
+    """Read a face element, return its triangles and the end offset."""
+    names = [p[0] for p in props]
+    if 'vertex_indices' in names:
+        index_prop = 'vertex_indices'
+    elif 'vertex_index' in names:
+        index_prop = 'vertex_index'
+    else:
+        raise ValueError(f'{fname}: PLY faces have no vertex_indices')
+
+    if len(props) == 1:
+        # the common all triangle case in one read, the first face with
+        # another length is read at its right offset and fails the check
+        _, len_type, idx_type = props[0]
+        tri_dtype = np.dtype([('n', endian + len_type),
+                              ('idx', endian + idx_type, 3)])
+        if offset + count * tri_dtype.itemsize <= len(data):
+            faces = np.frombuffer(data, tri_dtype, count, offset)
+            if (faces['n'] == 3).all():
+                return (faces['idx'].astype(np.int64),
+                        offset + count * tri_dtype.itemsize)
+
+    triangles = []
+    for _ in range(count):
+        for name, val_type, item_type in props:
+            val_dtype = np.dtype(endian + val_type)
+            if item_type is None:
+                offset += val_dtype.itemsize
+                continue
+            item_dtype = np.dtype(endian + item_type)
+            n = int(np.frombuffer(data, val_dtype, 1, offset)[0])
+            offset += val_dtype.itemsize
+            items = np.frombuffer(data, item_dtype, n, offset).tolist()
+            offset += n * item_dtype.itemsize
+            if name == index_prop:
+                for idx in range(1, n - 1):
+                    triangles.append((items[0], items[idx], items[idx + 1]))
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3), offset
+
+
+def load_ply(fname, mat, **kwargs):
+    """Load a binary PLY file as one :class:`TriangleMesh`.
+
+    The ``vertex`` element gives ``x, y, z`` and, if present, ``nx, ny, nz``
+    normals and ``u, v`` (or ``s, t``) uvs. The ``vertex_indices`` list of
+    the ``face`` element is split into triangle fans. Other elements and
+    properties are skipped.
+
+    Args:
+        fname (str): PLY file in binary little or big endian format
+        mat (Material): material of the mesh
+        **kwargs: options of :class:`TriangleMesh`
+
+    Returns:
+        TriangleMesh: the mesh
+    """
+    with open(fname, 'rb') as f:
+        endian, elements = _read_ply_header(f, fname)
+        data = f.read()
+
+    offset = 0
+    vertices = None
+    triangles = None
+    for name, count, props in elements:
+        if all(p[2] is None for p in props):
+            dtype = np.dtype([(p[0], endian + p[1]) for p in props])
+            values = np.frombuffer(data, dtype, count, offset)
+            offset += count * dtype.itemsize
+            if name == 'vertex':
+                vertices = values
+        elif name == 'face':
+            triangles, offset = _read_ply_faces(data, offset, count, props,
+                                                endian, fname)
+        else:
+            raise ValueError(
+                f'{fname}: list properties are only supported in faces')
+    if vertices is None or triangles is None:
+        raise ValueError(f'{fname} needs vertex and face elements')
+
+    def columns(*names):
+        if all(n in vertices.dtype.names for n in names):
+            return np.stack([vertices[n] for n in names],
+                            axis=1).astype(np.float64)
+        return None
+
+    texcoords = columns('u', 'v')
+    if texcoords is None:
+        texcoords = columns('s', 't')
+    return TriangleMesh(columns('x', 'y', 'z'),
+                        triangles,
+                        mat,
+                        normals=columns('nx', 'ny', 'nz'),
+                        texcoords=texcoords,
+                        **kwargs)
+
+
+def load_mesh(fname, mat, **kwargs):
+    """Load an ``.obj`` or ``.ply`` file by its extension."""
+    ext = osp.splitext(fname)[1].lower()
+    if ext == '.obj':
+        return load_obj(fname, mat, **kwargs)
+    if ext == '.ply':
+        return load_ply(fname, mat, **kwargs)
+    raise ValueError(f'no mesh loader for {ext} files!')
@@ -1,9 +1,34 @@
 import math
+import itertools
 from abc import abstractmethod
 
+import numpy as np
+
 from vec import Vec3, Point
-from ray import Ray
-from .hittable import Hittable, Aabb
+from ray import Ray, RayBatch
+from .hittable import Hittable, HittableList, Aabb, batch_slab_entries
+
+
+def _local_hit_batch(obj, bbox, rays, idx, t_min, rec, linear, offset):
+    """Trace the rays ``idx`` through an object in its local space.
+
+    Rays missing the world space ``bbox`` are dropped first. The others are
+    taken to the local space by the ``(3, 3)`` matrix ``linear`` and the
+    ``offset``, the caller maps the local hits back to the world.
+
+    Returns:
+        tuple: the traced ray indices, their local :class:`HitBatch` and the
+        positions of the hit rays in both
+    """
+    if bbox is not None:
+        entries = batch_slab_entries(bbox.bounds, rays, idx, t_min,
+                                     rec.t[idx])
+        idx = idx[entries < np.inf]
+    local = rec.take(idx)
+    local_rays = RayBatch(rays.origin[idx] @ linear.T + offset,
+                          rays.direction[idx] @ linear.T, rays.time[idx])
+    lanes = obj.hit_batch(local_rays, np.arange(len(idx)), t_min, local)
+    return idx, local, lanes
 
 
 class FlipNormals(Hittable):
@@ -17,8 +42,16 @@ class FlipNormals(Hittable):
             hit_rec.normal = -1 * hit_rec.normal
         return hit_rec
 
-    def bounding_box(self):
-        return self.obj.bounding_box()
+    def occluded(self, r, t_min, t_max):
+        return self.obj.occluded(r, t_min, t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        lanes = self.obj.hit_batch(rays, idx, t_min, rec)
+        rec.normal[lanes] *= -1
+        return lanes
+
+    def bounding_box(self, t0=None, t1=None):
+        return self.obj.bounding_box(t0, t1)
 
     def pdf_value(self, origin, direction):
         return self.obj.pdf_value(origin, direction)
@@ -26,25 +59,58 @@ class FlipNormals(Hittable):
     def random(self, origin):
         return self.obj.random(origin)
 
+    def pdf_value_batch(self, origin, direction):
+        return self.obj.pdf_value_batch(origin, direction)
+
+    def random_batch(self, origin, streams, idx):
+        return self.obj.random_batch(origin, streams, idx)
+
 
 class Translate(Hittable):
 
     def __init__(self, obj, offset):
         self.obj = obj
         self.offset = offset
+        self.bbox = self._move_box(obj.bounding_box())
+
+    def _move_box(self, bbox):
+        if bbox is None:
+            return None
+        return Aabb(bbox._min + self.offset, bbox._max + self.offset)
 
     def hit(self, r, t_min, t_max):
+        # test the world space box before building the moved ray
+        if self.bbox is not None and not self.bbox.hit(r, t_min, t_max):
+            return None
         moved_r = Ray(r.origin - self.offset, r.direction, r.time)
         hit_rec = self.obj.hit(moved_r, t_min, t_max)
         if hit_rec is not None:
             hit_rec.p += self.offset
         return hit_rec
 
-    def bounding_box(self):
-        bbox = self.obj.bounding_box()
-        if bbox is not None:
-            bbox = Aabb(bbox._min + self.offset, bbox._max + self.offset)
-        return bbox
+    def occluded(self, r, t_min, t_max):
+        if self.bbox is not None and not self.bbox.hit(r, t_min, t_max):
+            return False
+        moved_r = Ray(r.origin - self.offset, r.direction, r.time)
+        return self.obj.occluded(moved_r, t_min, t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        offset = np.array(tuple(self.offset))
+        idx, local, lanes = _local_hit_batch(self.obj, self.bbox, rays, idx,
+                                             t_min, rec, np.eye(3), -offset)
+        local.p[lanes] += offset
+        rec.put(idx, local, lanes)
+        return idx[lanes]
+
+    def bounding_box(self, t0=None, t1=None):
+        if t0 is None or t1 is None:
+            return self.bbox
+        return self._move_box(self.obj.bounding_box(t0, t1))
+
+    @property
+    def matrix(self):
+        """Local to world ``(4, 4)`` matrix."""
+        return translation(self.offset)
 
     def pdf_value(self, origin, direction):
         return self.obj.pdf_value(origin, direction)
@@ -52,6 +118,12 @@ class Translate(Hittable):
     def random(self, origin):
         return self.obj.random(origin)
 
+    def pdf_value_batch(self, origin, direction):
+        return self.obj.pdf_value_batch(origin, direction)
+
+    def random_batch(self, origin, streams, idx):
+        return self.obj.random_batch(origin, streams, idx)
+
 
 class Rotate(Hittable):
 
@@ -61,8 +133,9 @@ class Rotate(Hittable):
         radians = (math.pi / 180.0) * angle
         self.sin_theta = math.sin(radians)
         self.cos_theta = math.cos(radians)
+        self.bbox = self._rotate_box(obj.bounding_box())
 
-        bbox = obj.bounding_box()
+    def _rotate_box(self, bbox):
         _min = Vec3(float('inf'))
         _max = Vec3(-float('inf'))
         for i in range(2):
@@ -75,7 +148,7 @@ class Rotate(Hittable):
                     for c in range(3):
                         _max[c] = tester[c] if tester[c] > _max[c] else _max[c]
                         _min[c] = tester[c] if tester[c] < _min[c] else _min[c]
-        self.bbox = Aabb(_min, _max)
+        return Aabb(_min, _max)
 
     @abstractmethod
     def _rotate(self, p):
@@ -86,6 +159,9 @@ class Rotate(Hittable):
         pass
 
     def hit(self, r, t_min, t_max):
+        # test the world space box before rotating the ray
+        if not self.bbox.hit(r, t_min, t_max):
+            return None
         new_orig = self._rotate_t(r.origin)
         new_dir = self._rotate_t(r.direction)
         rotated_r = Ray(new_orig, new_dir, r.time)
@@ -97,8 +173,35 @@ class Rotate(Hittable):
 
         return hit_rec
 
-    def bounding_box(self):
-        return self.bbox
+    def occluded(self, r, t_min, t_max):
+        if not self.bbox.hit(r, t_min, t_max):
+            return False
+        rotated_r = Ray(self._rotate_t(r.origin), self._rotate_t(r.direction),
+                        r.time)
+        return self.obj.occluded(rotated_r, t_min, t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        rotation = self.matrix[:3, :3]
+        idx, local, lanes = _local_hit_batch(self.obj, self.bbox, rays, idx,
+                                             t_min, rec, rotation.T,
+                                             np.zeros(3))
+        local.p[lanes] = local.p[lanes] @ rotation.T
+        local.normal[lanes] = local.normal[lanes] @ rotation.T
+        rec.put(idx, local, lanes)
+        return idx[lanes]
+
+    def bounding_box(self, t0=None, t1=None):
+        if t0 is None or t1 is None:
+            return self.bbox
+        return self._rotate_box(self.obj.bounding_box(t0, t1))
+
+    @property
+    def matrix(self):
+        """Local to world ``(4, 4)`` matrix."""
+        matrix = np.eye(4)
+        for axis, col in enumerate(np.eye(3)):
+            matrix[:3, axis] = tuple(self._rotate(Point(*col)))
+        return matrix
 
     def pdf_value(self, origin, direction):
         return self.obj.pdf_value(origin, direction)
@@ -106,6 +209,12 @@ class Rotate(Hittable):
     def random(self, origin):
         return self.obj.random(origin)
 
+    def pdf_value_batch(self, origin, direction):
+        return self.obj.pdf_value_batch(origin, direction)
+
+    def random_batch(self, origin, streams, idx):
+        return self.obj.random_batch(origin, streams, idx)
+
 
 class RotateY(Rotate):
 
@@ -150,3 +259,235 @@ class RotateZ(Rotate):
         _y = -self.sin_theta * p.x + self.cos_theta * p.y
         _z = p.z
         return Point(_x, _y, _z)
+
+
+def translation(offset):
+    """``(4, 4)`` matrix moving points by the vector ``offset``."""
+    matrix = np.eye(4)
+    matrix[:3, 3] = (offset[0], offset[1], offset[2])
+    return matrix
+
+
+def rotation(axis, angle):
+    """``(4, 4)`` matrix rotating by ``angle`` degrees about an axis.
+
+    Args:
+        axis (int): 0, 1 or 2 for the x, y or z axis
+        angle (float): counterclockwise angle looking down the axis
+    """
+    radians = math.radians(angle)
+    cos_theta, sin_theta = math.cos(radians), math.sin(radians)
+    u, v = [(1, 2), (2, 0), (0, 1)][axis]
+    matrix = np.eye(4)
+    matrix[u, u] = matrix[v, v] = cos_theta
+    matrix[u, v] = -sin_theta
+    matrix[v, u] = sin_theta
+    return matrix
+
+
+def scaling(factor):
+    """``(4, 4)`` matrix scaling by a scalar or a per-axis ``factor``."""
+    matrix = np.eye(4)
+    matrix[:3, :3] *= np.broadcast_to(np.asarray(factor, dtype=float), 3)
+    return matrix
+
+
+def _point(m, p):
+    return Point(m[0] * p.x + m[1] * p.y + m[2] * p.z + m[3],
+                 m[4] * p.x + m[5] * p.y + m[6] * p.z + m[7],
+                 m[8] * p.x + m[9] * p.y + m[10] * p.z + m[11])
+
+
+def _vector(m, v):
+    return Vec3(m[0] * v.x + m[1] * v.y + m[2] * v.z,
+                m[4] * v.x + m[5] * v.y + m[6] * v.z,
+                m[8] * v.x + m[9] * v.y + m[10] * v.z)
+
+
+class Transform(Hittable):
+    """Object placed in the world by an affine matrix.
+
+    The ray is taken to the local space of the object once and its direction
+    is not normalized, so hit distances are the same in both spaces. The
+    pdf of a light sampled through ``pdf_value`` and ``random`` is exact for
+    rigid transforms.
+
+    Args:
+        obj (Hittable): object in its local space
+        matrix (np.ndarray): ``(4, 4)`` local to world matrix
+    """
+
+    def __init__(self, obj, matrix):
+        self.obj = obj
+        self.matrix = np.asarray(matrix, dtype=float)
+        self.inverse = np.linalg.inv(self.matrix)
+
+        # the 3x4 parts as flat float tuples, indexing numpy per ray is slow
+        self._m = tuple(self.matrix[:3].ravel().tolist())
+        self._inv = tuple(self.inverse[:3].ravel().tolist())
+        # normals are transformed by the inverse transpose
+        normal_m = np.zeros((3, 4))
+        normal_m[:, :3] = self.inverse[:3, :3].T
+        self._normal_m = tuple(normal_m.ravel().tolist())
+        linear = self.matrix[:3, :3]
+        self.rigid = bool(np.allclose(linear @ linear.T, np.eye(3)))
+        self.bbox = self._transform_box(obj.bounding_box())
+
+    def _transform_box(self, bbox):
+        # the box of the transformed corners of the local box
+        if bbox is None:
+            return None
+        corners = np.array(
+            list(itertools.product(*zip(bbox.bounds[:3], bbox.bounds[3:]))))
+        corners = corners @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+        return Aabb(Vec3(*corners.min(axis=0).tolist()),
+                    Vec3(*corners.max(axis=0).tolist()))
+
+    def hit(self, r, t_min, t_max):
+        if self.bbox is not None and not self.bbox.hit(r, t_min, t_max):
+            return None
+        local_r = Ray(_point(self._inv, r.origin),
+                      _vector(self._inv, r.direction), r.time)
+
+        hit_rec = self.obj.hit(local_r, t_min, t_max)
+        if hit_rec is not None:
+            hit_rec.p = _point(self._m, hit_rec.p)
+            hit_rec.normal = _vector(self._normal_m, hit_rec.normal)
+            if not self.rigid:
+                hit_rec.normal = hit_rec.normal.normalize()
+        return hit_rec
+
+    def occluded(self, r, t_min, t_max):
+        if self.bbox is not None and not self.bbox.hit(r, t_min, t_max):
+            return False
+        local_r = Ray(_point(self._inv, r.origin),
+                      _vector(self._inv, r.direction), r.time)
+        return self.obj.occluded(local_r, t_min, t_max)
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        idx, local, lanes = _local_hit_batch(self.obj, self.bbox, rays, idx,
+                                             t_min, rec, self.inverse[:3, :3],
+                                             self.inverse[:3, 3])
+        local.p[lanes] = (local.p[lanes] @ self.matrix[:3, :3].T +
+                          self.matrix[:3, 3])
+        # the inverse transpose, applied to row vectors
+        normal = local.normal[lanes] @ self.inverse[:3, :3]
+        if not self.rigid:
+            normal /= np.sqrt((normal * normal).sum(axis=1))[:, None]
+        local.normal[lanes] = normal
+        rec.put(idx, local, lanes)
+        return idx[lanes]
+
+    def bounding_box(self, t0=None, t1=None):
+        if t0 is None or t1 is None:
+            return self.bbox
+        return self._transform_box(self.obj.bounding_box(t0, t1))
+
+    def pdf_value(self, origin, direction):
+        return self.obj.pdf_value(_point(self._inv, origin),
+                                  _vector(self._inv, direction))
+
+    def random(self, origin):
+        return _vector(self._m, self.obj.random(_point(self._inv, origin)))
+
+    def pdf_value_batch(self, origin, direction):
+        inverse = self.inverse[:3, :3]
+        return self.obj.pdf_value_batch(
+            origin @ inverse.T + self.inverse[:3, 3], direction @ inverse.T)
+
+    def random_batch(self, origin, streams, idx):
+        local_origin = origin @ self.inverse[:3, :3].T + self.inverse[:3, 3]
+        return (self.obj.random_batch(local_origin, streams, idx) @
+                self.matrix[:3, :3].T)
+
+
+class Instance(Transform):
+    """Placement of a prototype shared with other instances.
+
+    The prototype, for example a :class:`FlatBvh` of many objects or a
+    :class:`Box`, is referenced and not copied. Instances of it share its
+    geometry and acceleration structure, also when the scene is pickled for
+    the workers. Put instances in a :class:`FlatBvh` to build the top level
+    hierarchy over them, as ``load_scene`` does.
+
+    Args:
+        prototype (Hittable): shared object in its local space
+        matrix (np.ndarray): ``(4, 4)`` local to world matrix
+        mat (Material, optional): material replacing the prototype ones
+    """
+
+    def __init__(self, prototype, matrix, mat=None):
+        super().__init__(prototype, matrix)
+        self.mat = mat
+
+    @property
+    def prototype(self):
+        return self.obj
+
+    def hit(self, r, t_min, t_max):
+        hit_rec = super().hit(r, t_min, t_max)
+        if hit_rec is not None and self.mat is not None:
+            hit_rec.mat = self.mat
+        return hit_rec
+
+    def hit_batch(self, rays, idx, t_min, rec):
+        lanes = super().hit_batch(rays, idx, t_min, rec)
+        if self.mat is not None:
+            rec.mat[lanes] = self.mat
+        return lanes
+
+
+def fuse_transforms(obj):
+    """Replace chains of nested transform wrappers by single transforms.
+
+    A chain of :class:`Translate`, :class:`Rotate` and :class:`Transform`
+    wrappers becomes one :class:`Transform` with the product of their
+    matrices. :class:`FlipNormals` commutes with them and is moved out of
+    the chain. A lone :class:`Translate` is kept, it is cheaper than a
+    matrix. A chain ending in an :class:`Instance` becomes one instance of
+    the same prototype, which is not searched as it is shared. Lists and
+    flipped objects are searched for chains.
+
+    Args:
+        obj (Hittable): object or list of objects
+
+    Returns:
+        Hittable: the object with fused transforms, ``obj`` is not modified
+    """
+    if isinstance(obj, HittableList):
+        return HittableList([fuse_transforms(o) for o in obj.objs])
+
+    chain = []
+    flip = False
+    instance = None
+    inner = obj
+    while instance is None and isinstance(
+            inner, (Translate, Rotate, Transform, FlipNormals)):
+        if isinstance(inner, FlipNormals):
+            flip = not flip
+        else:
+            chain.append(inner)
+            if isinstance(inner, Instance):
+                instance = inner
+        inner = inner.obj
+    # a plain object or an instance with nothing to fuse
+    if inner is obj or obj is instance:
+        return obj
+
+    fused_inner = inner if instance is not None else fuse_transforms(inner)
+    if not chain:
+        if fused_inner is inner:
+            return obj
+        return FlipNormals(fused_inner) if flip else fused_inner
+
+    inner = fused_inner
+    matrix = np.eye(4)
+    for wrapper in chain:
+        matrix = matrix @ wrapper.matrix
+    if instance is not None:
+        fused = Instance(inner, matrix, instance.mat)
+    elif len(chain) == 1 and isinstance(chain[0], Translate):
+        fused = Translate(inner, chain[0].offset)
+    else:
+        fused = Transform(inner, matrix)
+    return FlipNormals(fused) if flip else fused
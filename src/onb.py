@@ -1,7 +1,9 @@
 import math
-import random
 
-from vec import Vec3
+import numpy as np
+
+import rng
+from vec import Vec3, vec3
 
 
 class ONB():
@@ -43,26 +45,46 @@ class ONB():
 
     def local(self, *args):
         tmp = Vec3(*args)
-        return tmp.x * self.u() + tmp.y * self.v() + tmp.z * self.w()
+        a, b, c = tmp.x, tmp.y, tmp.z
+        u, v, w = self.axis
+        return vec3(a * u.x + b * v.x + c * w.x, a * u.y + b * v.y + c * w.y,
+                    a * u.z + b * v.z + c * w.z)
 
     @classmethod
     def random_direction(cls):
-        r = random.random()
-        phi = 2 * math.pi * random.random()
+        r = rng.random()
+        phi = 2 * math.pi * rng.random()
 
         x = 2 * math.cos(phi) * math.sqrt(r * (1 - r))
         y = 2 * math.sin(phi) * math.sqrt(r * (1 - r))
         z = 1 - 2 * r
 
-        return Vec3(x, y, z)
+        return vec3(x, y, z)
 
     @classmethod
     def random_cosine_direction(cls):
-        r = random.random()
-        phi = 2 * math.pi * random.random()
+        r = rng.random()
+        phi = 2 * math.pi * rng.random()
 
         x = 2 * math.cos(phi) * math.sqrt(r)
         y = 2 * math.sin(phi) * math.sqrt(r)
         z = math.sqrt(1 - r)
 
-        return Vec3(x, y, z)
+        return vec3(x, y, z)
+
+
+def onb_batch(w):
+    """Array version of :meth:`ONB.build_from_w`.
+
+    Args:
+        w (np.ndarray): ``(n, 3)`` directions of the w axes
+
+    Returns:
+        tuple: the ``(n, 3)`` u, v and w axes
+    """
+    w = w / np.sqrt((w * w).sum(axis=1))[:, None]
+    a = np.zeros_like(w)
+    a[np.arange(len(w)), np.where(np.abs(w[:, 0]) > 0.9, 1, 0)] = 1.
+    v = np.cross(w, a)
+    v /= np.sqrt((v * v).sum(axis=1))[:, None]
+    return np.cross(w, v), v, w
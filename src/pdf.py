@@ -1,8 +1,10 @@
 import math
-import random
 from abc import abstractmethod
 
-from onb import ONB
+import numpy as np
+
+import rng
+from onb import ONB, onb_batch
 from vec import Vec3
 
 
@@ -31,8 +33,8 @@ class CosinePDF(PDF):
 
     @classmethod
     def random_cosine_direction(cls):
-        r = random.random()
-        phi = 2 * math.pi * random.random()
+        r = rng.random()
+        phi = 2 * math.pi * rng.random()
 
         x = 2 * math.cos(phi) * math.sqrt(r)
         y = 2 * math.sin(phi) * math.sqrt(r)
@@ -75,10 +77,91 @@ class MixPDF(PDF):
         ])
 
     def generate(self):
-        _rand = random.random()
+        _rand = rng.random()
         cnt = 0
         for idx in range(self.num_pdf):
             cnt += self.weights[idx]
             if _rand < cnt:
                 return self.pdf_list[idx].generate()
         return self.pdf_list[-1].generate()
+
+
+# batch counterparts of the pdfs above, one pdf per ray of a packet; the
+# ``n``-th ray draws from the stream ``idx[n]``, in the order of the scalar
+# ``generate``
+
+
+class CosinePDFBatch(PDF):
+    """:class:`CosinePDF` about the ``(n, 3)`` normals ``_w``."""
+
+    def __init__(self, _w):
+        self.normal = _w
+        self.u, self.v, self.w = onb_batch(_w)
+
+    def take(self, rows):
+        return CosinePDFBatch(self.normal[rows])
+
+    def value(self, direction):
+        length = np.sqrt((direction * direction).sum(axis=1))
+        cos = (direction / length[:, None] * self.w).sum(axis=1)
+        return np.maximum(cos, 0.) / math.pi
+
+    def generate(self, streams, idx):
+        r = streams.random(idx)[:, None]
+        phi = 2 * math.pi * streams.random(idx)[:, None]
+        x = 2 * np.cos(phi) * np.sqrt(r)
+        y = 2 * np.sin(phi) * np.sqrt(r)
+        z = np.sqrt(1 - r)
+        return x * self.u + y * self.v + z * self.w
+
+
+class HitPDFBatch(PDF):
+    """:class:`HitPDF` of an object seen from the ``(n, 3)`` origins."""
+
+    def __init__(self, obj, origin):
+        self.obj = obj
+        self.origin = origin
+
+    def take(self, rows):
+        return HitPDFBatch(self.obj, self.origin[rows])
+
+    def value(self, direction):
+        return self.obj.pdf_value_batch(self.origin, direction)
+
+    def generate(self, streams, idx):
+        return self.obj.random_batch(self.origin, streams, idx)
+
+
+class MixPDFBatch(PDF):
+    """:class:`MixPDF` of batch pdfs, the weights are shared by all rays."""
+
+    def __init__(self, pdf_list, weights=None):
+        self.pdf_list = pdf_list
+        self.num_pdf = len(self.pdf_list)
+        assert self.num_pdf > 0
+        if weights is None:
+            weights = [1.0 / self.num_pdf] * self.num_pdf
+        assert len(weights) == self.num_pdf
+        self.weights = weights
+
+    def take(self, rows):
+        return MixPDFBatch([pdf.take(rows) for pdf in self.pdf_list],
+                           self.weights)
+
+    def value(self, direction):
+        return sum([
+            self.weights[idx] * self.pdf_list[idx].value(direction)
+            for idx in range(self.num_pdf)
+        ])
+
+    def generate(self, streams, idx):
+        # the first pdf whose cumulated weight exceeds the random number
+        _rand = streams.random(idx)
+        picks = np.searchsorted(np.cumsum(self.weights), _rand, side='right')
+        picks = np.minimum(picks, self.num_pdf - 1)
+        directions = np.empty((len(idx), 3))
+        for pick in np.unique(picks).tolist():
+            rows = picks == pick
+            directions[rows] = self.pdf_list[pick].take(rows).generate(
+                streams, idx[rows])
+        return directions
@@ -1,3 +1,14 @@
+import math
+
+import numpy as np
+
+from vec import Vec3, Point
+
+# inverse of a zero direction component, finite so that an origin on a slab
+# plane gives a zero distance instead of nan
+INV_ZERO = 1e300
+
+
 class Ray():
 
     def __init__(self, orig, dir, t=0.):
@@ -5,5 +16,58 @@ class Ray():
         self.direction = dir
         self.time = t
 
+        # slab test data, see object.hittable.slab_entry
+        dx, dy, dz = dir.x, dir.y, dir.z
+        ix = 1. / dx if dx != 0. else math.copysign(INV_ZERO, dx)
+        iy = 1. / dy if dy != 0. else math.copysign(INV_ZERO, dy)
+        iz = 1. / dz if dz != 0. else math.copysign(INV_ZERO, dz)
+        self.inv_direction = (ix, iy, iz)
+        # 1 for negative components, which enter a box through its max plane
+        self.sign = (int(ix < 0.), int(iy < 0.), int(iz < 0.))
+
     def at(self, t):
-        return self.origin + t * self.direction
+        return self.origin.add_scaled(self.direction, t)
+
+
+class RayBatch():
+    """Many rays as structure of arrays, the packet counterpart of
+    :class:`Ray`.
+
+    Args:
+        origin (np.ndarray): ``(n, 3)`` origins
+        direction (np.ndarray): ``(n, 3)`` directions
+        time (np.ndarray, optional): ``(n,)`` times, zero by default
+    """
+
+    def __init__(self, origin, direction, time=None):
+        self.origin = np.asarray(origin, dtype=float)
+        self.direction = np.asarray(direction, dtype=float)
+        if time is None:
+            time = np.zeros(len(self.origin))
+        self.time = np.asarray(time, dtype=float)
+
+        zero = self.direction == 0.
+        with np.errstate(divide='ignore'):
+            inv_direction = 1. / self.direction
+        inv_direction[zero] = np.copysign(INV_ZERO, self.direction[zero])
+        self.inv_direction = inv_direction
+        self.sign = inv_direction < 0.
+
+    def __len__(self):
+        return len(self.origin)
+
+    def at(self, t, idx=None):
+        """Points at the distances ``t`` of the rays ``idx``, all by
+        default."""
+        if idx is None:
+            return self.origin + t[:, None] * self.direction
+        return self.origin[idx] + t[:, None] * self.direction[idx]
+
+    def take(self, idx):
+        """Batch of the rays ``idx``."""
+        return RayBatch(self.origin[idx], self.direction[idx], self.time[idx])
+
+    def ray(self, k):
+        """Ray ``k`` as a scalar :class:`Ray`."""
+        return Ray(Point(*self.origin[k].tolist()),
+                   Vec3(*self.direction[k].tolist()), float(self.time[k]))
@@ -0,0 +1,567 @@
+import os
+import multiprocessing as mp
+from collections import Counter
+
+import numpy as np
+from pdf import HitPDF, MixPDF, HitPDFBatch, MixPDFBatch
+
+import rng
+import stats
+from vec import Color
+from ray import Ray, RayBatch
+from object.hittable import HitBatch
+
+# integrators of the render tasks
+INTEGRATORS = ('path', 'wavefront')
+# deepest bounce a path scatters at, the camera ray is bounce 0
+MAX_DEPTH = 50
+# bounces a path makes before Russian roulette may end it
+RR_DEPTH = 5
+# largest number of paths the wavefront integrator keeps in flight
+WAVEFRONT_PATHS = 1 << 16
+
+# rays traced by this process, reported back with every tile
+traced_rays = 0
+
+
+def cal_ray_color(r, world, lights, max_depth=MAX_DEPTH, rr_depth=RR_DEPTH):
+    """Radiance arriving along the camera ray ``r``.
+
+    The path is followed bounce by bounce while its throughput, the product
+    of the scattering weights so far, is carried along. Light emitted at a
+    bounce adds to the radiance weighted by the throughput. Paths end when
+    they miss, are absorbed or scattered at ``max_depth``. From bounce
+    ``rr_depth`` on, Russian roulette ends a path with a probability that
+    grows as its throughput falls and divides the throughput of the
+    surviving paths by their survival probability, which keeps the estimate
+    unbiased.
+
+    Args:
+        r (Ray): camera ray
+        world (Hittable): scene objects
+        lights (HittableList): lights sampled at diffuse bounces
+        max_depth (int): deepest bounce a path scatters at
+        rr_depth (int): first bounce Russian roulette is played at
+
+    Returns:
+        Color: radiance
+    """
+    global traced_rays
+    color = Color(0)
+    throughput = Color(1)
+    depth = 0
+    while True:
+        traced_rays += 1
+        if stats.ENABLED:
+            stats.counters['rays', 'camera' if depth == 0 else 'scatter'] += 1
+        hit_rec = world.hit(r, 0.001, float('inf'))
+        if hit_rec is None:
+            if stats.ENABLED:
+                stats.record_path(depth, 'miss')
+            return color
+
+        color += throughput * hit_rec.mat.emitted(r, hit_rec)
+        sct_rec = hit_rec.mat.scatter(r, hit_rec)
+        if sct_rec.atten is None or depth >= max_depth:
+            if stats.ENABLED:
+                end = 'absorbed' if sct_rec.atten is None else 'depth_cap'
+                stats.record_path(depth, end)
+            return color
+
+        if sct_rec.is_specular:
+            throughput = throughput * sct_rec.atten
+            r = sct_rec.sct_ray
+        else:
+            hit_pdfs = [HitPDF(light, hit_rec.p) for light in lights.objs]
+            mix_pdf = MixPDF(hit_pdfs + [sct_rec.pdf])
+
+            sct_ray = Ray(hit_rec.p, mix_pdf.generate(), r.time)
+            sct_pdf = hit_rec.mat.scatter_pdf(r, hit_rec, sct_ray)
+            pdf_value = mix_pdf.value(sct_ray.direction)
+            if pdf_value <= 0.:
+                # a direction without density carries no estimate
+                if stats.ENABLED:
+                    stats.record_path(depth, 'absorbed')
+                return color
+            throughput = throughput * (sct_rec.atten * (sct_pdf / pdf_value))
+            r = sct_ray
+
+        if depth + 1 >= rr_depth:
+            survival = min(max(throughput.x, throughput.y, throughput.z), 1.)
+            if rng.random() >= survival:
+                if stats.ENABLED:
+                    stats.record_path(depth, 'roulette')
+                return color
+            throughput = throughput / survival
+        depth += 1
+
+
+def cal_ray_sample(i,
+                   j,
+                   rows,
+                   columns,
+                   camera,
+                   world,
+                   lights,
+                   max_depth=MAX_DEPTH,
+                   rr_depth=RR_DEPTH):
+    u = float(i + rng.random()) / (rows - 1)
+    v = float(j + rng.random()) / (columns - 1)
+    ray_r = camera.get_ray(u, v)
+    return cal_ray_color(ray_r, world, lights, max_depth, rr_depth)
+
+
+def cal_ray_tracing(i,
+                    j,
+                    samples,
+                    rows,
+                    columns,
+                    camera,
+                    world,
+                    lights,
+                    first_sample=0,
+                    seed=0,
+                    max_depth=MAX_DEPTH,
+                    rr_depth=RR_DEPTH):
+    """Sum the samples ``[first_sample, first_sample + samples)`` of a pixel,
+    each drawn from its own ``(seed, pixel, sample)`` random stream."""
+    color = Color(0)
+    pixel = j * rows + i
+    for sample in range(first_sample, first_sample + samples):
+        rng.set_stream(seed, pixel, sample)
+        color += cal_ray_sample(i, j, rows, columns, camera, world, lights,
+                                max_depth, rr_depth)
+    return color
+
+
+def trace_wavefront(i,
+                    j,
+                    sample,
+                    rows,
+                    columns,
+                    camera,
+                    world,
+                    lights,
+                    seed=0,
+                    max_depth=MAX_DEPTH,
+                    rr_depth=RR_DEPTH):
+    """Trace the paths of many pixel samples bounce by bounce.
+
+    The camera rays of all paths are generated and intersected as one
+    packet. The hits are partitioned by material and every partition is
+    shaded at once by the batch methods of its material. The paths that
+    scatter and survive Russian roulette are compacted into the queue of
+    the next bounce, the others end. Path ``n`` draws from the
+    ``(seed, pixel, sample)`` stream in the order of :func:`cal_ray_sample`,
+    so it gets the radiance of :func:`cal_ray_color` up to rounding.
+
+    Args:
+        i (np.ndarray): ``(n,)`` pixel rows
+        j (np.ndarray): ``(n,)`` pixel columns
+        sample (np.ndarray): ``(n,)`` sample indices
+        max_depth (int): deepest bounce a path scatters at
+        rr_depth (int): first bounce Russian roulette is played at
+
+    Returns:
+        np.ndarray: ``(n, 3)`` radiance of the paths
+    """
+    global traced_rays
+    n = len(i)
+    streams = rng.Streams(rng.stream_keys(seed, j * rows + i, sample))
+    paths = np.arange(n)
+    u = (i + streams.random(paths)) / (rows - 1)
+    v = (j + streams.random(paths)) / (columns - 1)
+    rays = camera.get_ray_batch(u, v, streams, paths)
+
+    radiance = np.zeros((n, 3))
+    throughput = np.ones((n, 3))
+    depth = 0
+    while len(paths):
+        traced_rays += len(paths)
+        if stats.ENABLED:
+            stats.counters['rays', 'camera' if depth == 0 else
+                           'scatter'] += len(paths)
+        rec = HitBatch(len(paths))
+        world.hit_batch(rays, np.arange(len(paths)), 0.001, rec)
+        hit = np.flatnonzero(rec.hit)
+        if stats.ENABLED and len(hit) < len(paths):
+            stats.record_path(depth, 'miss', len(paths) - len(hit))
+        if len(hit) == 0:
+            break
+
+        # partitions of the hits sharing a material
+        mat_ids = np.frompyfunc(id, 1, 1)(rec.mat[hit]).astype(np.int64)
+        _, partition = np.unique(mat_ids, return_inverse=True)
+        queue = []
+        for lanes in np.split(hit[np.argsort(partition, kind='stable')],
+                              np.cumsum(np.bincount(partition))[:-1]):
+            queue += _shade_partition(lanes, paths, rays, rec, depth, lights,
+                                      streams, radiance, throughput,
+                                      max_depth, rr_depth)
+
+        if not queue:
+            break
+        paths = np.concatenate([ids for ids, _ in queue])
+        rays = RayBatch(
+            np.concatenate([next_rays.origin for _, next_rays in queue]),
+            np.concatenate([next_rays.direction for _, next_rays in queue]),
+            np.concatenate([next_rays.time for _, next_rays in queue]))
+        depth += 1
+    return radiance
+
+
+def _shade_partition(lanes, paths, rays, rec, depth, lights, streams,
+                     radiance, throughput, max_depth, rr_depth):
+    """Shade the hits ``lanes`` of one material for :func:`trace_wavefront`.
+
+    Returns:
+        list: ``(paths, rays)`` of the scattered paths, empty if none
+    """
+    ids = paths[lanes]
+    r_in, sub = rays.take(lanes), rec.take(lanes)
+    mat = sub.mat[0]
+    radiance[ids] += throughput[ids] * mat.emitted_batch(r_in, sub)
+    sct = mat.scatter_batch(r_in, sub, streams, ids)
+    if stats.ENABLED:
+        ended = int((~sct.scattered).sum())
+        if ended:
+            stats.record_path(depth, 'absorbed', ended)
+        if depth >= max_depth and ended < len(ids):
+            stats.record_path(depth, 'depth_cap', len(ids) - ended)
+    go = np.flatnonzero(sct.scattered) if depth < max_depth else []
+    if len(go) == 0:
+        return []
+
+    if sct.is_specular:
+        next_rays = sct.sct_ray.take(go)
+        weight = sct.atten[go]
+    else:
+        pdf = MixPDFBatch(
+            [HitPDFBatch(light, sub.p) for light in lights.objs] +
+            [sct.pdf]).take(go)
+        direction = pdf.generate(streams, ids[go])
+        next_rays = RayBatch(sub.p[go], direction, r_in.time[go])
+        sct_pdf = mat.scatter_pdf_batch(r_in.take(go), sub.take(go),
+                                        next_rays)
+        pdf_value = pdf.value(direction)
+        # a direction without density carries no estimate
+        valid = pdf_value > 0.
+        if stats.ENABLED and not valid.all():
+            stats.record_path(depth, 'absorbed', int((~valid).sum()))
+        go, next_rays = go[valid], next_rays.take(valid)
+        weight = sct.atten[go] * (sct_pdf[valid] / pdf_value[valid])[:, None]
+    throughput[ids[go]] *= weight
+
+    if depth + 1 >= rr_depth:
+        survival = np.minimum(throughput[ids[go]].max(axis=1), 1.)
+        survive = streams.random(ids[go]) < survival
+        if stats.ENABLED and not survive.all():
+            stats.record_path(depth, 'roulette', int((~survive).sum()))
+        go, next_rays = go[survive], next_rays.take(survive)
+        throughput[ids[go]] /= survival[survive, None]
+    return [(ids[go], next_rays)]
+
+
+def _trace_chunks(i, j, sample, rows, columns, camera, world, lights, seed,
+                  max_depth, rr_depth):
+    """:func:`trace_wavefront` in chunks of at most :data:`WAVEFRONT_PATHS`
+    paths."""
+    radiance = np.empty((len(i), 3))
+    for start in range(0, len(i), WAVEFRONT_PATHS):
+        chunk = slice(start, start + WAVEFRONT_PATHS)
+        radiance[chunk] = trace_wavefront(i[chunk], j[chunk], sample[chunk],
+                                          rows, columns, camera, world,
+                                          lights, seed, max_depth, rr_depth)
+    return radiance
+
+
+def luminance(color):
+    return 0.2126 * color.x + 0.7152 * color.y + 0.0722 * color.z
+
+
+def split_tiles(rows, columns, tile_size):
+    """Split the image plane into square tiles.
+
+    Args:
+        rows (int): image width in pixels
+        columns (int): image height in pixels
+        tile_size (int): side length of a tile, border tiles may be smaller
+
+    Returns:
+        list[tuple]: half-open pixel ranges ``(i0, i1, j0, j1)``
+    """
+    assert tile_size > 0, f'tile_size must be positive, but get {tile_size}'
+    return [(i0, min(i0 + tile_size, rows), j0, min(j0 + tile_size, columns))
+            for j0 in range(0, columns, tile_size)
+            for i0 in range(0, rows, tile_size)]
+
+
+def render_tile(tile,
+                samples,
+                rows,
+                columns,
+                camera,
+                world,
+                lights,
+                first_sample=0,
+                seed=0,
+                max_depth=MAX_DEPTH,
+                rr_depth=RR_DEPTH):
+    """Render one tile and return its radiance sum as a single block.
+
+    Returns:
+        tuple: the tile and a ``(i1 - i0, j1 - j0, 3)`` float array holding
+            the summed (not averaged) radiance of every pixel
+    """
+    i0, i1, j0, j1 = tile
+    block = np.zeros((i1 - i0, j1 - j0, 3), float)
+    for i in range(i0, i1):
+        for j in range(j0, j1):
+            color = cal_ray_tracing(i, j, samples, rows, columns, camera,
+                                    world, lights, first_sample, seed,
+                                    max_depth, rr_depth)
+            block[i - i0, j - j0] = (color.x, color.y, color.z)
+    return tile, block
+
+
+def render_tile_adaptive(tile,
+                         spp,
+                         first,
+                         rows,
+                         columns,
+                         camera,
+                         world,
+                         lights,
+                         seed=0,
+                         max_depth=MAX_DEPTH,
+                         rr_depth=RR_DEPTH):
+    """Render ``spp[i - i0, j - j0]`` samples, starting at sample index
+    ``first[i - i0, j - j0]``, for every pixel of a tile while tracking the
+    running mean and variance of the pixel luminance (Welford).
+
+    Returns:
+        tuple: the tile, the radiance sum block, and the per-pixel sample
+            count, luminance mean and sum of squared deviations ``m2``
+    """
+    i0, i1, j0, j1 = tile
+    shape = (i1 - i0, j1 - j0)
+    block = np.zeros(shape + (3, ), float)
+    count = np.zeros(shape, np.int64)
+    mean = np.zeros(shape, float)
+    m2 = np.zeros(shape, float)
+    for i in range(i0, i1):
+        for j in range(j0, j1):
+            n_samples = int(spp[i - i0, j - j0])
+            if n_samples <= 0:
+                continue
+            color = Color(0)
+            _mean, _m2 = 0., 0.
+            pixel = j * rows + i
+            first_sample = int(first[i - i0, j - j0])
+            for n in range(1, n_samples + 1):
+                rng.set_stream(seed, pixel, first_sample + n - 1)
+                sample = cal_ray_sample(i, j, rows, columns, camera, world,
+                                        lights, max_depth, rr_depth)
+                color += sample
+                lum = luminance(sample)
+                delta = lum - _mean
+                _mean += delta / n
+                _m2 += delta * (lum - _mean)
+            block[i - i0, j - j0] = (color.x, color.y, color.z)
+            count[i - i0, j - j0] = n_samples
+            mean[i - i0, j - j0] = _mean
+            m2[i - i0, j - j0] = _m2
+    return tile, block, count, mean, m2
+
+
+def render_tile_wavefront(tile,
+                          samples,
+                          rows,
+                          columns,
+                          camera,
+                          world,
+                          lights,
+                          first_sample=0,
+                          seed=0,
+                          max_depth=MAX_DEPTH,
+                          rr_depth=RR_DEPTH):
+    """:func:`render_tile` with the wavefront integrator, the samples of all
+    pixels of the tile are traced together."""
+    i0, i1, j0, j1 = tile
+    i, j, sample = np.meshgrid(np.arange(i0, i1),
+                               np.arange(j0, j1),
+                               np.arange(first_sample, first_sample + samples),
+                               indexing='ij')
+    i, j, sample = i.ravel(), j.ravel(), sample.ravel()
+    radiance = _trace_chunks(i, j, sample, rows, columns, camera, world,
+                             lights, seed, max_depth, rr_depth)
+    block = np.zeros((i1 - i0, j1 - j0, 3), float)
+    np.add.at(block, (i - i0, j - j0), radiance)
+    return tile, block
+
+
+def render_tile_adaptive_wavefront(tile,
+                                   spp,
+                                   first,
+                                   rows,
+                                   columns,
+                                   camera,
+                                   world,
+                                   lights,
+                                   seed=0,
+                                   max_depth=MAX_DEPTH,
+                                   rr_depth=RR_DEPTH):
+    """:func:`render_tile_adaptive` with the wavefront integrator, the
+    luminance moments are computed from all samples of a pixel at once."""
+    i0, i1, j0, j1 = tile
+    shape = (i1 - i0, j1 - j0)
+    count = np.maximum(np.asarray(spp, np.int64), 0)
+    pixel = np.repeat(np.arange(count.size), count.ravel())
+    # index of every sample among the samples of its pixel
+    starts = np.cumsum(count.ravel()) - count.ravel()
+    sample = (np.arange(len(pixel)) - starts[pixel] +
+              np.asarray(first, np.int64).ravel()[pixel])
+    di, dj = np.unravel_index(pixel, shape)
+    radiance = _trace_chunks(i0 + di, j0 + dj, sample, rows, columns, camera,
+                             world, lights, seed, max_depth, rr_depth)
+
+    block = np.zeros(shape + (3, ), float)
+    np.add.at(block, (di, dj), radiance)
+    lum = radiance @ np.array((0.2126, 0.7152, 0.0722))
+    safe_count = np.maximum(count, 1).ravel()
+    mean = np.bincount(pixel, lum, count.size) / safe_count
+    m2 = np.bincount(pixel, (lum - mean[pixel])**2, count.size)
+    return tile, block, count, mean.reshape(shape), m2.reshape(shape)
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Combine two sets of per-pixel Welford moments (Chan et al.)."""
+    count = count_a + count_b
+    safe_count = np.maximum(count, 1)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / safe_count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / safe_count
+    return count, mean, m2
+
+
+# scene shared by every task of a worker, set once per worker process
+_scene = None
+
+
+def init_worker(scene, collect_stats=False):
+    """Install the scene ``(rows, columns, camera, world, lights)`` in a
+    worker, either as a pool initializer or in the parent before fork."""
+    global _scene
+    _scene = scene
+    if collect_stats:
+        stats.enable()
+
+
+def default_jobs():
+    """Number of CPUs this process may use, honoring slurm allocations."""
+    for var in ('SLURM_CPUS_PER_TASK', 'SLURM_CPUS_ON_NODE'):
+        if os.environ.get(var, '').isdigit():
+            return int(os.environ[var])
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def create_pool(n_jobs, scene, scene_dist='fork', collect_stats=False):
+    """Install ``scene`` and start a pool of ``n_jobs`` workers sharing it.
+
+    Returns:
+        multiprocessing.Pool | None: ``None`` when ``n_jobs <= 1``, tasks then
+            run in this process against the installed scene
+    """
+    init_worker(scene, collect_stats)
+    if n_jobs <= 1:
+        return None
+    if scene_dist == 'fork':
+        return mp.get_context('fork').Pool(n_jobs)
+    return mp.Pool(n_jobs,
+                   initializer=init_worker,
+                   initargs=(scene, collect_stats))
+
+
+def _task_counts(start_rays):
+    """Counts of the task that started at ``start_rays`` traced rays."""
+    counts = Counter(stats.counters) if stats.ENABLED else Counter()
+    counts['rays', 'traced'] = traced_rays - start_rays
+    stats.reset()
+    return counts
+
+
+def render_tile_task(tile,
+                     first_sample,
+                     samples,
+                     seed,
+                     integrator='path',
+                     max_depth=MAX_DEPTH,
+                     rr_depth=RR_DEPTH):
+    """Render samples ``[first_sample, first_sample + samples)`` of a tile of
+    the worker's scene with one of the :data:`INTEGRATORS`.
+
+    Returns:
+        tuple: the tile, its radiance sum block and the counts of the task,
+            ``('rays', 'traced')`` plus the :mod:`stats` counters if enabled
+    """
+    start_rays = traced_rays
+    if integrator == 'wavefront':
+        render = render_tile_wavefront
+    else:
+        render = render_tile
+    tile, block = render(tile, samples, *_scene, first_sample, seed,
+                         max_depth, rr_depth)
+    return tile, block, _task_counts(start_rays)
+
+
+def render_tile_adaptive_task(tile,
+                              spp,
+                              first,
+                              seed,
+                              integrator='path',
+                              max_depth=MAX_DEPTH,
+                              rr_depth=RR_DEPTH):
+    """Adaptive counterpart of :func:`render_tile_task`."""
+    start_rays = traced_rays
+    if integrator == 'wavefront':
+        render = render_tile_adaptive_wavefront
+    else:
+        render = render_tile_adaptive
+    result = render(tile, spp, first, *_scene, seed, max_depth, rr_depth)
+    return result + (_task_counts(start_rays), )
+
+
+def render_pass(pool,
+                tiles,
+                first_sample,
+                samples,
+                seed,
+                rows,
+                columns,
+                integrator='path',
+                max_depth=MAX_DEPTH,
+                rr_depth=RR_DEPTH):
+    """Render samples ``[first_sample, first_sample + samples)`` of every
+    pixel in ``tiles``.
+
+    Returns:
+        tuple: the radiance sum, the per-pixel sample counts and the summed
+            counts of the tasks
+    """
+    tasks = [(tile, first_sample, samples, seed, integrator, max_depth,
+              rr_depth) for tile in tiles]
+    if pool is not None:
+        results = pool.starmap(render_tile_task, tasks, chunksize=1)
+    else:
+        results = [render_tile_task(*task) for task in tasks]
+
+    img = np.zeros((rows, columns, 3), float)
+    counts = np.zeros((rows, columns), np.int64)
+    task_counts = Counter()
+    for (i0, i1, j0, j1), block, _counts in results:
+        img[i0:i1, j0:j1] += block
+        counts[i0:i1, j0:j1] += samples
+        task_counts += _counts
+    return img, counts, task_counts
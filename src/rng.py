@@ -0,0 +1,125 @@
+"""Counter-based random streams.
+
+The ``n``-th number of a stream is a hash of the stream key and ``n``, so a
+stream needs no state beyond its counter. The renderer opens one stream per
+pixel sample with :func:`set_stream`, which makes every sample independent
+of the worker, the tile it was scheduled in and of the samples drawn before
+it. :class:`Streams` draws from the streams of many paths at once for the
+packet renderer.
+"""
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_INV_2_53 = 1.0 / (1 << 53)
+
+
+def mix64(z):
+    """SplitMix64 finalizer, a bijective 64-bit hash."""
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def stream_key(seed, *indices):
+    """Derive the key of the stream identified by ``seed`` and ``indices``."""
+    key = mix64(seed & _MASK64)
+    for idx in indices:
+        key = mix64((key + _GOLDEN + (idx & _MASK64)) & _MASK64)
+    return key
+
+
+_key = stream_key(0)
+_counter = 0
+
+
+def set_stream(seed, *indices):
+    """Make ``random()`` draw from the stream of ``(seed, *indices)``."""
+    global _key, _counter
+    _key = stream_key(seed, *indices)
+    _counter = 0
+
+
+def get_state():
+    """``(key, counter)`` of the current stream."""
+    return _key, _counter
+
+
+def set_state(key, counter):
+    """Continue the stream ``key`` after its ``counter``-th number."""
+    global _key, _counter
+    _key, _counter = key, counter
+
+
+def random():
+    """Next float in ``[0, 1)`` of the current stream."""
+    global _counter
+    _counter += 1
+    z = (_key + _counter * _GOLDEN) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return ((z ^ (z >> 31)) >> 11) * _INV_2_53
+
+
+def randrange(n):
+    """Random integer in ``[0, n)`` of the current stream."""
+    return min(int(random() * n), n - 1)
+
+
+def shuffle(x):
+    """Shuffle the list ``x`` in place with the current stream."""
+    for i in reversed(range(1, len(x))):
+        j = randrange(i + 1)
+        x[i], x[j] = x[j], x[i]
+
+
+def _mix64_array(z):
+    # uint64 arithmetic wraps around like the masked python ints
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def stream_keys(seed, *indices):
+    """Array version of :func:`stream_key` for arrays of ``indices``."""
+    shape = np.broadcast_shapes(*(np.shape(idx) for idx in indices))
+    key = np.full(shape, stream_key(seed), dtype=np.uint64)
+    for idx in indices:
+        idx = np.asarray(idx).astype(np.int64).astype(np.uint64)
+        key = _mix64_array(key + np.uint64(_GOLDEN) + idx)
+    return key
+
+
+class Streams():
+    """Random streams of many paths, one counter per path.
+
+    The ``n``-th number of a path is the ``n``-th number of the scalar stream
+    with the same key, so a path draws the same numbers wherever it is
+    traced.
+
+    Args:
+        keys (np.ndarray): ``(n,)`` uint64 stream keys, see
+            :func:`stream_keys`
+    """
+
+    def __init__(self, keys):
+        self.keys = np.asarray(keys, dtype=np.uint64)
+        self.counters = np.zeros(len(self.keys), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def random(self, idx=None):
+        """Next float in ``[0, 1)`` of the paths ``idx``, all by default."""
+        if idx is None:
+            idx = slice(None)
+        counters = self.counters[idx] + np.uint64(1)
+        self.counters[idx] = counters
+        z = _mix64_array(self.keys[idx] + counters * np.uint64(_GOLDEN))
+        return (z >> np.uint64(11)) * _INV_2_53
+
+    def take(self, idx):
+        """Streams of the paths ``idx``, continuing their counters."""
+        streams = Streams(self.keys[idx])
+        streams.counters = self.counters[idx]
+        return streams
@@ -1,9 +1,10 @@
 import math
-import random
 import itertools
 import numpy as np
 from collections import deque
 
+import rng
+
 
 def draw_pic(points):
     import matplotlib.pyplot as plt
@@ -39,20 +40,37 @@ class RandomSampler(Sampler):
         self.height = height
 
     def generate_random_point(self):
-        return (random.random() * self.width, random.random() * self.height)
+        return (rng.random() * self.width, rng.random() * self.height)
 
     def sample(self):
         return self.generate_random_point()
 
 
-class UniformSampler(Sampler):
+class PointSetSampler(Sampler):
+    """Sampler drawing from a fixed point set.
+
+    The set is generated once from the sampler's own ``seed``, so it is the
+    same in every worker, and ``sample`` picks a point with the current
+    :mod:`rng` stream instead of consuming the set in order. Samples then do
+    not depend on which samples the process drew before.
+    """
+
+    def __init__(self, seed=0):
+        self.gen = np.random.default_rng(seed)
+        self.sample_points = []
+
+    def sample(self):
+        return self.sample_points[rng.randrange(len(self.sample_points))]
+
 
-    def __init__(self, width, height, dist=6):
+class UniformSampler(PointSetSampler):
+
+    def __init__(self, width, height, dist=6, seed=0):
+        super().__init__(seed)
         self.width = width
         self.height = height
         self.dist = dist
 
-        self.sample_points = None
         self.generate_uniform()
 
     def generate_uniform(self):
@@ -62,22 +80,21 @@ class UniformSampler(Sampler):
         points_x = np.arange(_x, self.width, self.dist)
         points_y = np.arange(_y, self.height, self.dist)
 
-        points = list(itertools.product(points_x, points_y))
-        random.shuffle(points)
-        self.sample_points = deque(points)
+        self.sample_points = list(itertools.product(points_x, points_y))
 
     def generate_random_init_point(self):
-        return (random.random(), random.random())
-
-    def sample(self):
-        if not self.sample_points:
-            self.generate_uniform()
-        return self.sample_points.popleft()
+        return tuple(self.gen.random(2))
 
 
-class PoissonSampler(Sampler):
+class PoissonSampler(PointSetSampler):
 
-    def __init__(self, width, height, min_dist=6, num_points_per_iter=30):
+    def __init__(self,
+                 width,
+                 height,
+                 min_dist=6,
+                 num_points_per_iter=30,
+                 seed=0):
+        super().__init__(seed)
         self.width = width
         self.height = height
         self.min_dist = min_dist
@@ -87,7 +104,6 @@ class PoissonSampler(Sampler):
         self.grid_w = math.ceil(self.width / self.cell_size)
         self.grid_h = math.ceil(self.height / self.cell_size)
 
-        self.sample_points = deque()
         self.generate_poisson()
 
     def get_grid_pos(self, point):
@@ -96,14 +112,15 @@ class PoissonSampler(Sampler):
 
     def generate_random_point_around(self, point):
         x, y = point
-        alpha = np.random.random(self.num_points_per_iter) * math.pi * 2.0
-        r = (np.random.random(self.num_points_per_iter) + 1) * self.min_dist
+        alpha = self.gen.random(self.num_points_per_iter) * math.pi * 2.0
+        r = (self.gen.random(self.num_points_per_iter) + 1) * self.min_dist
         new_x = np.cos(alpha) * r + x
         new_y = np.sin(alpha) * r + y
         return np.dstack((new_x, new_y))[0]
 
     def generate_random_point(self):
-        return (random.random() * self.width, random.random() * self.height)
+        x, y = self.gen.random(2)
+        return (x * self.width, y * self.height)
 
     def check_new_point_valid(self, point):
         x, y = point
@@ -147,8 +164,3 @@ class PoissonSampler(Sampler):
                     self.grid[grid_pos] = len(self.sample_points) - 1
 
         assert self.sample_points
-
-    def sample(self):
-        if not self.sample_points:
-            self.generate_poisson()
-        return self.sample_points.popleft()
@@ -0,0 +1,77 @@
+import pkgutil
+import importlib
+
+from object import (HittableList, FlatBvh, UniformGrid, fuse_transforms,
+                    group_primitives)
+
+# every module of this package is a scene, built only when it is loaded
+SCENES = tuple(sorted(info.name for info in pkgutil.iter_modules(__path__)))
+
+# accelerators of the scene objects, a scene module may set its own default
+# with an ``accel`` attribute
+ACCELERATORS = ('bvh', 'grid', 'list')
+
+
+class Scene():
+
+    def __init__(self, name, rows, columns, camera, world, lights,
+                 accel='list'):
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.camera = camera
+        self.world = world
+        self.lights = lights
+        self.accel = accel
+
+
+def load_scene(name, rows=None, columns=None, accel=None):
+    """Import and build a single registered scene.
+
+    Args:
+        name (str): module name in ``src/scene``, see :data:`SCENES`
+        rows (int, optional): override of the image width
+        columns (int, optional): override of the image height. If only one of
+            ``rows`` and ``columns`` is given the other keeps the aspect of
+            the scene, otherwise the camera is widened to the new aspect.
+        accel (str, optional): one of :data:`ACCELERATORS`, the default of
+            the scene or ``'bvh'`` if not given
+
+    Returns:
+        Scene: the scene, ``lights`` is empty for scenes without light list.
+            Nested transforms of ``world`` are fused and its objects are put
+            in a :class:`FlatBvh` over the camera shutter interval or a
+            :class:`UniformGrid` if they are all bounded, ``accel`` is the
+            accelerator used. Without accelerator primitives of the same
+            type are compiled into groups by :func:`group_primitives`.
+    """
+    if name not in SCENES:
+        raise ValueError(f'no {name} scene! choose from {", ".join(SCENES)}')
+    module = importlib.import_module(f'{__name__}.{name}')
+    accel = accel or getattr(module, 'accel', 'bvh')
+    if accel not in ACCELERATORS:
+        raise ValueError(
+            f'no {accel} accelerator! choose from {", ".join(ACCELERATORS)}')
+    camera = module.camera
+
+    scene_rows, scene_columns = module.rows, module.columns
+    if rows is None and columns is None:
+        rows, columns = scene_rows, scene_columns
+    elif columns is None:
+        columns = max(round(rows * scene_columns / scene_rows), 2)
+    elif rows is None:
+        rows = max(round(columns * scene_rows / scene_columns), 2)
+    else:
+        camera.set_aspect(float(rows) / float(columns))
+
+    world = fuse_transforms(module.world)
+    if len(world) == 0 or any(obj.bounding_box() is None for obj in world):
+        accel = 'list'
+    if accel == 'bvh':
+        world = FlatBvh(world, camera.time0, camera.time1)
+    elif accel == 'grid':
+        world = UniformGrid(world, camera.time0, camera.time1)
+    else:
+        world = HittableList(group_primitives(world))
+    lights = getattr(module, 'lights', HittableList())
+    return Scene(name, rows, columns, camera, world, lights, accel)
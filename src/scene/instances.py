@@ -0,0 +1,51 @@
+from vec import Vec3, Point, Color
+from material import Lambertian, DiffuseLight
+from texture import ConstantTexture
+from object import (HittableList, FlipNormals, XyRect, YzRect, XzRect, Box,
+                    Instance, translation, rotation, scaling)
+from camera import Camera
+
+rows = 200
+columns = 150
+look_from = Point(278, 278, -800)
+look_at = Point(278, 278, 0)
+focus = 10
+aspect = float(rows) / float(columns)
+vfov = 40.
+aperture = 0.
+camera = Camera(look_from, look_at, Vec3(0, 1, 0), vfov, aspect, aperture,
+                focus)
+
+mat_red = Lambertian(ConstantTexture(Color(0.65, 0.05, 0.05)))
+mat_white = Lambertian(ConstantTexture(Color(0.73, 0.73, 0.73)))
+mat_green = Lambertian(ConstantTexture(Color(0.12, 0.45, 0.15)))
+mat_blue = Lambertian(ConstantTexture(Color(0.05, 0.05, 0.73)))
+mat_light = DiffuseLight(ConstantTexture(Color(15)))
+
+lights_list = [FlipNormals(XzRect(213, 343, 227, 332, 554, mat_light))]
+
+obj_list = [
+    # wall
+    FlipNormals(YzRect(0, 555, 0, 555, 555, mat_green)),
+    YzRect(0, 555, 0, 555, 0, mat_red),
+    FlipNormals(XzRect(0, 555, 0, 555, 555, mat_white)),
+    XzRect(0, 555, 0, 555, 0, mat_white),
+    FlipNormals(XyRect(0, 555, 0, 555, 555, mat_blue)),
+]
+
+# a 10 x 10 grid of crates sharing the geometry of one unit box
+crate = Box(Point(-0.5, 0, -0.5), Point(0.5, 1, 0.5), mat_white)
+crate_mats = [mat_white, mat_red, mat_green, mat_blue]
+for i in range(10):
+    for j in range(10):
+        size = 24 + (i * 7 + j * 3) % 12
+        height = size * (1 + (i + 2 * j) % 3)
+        matrix = (translation((40 + 52 * i, 0, 40 + 52 * j))
+                  @ rotation(1, (i * 37 + j * 23) % 90)
+                  @ scaling((size, height, size)))
+        obj_list.append(Instance(crate, matrix, crate_mats[(i + j) % 4]))
+
+obj_list += lights_list
+
+lights = HittableList(lights_list)
+world = HittableList(obj_list)
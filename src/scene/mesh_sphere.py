@@ -0,0 +1,73 @@
+import numpy as np
+
+from vec import Vec3, Point, Color
+from material import Lambertian, Metal, DiffuseLight
+from texture import ConstantTexture
+from object import (HittableList, FlipNormals, XyRect, YzRect, XzRect,
+                    TriangleMesh)
+from camera import Camera
+
+rows = 200
+columns = 200
+look_from = Point(278, 278, -800)
+look_at = Point(278, 278, 0)
+focus = 10
+aspect = float(rows) / float(columns)
+vfov = 40.
+aperture = 0.
+camera = Camera(look_from, look_at, Vec3(0, 1, 0), vfov, aspect, aperture,
+                focus)
+
+mat_red = Lambertian(ConstantTexture(Color(0.65, 0.05, 0.05)))
+mat_white = Lambertian(ConstantTexture(Color(0.73, 0.73, 0.73)))
+mat_green = Lambertian(ConstantTexture(Color(0.12, 0.45, 0.15)))
+mat_metal = Metal(ConstantTexture(Color(0.8, 0.85, 0.88)), 0.)
+mat_light = DiffuseLight(ConstantTexture(Color(15)))
+
+
+def uv_sphere(center, radius, n_lat, n_lon):
+    """Vertices, triangles and normals of a tessellated sphere."""
+    theta = np.linspace(0., np.pi, n_lat + 1)[:, None]
+    phi = np.linspace(0., 2. * np.pi, n_lon, endpoint=False)[None, :]
+    normals = np.stack([
+        np.sin(theta) * np.cos(phi),
+        np.broadcast_to(np.cos(theta), (n_lat + 1, n_lon)),
+        np.sin(theta) * np.sin(phi)
+    ], axis=-1).reshape(-1, 3)
+    vertices = np.asarray(center) + radius * normals
+
+    ring = np.arange(n_lon)
+    indices = []
+    for i in range(n_lat):
+        a = i * n_lon + ring
+        b = i * n_lon + (ring + 1) % n_lon
+        # the quads next to the poles are single triangles, corners run
+        # counterclockwise seen from outside so face normals point outward
+        if i > 0:
+            indices.append(np.stack([a, b, a + n_lon], axis=-1))
+        if i < n_lat - 1:
+            indices.append(np.stack([b, b + n_lon, a + n_lon], axis=-1))
+    return vertices, np.concatenate(indices), normals
+
+
+lights_list = [FlipNormals(XzRect(213, 343, 227, 332, 554, mat_light))]
+
+obj_list = [
+    # wall
+    FlipNormals(YzRect(0, 555, 0, 555, 555, mat_green)),
+    YzRect(0, 555, 0, 555, 0, mat_red),
+    FlipNormals(XzRect(0, 555, 0, 555, 555, mat_white)),
+    XzRect(0, 555, 0, 555, 0, mat_white),
+    FlipNormals(XyRect(0, 555, 0, 555, 555, mat_white)),
+]
+
+# a smooth shaded metal ball and a faceted diffuse one
+vertices, indices, normals = uv_sphere((370, 130, 350), 130, 96, 192)
+obj_list.append(TriangleMesh(vertices, indices, mat_metal, normals=normals))
+vertices, indices, _ = uv_sphere((150, 90, 200), 90, 12, 24)
+obj_list.append(TriangleMesh(vertices, indices, mat_white))
+
+obj_list += lights_list
+
+lights = HittableList(lights_list)
+world = HittableList(obj_list)
@@ -0,0 +1,51 @@
+from vec import Vec3, Point, Color
+from material import Lambertian, DiffuseLight
+from texture import ConstantTexture
+from object import (HittableList, FlipNormals, XyRect, YzRect, XzRect, Sphere,
+                    MovingSphere)
+from camera import Camera
+
+rows = 200
+columns = 200
+look_from = Point(278, 278, -800)
+look_at = Point(278, 278, 0)
+focus = 10
+aspect = float(rows) / float(columns)
+vfov = 40.
+aperture = 0.
+# the shutter is open from time 0 to 1
+camera = Camera(look_from, look_at, Vec3(0, 1, 0), vfov, aspect, aperture,
+                focus, 0., 1.)
+
+mat_red = Lambertian(ConstantTexture(Color(0.65, 0.05, 0.05)))
+mat_white = Lambertian(ConstantTexture(Color(0.73, 0.73, 0.73)))
+mat_green = Lambertian(ConstantTexture(Color(0.12, 0.45, 0.15)))
+mat_blue = Lambertian(ConstantTexture(Color(0.05, 0.05, 0.73)))
+mat_light = DiffuseLight(ConstantTexture(Color(15)))
+
+lights_list = [FlipNormals(XzRect(213, 343, 227, 332, 554, mat_light))]
+
+obj_list = [
+    # wall
+    FlipNormals(YzRect(0, 555, 0, 555, 555, mat_green)),
+    YzRect(0, 555, 0, 555, 0, mat_red),
+    FlipNormals(XzRect(0, 555, 0, 555, 555, mat_white)),
+    XzRect(0, 555, 0, 555, 0, mat_white),
+    FlipNormals(XyRect(0, 555, 0, 555, 555, mat_white)),
+]
+
+# a 6 x 6 grid of balls, every second one jumps up during the exposure
+for i in range(6):
+    for j in range(6):
+        center = Point(70 + 83 * i, 30, 100 + 83 * j)
+        if (i + j) % 2:
+            jump = Vec3(0, 40 + 30 * ((i * 5 + j * 3) % 7), 0)
+            obj_list.append(
+                MovingSphere(center, center + jump, 0., 1., 30, mat_blue))
+        else:
+            obj_list.append(Sphere(center, 30, mat_white))
+
+obj_list += lights_list
+
+lights = HittableList(lights_list)
+world = HittableList(obj_list)
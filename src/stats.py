@@ -0,0 +1,129 @@
+"""Optional render statistics.
+
+Counting is off by default. The integrator then only tests :data:`ENABLED`
+once per ray, and the intersection routines run unmodified. :func:`enable`
+wraps ``hit`` and ``occluded`` of every hittable class, ``Aabb.hit``, the
+node box test of the flattened BVH and ``HitPDF.value``, which
+re-intersects a light to evaluate its pdf, with counting versions.
+Counts are kept per process in :data:`counters` under ``(group, name)``
+keys. The wavefront integrator counts its rays and paths, the batch
+intersections of its packets are not instrumented.
+"""
+from collections import Counter
+
+ENABLED = False
+counters = Counter()
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+def _count_hit(cls, hit):
+    name = cls.__name__
+
+    def counted_hit(self, r, t_min, t_max):
+        counters['hit_tests', name] += 1
+        hit_rec = hit(self, r, t_min, t_max)
+        if hit_rec is not None:
+            counters['hits', name] += 1
+        return hit_rec
+
+    return counted_hit
+
+
+def _count_occluded(cls, occluded):
+    name = cls.__name__
+
+    def counted_occluded(self, r, t_min, t_max):
+        counters['occlusion_tests', name] += 1
+        is_occluded = occluded(self, r, t_min, t_max)
+        if is_occluded:
+            counters['occlusions', name] += 1
+        return is_occluded
+
+    return counted_occluded
+
+
+def _count_pdf_value(value):
+
+    def counted_value(self, direction):
+        counters['rays', 'light_pdf'] += 1
+        return value(self, direction)
+
+    return counted_value
+
+
+def _count_aabb_hit(hit):
+
+    def counted_hit(self, r, t_min, t_max):
+        counters['aabb', 'tests'] += 1
+        is_hit = hit(self, r, t_min, t_max)
+        if is_hit:
+            counters['aabb', 'hits'] += 1
+        return is_hit
+
+    return counted_hit
+
+
+def _count_node_visit(entry):
+
+    def counted_entry(bounds, b, r, t_min, t_max):
+        counters['aabb', 'tests'] += 1
+        t = entry(bounds, b, r, t_min, t_max)
+        if t is not None:
+            counters['aabb', 'hits'] += 1
+            counters['bvh', 'node_visits'] += 1
+        return t
+
+    return counted_entry
+
+
+def enable():
+    """Turn counting on and instrument all hittable classes defined so far.
+
+    Call it after the scene is loaded, in the parent before the workers are
+    forked or in every worker.
+    """
+    global ENABLED
+    if ENABLED:
+        return
+    ENABLED = True
+
+    from pdf import HitPDF
+    from object import bvh
+    from object.hittable import Hittable, Aabb
+    for cls in _subclasses(Hittable):
+        if 'hit' in cls.__dict__:
+            cls.hit = _count_hit(cls, cls.__dict__['hit'])
+        if 'occluded' in cls.__dict__:
+            cls.occluded = _count_occluded(cls, cls.__dict__['occluded'])
+    Aabb.hit = _count_aabb_hit(Aabb.hit)
+    # FlatBvh tests its node boxes with slab_entry and not Aabb.hit, a
+    # node is visited when the ray enters its box
+    bvh.slab_entry = _count_node_visit(bvh.slab_entry)
+    HitPDF.value = _count_pdf_value(HitPDF.value)
+
+
+def reset():
+    counters.clear()
+
+
+def record_path(depth, end, count=1):
+    """Record ``count`` paths that ended after ``depth`` bounces because of
+    ``end``."""
+    counters['path_depth', depth] += count
+    counters['path_end', end] += count
+
+
+def summarize(counts):
+    """Group ``(group, name)`` counts into a JSON serializable dict."""
+    summary = {}
+    for (group, name), val in sorted(counts.items()):
+        summary.setdefault(group, {})[str(name)] = val
+    # traced rays are the camera and scatter rays of the integrator
+    rays = summary.setdefault('rays', {})
+    rays['total'] = rays.get('traced', 0) + rays.get('light_pdf', 0)
+    return summary
@@ -1,7 +1,9 @@
 import math
 from abc import ABC, abstractmethod
 
-from vec import Color
+import numpy as np
+
+from vec import Color, Point
 
 
 class Texture(ABC):
@@ -10,6 +12,14 @@ class Texture(ABC):
     def value(self, u, v, p):
         pass
 
+    def value_batch(self, u, v, p):
+        """``(n, 3)`` colors at the ``(n,)`` texture coordinates ``u, v``
+        and the ``(n, 3)`` points ``p``."""
+        return np.array([
+            tuple(self.value(_u, _v, Point(*_p)))
+            for _u, _v, _p in zip(u.tolist(), v.tolist(), p.tolist())
+        ]).reshape(-1, 3)
+
 
 class ConstantTexture(Texture):
 
@@ -26,6 +36,9 @@ class ConstantTexture(Texture):
     def value(self, u, v, p):
         return self.color
 
+    def value_batch(self, u, v, p):
+        return np.tile(tuple(self.color), (len(u), 1))
+
 
 class CheckerTexture(Texture):
 
@@ -39,3 +52,10 @@ class CheckerTexture(Texture):
             return self.odd.value(u, v, p)
         else:
             return self.even.value(u, v, p)
+
+    def value_batch(self, u, v, p):
+        sines = np.sin(10 * p[:, 0]) * np.sin(10 * p[:, 1]) * np.sin(
+            10 * p[:, 2])
+        return np.where((sines < 0)[:, None],
+                        self.odd.value_batch(u, v, p),
+                        self.even.value_batch(u, v, p))
@@ -1,30 +1,48 @@
 import math
 
+_new = object.__new__
+
+
+def vec3(x, y, z):
+    """Unchecked constructor of a :class:`Vec3` from three floats.
+
+    The arithmetic of the vectors builds its results with it, it skips the
+    argument dispatch and float conversion of ``Vec3(...)``, so callers must
+    pass floats.
+    """
+    v = _new(Vec3)
+    v.x = x
+    v.y = y
+    v.z = z
+    return v
+
 
 class Vec3():
 
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, *args):
-        if len(args) == 0:
-            self.x, self.y, self.z = (0.0, 0.0, 0.0)
+        if len(args) == 3:
+            x, y, z = args
+        elif len(args) == 0:
+            x, y, z = (0.0, 0.0, 0.0)
         elif len(args) == 1:
             arg = args[0]
             if isinstance(arg, (float, int)):
-                self.x, self.y, self.z = (arg, arg, arg)
+                x, y, z = (arg, arg, arg)
             elif isinstance(arg, (tuple, list)):
                 assert len(arg) == 3, "Length of tuple or list must be 3!"
-                self.x, self.y, self.z = arg
+                x, y, z = arg
             elif isinstance(arg, Vec3):
-                self.x, self.y, self.z = arg.x, arg.y, arg.z
+                x, y, z = arg.x, arg.y, arg.z
             else:
                 raise TypeError("Unsupported initialization parameters!")
         elif len(args) == 2:
-            self.x, self.y, self.z = (args[0], args[1], 0.0)
-        elif len(args) == 3:
-            self.x, self.y, self.z = (args[0], args[1], args[2])
+            x, y, z = (args[0], args[1], 0.0)
         else:
             raise TypeError("Vec3 accepts at most 3 params!")
 
-        self.x, self.y, self.z = float(self.x), float(self.y), float(self.z)
+        self.x, self.y, self.z = float(x), float(y), float(z)
 
     def __getitem__(self, key):
         assert isinstance(key, int), "index must be integer"
@@ -54,9 +72,9 @@ class Vec3():
 
     def __add__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.x + other.x, self.y + other.y, self.z + other.z)
+            return vec3(self.x + other.x, self.y + other.y, self.z + other.z)
         elif isinstance(other, (float, int)):
-            return Vec3(self.x + other, self.y + other, self.z + other)
+            return vec3(self.x + other, self.y + other, self.z + other)
         else:
             raise TypeError(
                 f"Unsupported operand type for +: {self.__class__} and {type(other)}"
@@ -66,15 +84,15 @@ class Vec3():
 
     def __sub__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.x - other.x, self.y - other.y, self.z - other.z)
+            return vec3(self.x - other.x, self.y - other.y, self.z - other.z)
         else:
             raise TypeError("Unsupported operand type for -")
 
     def __mul__(self, other):
         if isinstance(other, Vec3):
-            return Vec3(self.x * other.x, self.y * other.y, self.z * other.z)
+            return vec3(self.x * other.x, self.y * other.y, self.z * other.z)
         elif isinstance(other, (float, int)):
-            return Vec3(self.x * other, self.y * other, self.z * other)
+            return vec3(self.x * other, self.y * other, self.z * other)
         else:
             if hasattr(other, "__rmul__"):
                 return other.__rmul__(self)
@@ -85,7 +103,7 @@ class Vec3():
 
     def __truediv__(self, other):
         if isinstance(other, (float, int)):
-            return Vec3(self.x / other, self.y / other, self.z / other)
+            return vec3(self.x / other, self.y / other, self.z / other)
         else:
             raise TypeError("Unsupported operand type for /")
 
@@ -126,7 +144,7 @@ class Vec3():
             raise TypeError("Unsupported operand type for /=")
 
     def __neg__(self):
-        return Vec3(-self.x, -self.y, -self.z)
+        return vec3(-self.x, -self.y, -self.z)
 
     def __eq__(self, other):
         if isinstance(other, Vec3):
@@ -145,37 +163,52 @@ class Vec3():
         return f"{self.__class__.__name__}({self.x}, {self.y}, {self.z})"
 
     def square(self):
-        return Vec3.dot(self, self)
+        return self.x * self.x + self.y * self.y + self.z * self.z
 
     def length(self):
-        return math.sqrt(self.square())
-
-    @classmethod
-    def dot(cls, v1, v2):
-        if isinstance(v1, Vec3) and isinstance(v2, Vec3):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def add_scaled(self, other, s):
+        """``self + s * other`` without the intermediate ``s * other``."""
+        return vec3(self.x + s * other.x, self.y + s * other.y,
+                    self.z + s * other.z)
+
+    def madd(self, other, s):
+        """Add ``s * other`` to this vector in place and return it."""
+        self.x += s * other.x
+        self.y += s * other.y
+        self.z += s * other.z
+        return self
+
+    @staticmethod
+    def dot(v1, v2):
+        try:
             return v1.x * v2.x + v1.y * v2.y + v1.z * v2.z
-        else:
-            raise TypeError("Unsupported operand type for dot()")
-
-    @classmethod
-    def cross(cls, v1, v2):
-        if isinstance(v1, Vec3) and isinstance(v2, Vec3):
-            return Vec3(v1.y * v2.z - v1.z * v2.y, v1.z * v2.x - v1.x * v2.z,
-                        v1.x * v2.y - v1.y * v2.x)
-        else:
-            raise TypeError("unsupported operand type for cross()")
+        except AttributeError:
+            raise TypeError("Unsupported operand type for dot()") from None
+
+    @staticmethod
+    def cross(v1, v2):
+        try:
+            x1, y1, z1 = v1.x, v1.y, v1.z
+            x2, y2, z2 = v2.x, v2.y, v2.z
+        except AttributeError:
+            raise TypeError("unsupported operand type for cross()") from None
+        return vec3(y1 * z2 - z1 * y2, z1 * x2 - x1 * z2, x1 * y2 - y1 * x2)
 
     def normalize(self):
-        length = self.length()
-        return self / length
+        length = math.sqrt(self.x * self.x + self.y * self.y +
+                           self.z * self.z)
+        return vec3(self.x / length, self.y / length, self.z / length)
 
     def near_zero(self):
-        return math.isclose(Vec3.dot(self, self), 0.)
+        return math.isclose(
+            self.x * self.x + self.y * self.y + self.z * self.z, 0.)
 
 
 class Point(Vec3):
-    pass
+    __slots__ = ()
 
 
 class Color(Vec3):
-    pass
+    __slots__ = ()
@@ -0,0 +1,6 @@
+import os.path as osp
+import sys
+
+# the modules of the renderer import each other from src
+sys.path.insert(
+    0, osp.join(osp.dirname(osp.dirname(osp.abspath(__file__))), 'src'))
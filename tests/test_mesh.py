@@ -0,0 +1,53 @@
+import struct
+
+import numpy as np
+
+from material import Lambertian
+from texture import ConstantTexture
+from vec import Color
+from object import load_obj, load_ply
+from scene.mesh_sphere import uv_sphere
+
+MAT = Lambertian(ConstantTexture(Color(0.5)))
+
+
+def test_uv_sphere_faces_point_outward():
+    center = np.array((1., 2., 3.))
+    vertices, indices, _ = uv_sphere(center, 2., 12, 24)
+    corners = vertices[indices]
+    normal = np.cross(corners[:, 1] - corners[:, 0],
+                      corners[:, 2] - corners[:, 0])
+    offset = corners.mean(axis=1) - center
+    assert ((normal * offset).sum(axis=1) > 0.).all()
+
+
+def test_load_obj_splits_polygons_and_keeps_attributes(tmp_path):
+    fname = tmp_path / 'quad.obj'
+    fname.write_text('# a unit quad in the xy plane\n'
+                     'v 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0\n'
+                     'vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\n'
+                     'vn 0 0 1\n'
+                     'f 1/1/1 2/2/1 3/3/1 -1/-1/-1\n')
+    mesh = load_obj(str(fname), MAT)
+    assert len(mesh) == 2
+    assert mesh.indices.tolist() == [[0, 1, 2], [0, 2, 3]]
+    np.testing.assert_array_equal(mesh.vertices[3], (0., 1., 0.))
+    np.testing.assert_array_equal(mesh.texcoords[2], (1., 1.))
+    np.testing.assert_array_equal(mesh.normals, [(0., 0., 1.)] * 4)
+
+
+def test_load_ply_reads_binary_vertices_and_faces(tmp_path):
+    vertices = [(0., 0., 0.), (1., 0., 0.), (1., 1., 0.), (0., 1., 0.)]
+    header = ('ply\nformat binary_little_endian 1.0\n'
+              'element vertex 4\n'
+              'property float x\nproperty float y\nproperty float z\n'
+              'element face 1\n'
+              'property list uchar int vertex_indices\nend_header\n')
+    body = b''.join(struct.pack('<3f', *v) for v in vertices)
+    body += struct.pack('<B4i', 4, 0, 1, 2, 3)
+    fname = tmp_path / 'quad.ply'
+    fname.write_bytes(header.encode('ascii') + body)
+    mesh = load_ply(str(fname), MAT)
+    assert mesh.indices.tolist() == [[0, 1, 2], [0, 2, 3]]
+    np.testing.assert_array_equal(mesh.vertices, vertices)
+    assert mesh.normals is None and mesh.texcoords is None
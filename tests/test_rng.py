@@ -0,0 +1,50 @@
+import numpy as np
+
+import rng
+
+SEED = 2**40 + 7
+
+
+def scalar_stream(seed, *indices, n):
+    rng.set_stream(seed, *indices)
+    return [rng.random() for _ in range(n)]
+
+
+def test_stream_keys_match_stream_key():
+    pixels = np.array([0, 1, 17, 4095])
+    keys = rng.stream_keys(SEED, pixels, 3)
+    assert keys.dtype == np.uint64
+    assert [int(k) for k in keys] == [
+        rng.stream_key(SEED, int(p), 3) for p in pixels
+    ]
+
+
+def test_streams_match_scalar_streams_number_for_number():
+    pixels = np.arange(6)
+    samples = np.array([0, 0, 1, 1, 2, 2])
+    streams = rng.Streams(rng.stream_keys(SEED, pixels, samples))
+    draws = np.stack([streams.random() for _ in range(8)], axis=1)
+    for p, s, row in zip(pixels, samples, draws):
+        assert row.tolist() == scalar_stream(SEED, int(p), int(s), n=8)
+
+
+def test_streams_take_and_partial_draws_continue_the_counters():
+    keys = rng.stream_keys(SEED, np.arange(4), 0)
+    streams = rng.Streams(keys)
+    streams.random()
+    # only the odd paths draw a second number
+    streams.random(np.array([1, 3]))
+    sub = streams.take(np.array([0, 3]))
+    assert sub.counters.tolist() == [1, 2]
+    first, last = sub.random()
+    assert first == scalar_stream(SEED, 0, 0, n=2)[1]
+    assert last == scalar_stream(SEED, 3, 0, n=3)[2]
+
+
+def test_set_state_continues_the_stream():
+    rng.set_stream(SEED, 5, 1)
+    rng.random()
+    key, counter = rng.get_state()
+    expected = [rng.random() for _ in range(3)]
+    rng.set_state(key, counter)
+    assert [rng.random() for _ in range(3)] == expected
@@ -0,0 +1,23 @@
+import json
+import os.path as osp
+import subprocess
+import sys
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+
+
+def test_stats_count_bvh_node_visits(tmp_path):
+    output = str(tmp_path / 'hw1')
+    subprocess.run([
+        sys.executable,
+        osp.join(ROOT, 'src', 'main.py'), '--scene', 'hw1', '--accel', 'bvh',
+        '--width', '16', '--samples', '1', '--jobs', '1', '--stats',
+        '--output', output
+    ],
+                   cwd=ROOT,
+                   check=True,
+                   capture_output=True)
+    with open(output + '.stats.json') as f:
+        summary = json.load(f)
+    assert summary['bvh']['node_visits'] > 0
+    assert summary['aabb']['tests'] >= summary['bvh']['node_visits']